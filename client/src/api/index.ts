@@ -1,6 +1,50 @@
 // api.js
 const API_URL = "http://127.0.0.1:8080";
 
+// Parsed JSON, typed like the result of Response.json()
+type Json = Awaited<ReturnType<Response["json"]>>;
+
+interface CachedResponse {
+  etag: string;
+  data: Json;
+  headers: Headers;
+}
+
+// Bodies of GET responses by URL, kept with their ETag so unchanged data is
+// revalidated with If-None-Match (answered by a 304) instead of downloaded
+// again
+const etagCache = new Map<string, CachedResponse>();
+
+// Fetches JSON, revalidating GET requests against the ETag cache
+async function fetchJson(
+  url: string,
+  options: RequestInit = {},
+): Promise<{ data: Json; headers: Headers }> {
+  const isGet = (options.method ?? "GET") === "GET";
+  const cached = isGet ? etagCache.get(url) : undefined;
+  const headers = new Headers(options.headers);
+  if (cached) {
+    headers.set("If-None-Match", cached.etag);
+  }
+
+  const response = await fetch(url, { ...options, headers });
+  if (response.status === 304 && cached) {
+    return cached;
+  }
+
+  // Handle response errors
+  if (!response.ok) {
+    throw new Error(`Error: ${response.statusText}`);
+  }
+
+  const data = await response.json();
+  const etag = response.headers.get("ETag");
+  if (isGet && etag) {
+    etagCache.set(url, { etag, data, headers: response.headers });
+  }
+  return { data, headers: response.headers };
+}
+
 export async function apiRequest(
   endpoint: string,
   method = "GET",
@@ -23,14 +67,95 @@ export async function apiRequest(
     }),
   };
 
-  // Perform the request
-  const response = await fetch(`${API_URL}${endpoint}`, options);
+  // Perform the request and parse the JSON response
+  const { data } = await fetchJson(`${API_URL}${endpoint}`, options);
+  return data;
+}
 
-  // Handle response errors
-  if (!response.ok) {
+// Fetches every page of a paginated endpoint, following the cursor the
+// server returns in the X-Next-Cursor header
+export async function apiRequestAllPages<T>(
+  endpoint: string,
+  params: Record<string, string> = {},
+): Promise<T[]> {
+  const results: T[] = [];
+  let cursor: string | null = null;
+
+  do {
+    const query = new URLSearchParams(params);
+    if (cursor) {
+      query.set("after", cursor);
+    }
+
+    const { data, headers } = await fetchJson(
+      `${API_URL}${endpoint}?${query}`,
+      { credentials: "include" },
+    );
+
+    results.push(...(data as T[]));
+    cursor = headers.get("X-Next-Cursor");
+  } while (cursor);
+
+  return results;
+}
+
+// Sends a POST request to a server-sent events endpoint and calls onDelta
+// with each text delta as it arrives. Resolves once the stream is done.
+export async function apiStream(
+  endpoint: string,
+  body: Record<string, unknown>,
+  onDelta: (delta: string) => void,
+) {
+  const response = await fetch(`${API_URL}${endpoint}`, {
+    method: "POST",
+    credentials: "include",
+    headers: {
+      "Content-Type": "application/json",
+      Accept: "text/event-stream",
+    },
+    body: JSON.stringify({ ...body, stream: true }),
+  });
+
+  if (!response.ok || !response.body) {
     throw new Error(`Error: ${response.statusText}`);
   }
 
-  // Parse the JSON response
-  return response.json();
+  const reader = response.body.getReader();
+  const decoder = new TextDecoder();
+  let buffer = "";
+
+  for (;;) {
+    const { done, value } = await reader.read();
+    if (done) {
+      return;
+    }
+    buffer += decoder.decode(value, { stream: true });
+
+    // Events are separated by a blank line
+    let boundary = buffer.indexOf("\n\n");
+    while (boundary !== -1) {
+      const block = buffer.slice(0, boundary);
+      buffer = buffer.slice(boundary + 2);
+      boundary = buffer.indexOf("\n\n");
+
+      let event = "message";
+      let data = "";
+      for (const line of block.split("\n")) {
+        if (line.startsWith("event: ")) {
+          event = line.slice(7);
+        } else if (line.startsWith("data: ")) {
+          data += line.slice(6);
+        }
+      }
+
+      const payload = data ? JSON.parse(data) : {};
+      if (event === "done") {
+        return;
+      }
+      if (event === "error") {
+        throw new Error(payload.error);
+      }
+      onDelta(payload.delta);
+    }
+  }
 }
@@ -7,7 +7,7 @@ import {
   DropdownMenuRadioItem,
 } from "@/components/ui/dropdown-menu";
 import { useCheckLoggedIn } from "./HandleUser";
-import { apiRequest } from "@/api";
+import { apiRequestAllPages } from "@/api";
 import { Button } from "../ui/button";
 import "@/styles/Analysis.css";
 
@@ -41,7 +41,9 @@ const Analysis = () => {
   // Function to fetch data from API
   const fetchSpendingData = async () => {
     try {
-      const data = await apiRequest("/query/transactions", "GET");
+      const data = await apiRequestAllPages<Data>("/query/transactions", {
+        fields: "transaction_date,description,category,amount",
+      });
       setAllData(data);
       setFilteredData(data);
     } catch (error) {
@@ -153,7 +155,11 @@ const Analysis = () => {
                 <td>{item.description}</td>
                 <td>{item.category}</td>
                 <td>{"$" + item.amount}</td>
-                <td>{item.transaction_date}</td>
+                <td>
+                  {new Date(item.transaction_date).toLocaleDateString("en-US", {
+                    timeZone: "UTC",
+                  })}
+                </td>
               </tr>
             ))}
           </tbody>
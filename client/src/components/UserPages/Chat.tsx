@@ -14,7 +14,7 @@ import {
   FormMessage,
 } from "@/components/ui/form";
 import { useCheckLoggedIn } from "./HandleUser";
-import { apiRequest } from "@/api";
+import { apiStream } from "@/api";
 import "@/styles/Chat.css"
 
 // Define the schema for validation using Zod
@@ -60,27 +60,33 @@ function Chat() {
 
     try {
       // Send the user message to the backend
-      console.log("message is sent!!!");
       form.reset();
-      const response = await apiRequest("/chat/prompt", "POST", query);
 
-      const data = await response;
-
-      // Create bot response from backend data
-      const botResponse: Message = {
-        text: data.response || "Sorry, I couldn't process that message.",
-        sender: "bot",
-      };
-
-      // Add the bot's response to the chat
-      setMessages((prevMessages) => [...prevMessages, botResponse]);
+      // Add an empty bot message and fill it in as tokens stream in
+      setMessages((prevMessages) => [
+        ...prevMessages,
+        { text: "", sender: "bot" },
+      ]);
+      await apiStream("/chat/prompt", query, (delta) => {
+        setMessages((prevMessages) => {
+          const last = prevMessages[prevMessages.length - 1];
+          return [
+            ...prevMessages.slice(0, -1),
+            { ...last, text: last.text + delta },
+          ];
+        });
+      });
     } catch (error) {
       console.error("Error:", error);
       const errorMessage: Message = {
         text: "There was an error. Please try again.",
         sender: "bot",
       };
-      setMessages((prevMessages) => [...prevMessages, errorMessage]);
+      // Replace the partial bot response with the error
+      setMessages((prevMessages) => [
+        ...prevMessages.slice(0, -1),
+        errorMessage,
+      ]);
     }
   };
 
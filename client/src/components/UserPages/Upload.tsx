@@ -5,6 +5,24 @@ import { Button } from "../ui/button";
 import { useCheckLoggedIn } from "./HandleUser";
 import { apiRequest } from "@/api";
 
+interface UploadJob {
+  status: "queued" | "running" | "done" | "failed";
+  inserted: number;
+  rows_rejected: number;
+  error?: string;
+}
+
+// Poll an ingestion job until the server reports it finished
+async function waitForJob(statusUrl: string): Promise<UploadJob> {
+  for (;;) {
+    const job: UploadJob = await apiRequest(statusUrl, "GET");
+    if (job.status === "done" || job.status === "failed") {
+      return job;
+    }
+    await new Promise((resolve) => setTimeout(resolve, 1000));
+  }
+}
+
 function CsvUploadPage() {
   useCheckLoggedIn();
   const [acceptedFiles, setAcceptedFiles] = useState<File[]>([]);
@@ -27,7 +45,12 @@ function CsvUploadPage() {
       const response = await apiRequest("/upload/csv", "POST", formData);
       const data = await response;
       console.log("Response:", data.message);
-      alert(data.message);
+      const job = await waitForJob(data.status_url);
+      alert(
+        job.status === "done"
+          ? `File processed successfully! ${job.inserted} transactions imported, ${job.rows_rejected} rows skipped.`
+          : `File processing failed: ${job.error}`,
+      );
       // TODO: Add alerts to notify user about status of upload
     } catch (error) {
       console.error("Error:", error);
@@ -29,31 +29,42 @@ const chartConfig = {
   },
 } satisfies ChartConfig;
 
-interface CategoryData {
-  [category: string]: number;
+interface SeriesValues {
+  total: number[];
+  running_total: number[];
+  moving_average: number[];
 }
 
-type ResponseElement = [string, CategoryData];
-
-type APIResponse = ResponseElement[];
+interface APIResponse {
+  periods: string[];
+  series: Record<string, SeriesValues>;
+}
 
 interface ChartData {
   month: string;
-  [category: string]: number;
+  [category: string]: number | string;
 }
 
+// Most months shown, older ones are downsampled by the server
+const MAX_POINTS = 120;
+
 //format data so chart can understand
 const parseData = (response: APIResponse): ChartData[] => {
-  const chartData = response.map(([month, categories]) => {
-    // Construct a ChartData object
-    const chartItem: ChartData = { month };
+  return response.periods.map((period, index) => {
+    // Periods are ISO dates of the first day of each month
+    const chartItem: ChartData = {
+      month: new Date(period).toLocaleDateString("en-US", {
+        month: "long",
+        year: "numeric",
+        timeZone: "UTC",
+      }),
+    };
 
-    Object.entries(categories).forEach(([category, value]) => {
-      chartItem[category] = value;
+    Object.entries(response.series).forEach(([category, values]) => {
+      chartItem[category] = values.total[index];
     });
     return chartItem;
   });
-  return chartData;
 };
 
 export function SpendingChart() {
@@ -63,7 +74,10 @@ export function SpendingChart() {
   useEffect(() => {
     const fetchChartData = async () => {
       try {
-        const response = await apiRequest("/query/transactions/totals", "GET");
+        const response = await apiRequest(
+          `/query/transactions/series?granularity=month&split=category&points=${MAX_POINTS}`,
+          "GET",
+        );
         const data = parseData(response);
         console.log(data);
         setChartData(data);
@@ -1,25 +1,98 @@
 import os
 
 from dotenv import load_dotenv
-from flask import Flask, jsonify
+from flask import Flask, current_app, jsonify
 from flask_cors import CORS
+from werkzeug.middleware.proxy_fix import ProxyFix
 
+from database.db import init_db
+from database.indexes import ensure_indexes
+from database.migrations import check_transaction_dates
 from routes.query_routes import query_routes
 from routes.upload_routes import upload_routes
 from routes.user_routes import user_routes
 from routes.chat_routes import chat_routes
+from utils.cache import init_query_cache
+from utils.compression import init_compression
+from utils.insights import init_insights_cache
+from utils.jobs import init_ingestion_queue
+from utils.llm import init_llm
+from utils.metrics import init_metrics, metrics_response
+from utils.passwords import init_passwords
+from utils.serialization import init_json
+from utils.sessions import init_sessions
+from utils.prompt_cache import init_prompt_cache
 
 # Application
 app = Flask(__name__)
-CORS(app, supports_credentials=True)# enables CORS for all routes
+CORS(app, supports_credentials=True, expose_headers=["X-Next-Cursor", "ETag"],
+     max_age=600)  # enables CORS for all routes; preflights are cached
 load_dotenv()
 app.secret_key = os.getenv("FLASK_SECRET_KEY")
 
 app.config["SESSION_COOKIE_NAME"] = "budgetai_session"
-app.config["SESSION_TYPE"] = "filesystem"
-app.config["UPLOAD_FOLDER"] = "files"
+app.config["UPLOAD_BATCH_SIZE"] = int(os.getenv("UPLOAD_BATCH_SIZE", 10000))
+app.config["EXPORT_BATCH_SIZE"] = int(os.getenv("EXPORT_BATCH_SIZE", 2000))
 app.config["SESSION_COOKIE_SAMESITE"] = "None"
 app.config["SESSION_COOKIE_SECURE"] = True
+# Number of trusted reverse proxies in front of the app. Behind them,
+# request.remote_addr is the client address from X-Forwarded-For, which the
+# login throttle is keyed on, rather than the proxy's own address.
+app.config["PROXY_FIX_X_FOR"] = int(os.getenv("PROXY_FIX_X_FOR", 0))
+if app.config["PROXY_FIX_X_FOR"]:
+    app.wsgi_app = ProxyFix(app.wsgi_app, x_for=app.config["PROXY_FIX_X_FOR"])
+
+# JSON provider for requests and responses
+init_json(app)
+
+# Database
+db_manager = init_db(app)
+
+
+def provision_indexes(db):
+    """
+    Creates the application indexes, keeping this process's failures for
+    /status/db.
+    """
+    app.extensions["index_failures"] = ensure_indexes(db)[1]
+
+
+if app.config["MONGO_ENSURE_INDEXES"]:
+    db_manager.on_connect(provision_indexes)  # Idempotent index provisioning
+
+
+def check_legacy_dates(db):
+    """
+    Counts transactions left out of transaction lists because their date
+    was not migrated, for /status/db.
+    """
+    app.extensions["legacy_transaction_dates"] = check_transaction_dates(db)
+
+
+db_manager.on_connect(check_legacy_dates)
+
+# Request, Mongo, ingestion and LLM metrics
+init_metrics(app)
+
+# Server-side sessions
+init_sessions(app)
+
+# Password hashing pool and login throttling
+init_passwords(app)
+
+# Background ingestion
+init_ingestion_queue(app)
+
+# Chat model client and answer cache
+init_llm(app)
+init_prompt_cache(app)
+
+# Query result cache
+init_query_cache(app)
+init_insights_cache(app)
+
+# Compression of query responses
+init_compression(app)
 
 # Register Routes
 app.register_blueprint(query_routes, url_prefix="/query")
@@ -42,5 +115,86 @@ def status():
     """
     return jsonify({"message": "Application is running"}), 200
 
+
+@app.route("/metrics", methods=["GET"])
+def metrics():
+    """
+    Metrics route.
+    Returns the metrics of the current worker process in the Prometheus
+    text format.
+    """
+    return metrics_response(current_app.extensions["metrics"])
+
+
+@app.route("/status/db", methods=["GET"])
+def db_status():
+    """
+    Database pool status route.
+    Returns connection pool counters for the current worker process, the
+    collections whose indexes could not be created and the number of
+    transactions whose date was not migrated.
+    """
+    stats = current_app.extensions["mongo"].pool_stats()
+    stats["index_failures"] = current_app.extensions.get("index_failures", {})
+    stats["legacy_transaction_dates"] = current_app.extensions.get(
+        "legacy_transaction_dates")
+    return jsonify(stats), 200
+
+
+@app.route("/status/cache", methods=["GET"])
+def cache_status():
+    """
+    Query cache status route.
+    Returns hit, miss and eviction counters for the current worker process.
+    """
+    cache = current_app.extensions.get("query_cache")
+    if cache is None:
+        return jsonify({"backend": "none"}), 200
+    return jsonify(cache.stats()), 200
+
+
+@app.route("/status/chat", methods=["GET"])
+def chat_status():
+    """
+    Chat model status route.
+    Returns in-flight, rejected, timed out and cancelled completion counters
+    for the current worker process.
+    """
+    return jsonify(current_app.extensions["llm"].stats()), 200
+
+
+@app.route("/status/auth", methods=["GET"])
+def auth_status():
+    """
+    Password hashing status route.
+    Returns hashing pool and throttling counters for the current worker
+    process.
+    """
+    stats = current_app.extensions["password_hasher"].stats()
+    stats["throttled"] = current_app.extensions["auth_throttle"].throttled
+    return jsonify(stats), 200
+
+
+@app.route("/status/sessions", methods=["GET"])
+def sessions_status():
+    """
+    Session store status route.
+    Returns session cache hit and revocation counters for the current worker
+    process.
+    """
+    interface = current_app.session_interface
+    if not hasattr(interface, "stats"):
+        return jsonify({"backend": "cookie"}), 200
+    return jsonify(interface.stats()), 200
+
+
+@app.route("/status/cache/prompt", methods=["GET"])
+def prompt_cache_status():
+    """
+    Prompt cache status route.
+    Returns exact and semantic hit counters for the current worker process.
+    """
+    return jsonify(current_app.extensions["prompt_cache"].stats()), 200
+
 if __name__ == "__main__":
     app.run(debug=True, port=8080)
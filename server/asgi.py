@@ -0,0 +1,277 @@
+"""
+ASGI entry point.
+
+Chat requests (/chat/...) are dispatched to the Flask app on a worker
+thread only for as long as the view takes to check the session and the
+caches. The model call the view defers (see utils.llm.defer_chat) is then
+awaited on the server's event loop, so a chat in flight holds no thread.
+Every other route runs on the Flask app through a2wsgi's thread pool of
+WSGI_THREADS threads.
+
+Usage (from the server directory):
+    uvicorn asgi:application --port 8080 --workers 4
+
+The app can also stay on a WSGI server with sync workers, with the reverse
+proxy sending /chat/ to this app.
+"""
+import asyncio
+import io
+import logging
+import os
+import sys
+
+try:
+    from a2wsgi import WSGIMiddleware
+except ImportError:  # Optional dependency, only needed for the other routes
+    WSGIMiddleware = None
+
+from app import app
+from routes.chat_routes import chat_error_status, sse_event
+from utils.llm import ASYNC_CHAT_ENVIRON_KEY
+
+CHAT_PREFIX = "/chat/"
+
+
+def wsgi_environ(scope, body):
+    """
+    Builds the WSGI environ of an ASGI HTTP request whose body was read.
+    """
+    server = scope.get("server") or ("localhost", 80)
+    client = scope.get("client") or ("", 0)
+    environ = {
+        "REQUEST_METHOD": scope["method"],
+        "SCRIPT_NAME": scope.get("root_path", "").encode("utf-8").decode("latin-1"),
+        "PATH_INFO": scope["path"].encode("utf-8").decode("latin-1"),
+        "QUERY_STRING": scope["query_string"].decode("latin-1"),
+        "SERVER_NAME": server[0],
+        "SERVER_PORT": str(server[1]),
+        "SERVER_PROTOCOL": f"HTTP/{scope['http_version']}",
+        "REMOTE_ADDR": client[0],
+        "CONTENT_LENGTH": str(len(body)),
+        "wsgi.version": (1, 0),
+        "wsgi.url_scheme": scope.get("scheme", "http"),
+        "wsgi.input": io.BytesIO(body),
+        "wsgi.errors": sys.stderr,
+        "wsgi.multithread": True,
+        "wsgi.multiprocess": True,
+        "wsgi.run_once": False,
+        ASYNC_CHAT_ENVIRON_KEY: True,
+    }
+    for name, value in scope["headers"]:
+        name = name.decode("latin-1").upper().replace("-", "_")
+        value = value.decode("latin-1")
+        if name == "CONTENT_LENGTH":
+            continue  # The body was read in full
+        if name == "CONTENT_TYPE":
+            environ[name] = value
+            continue
+        key = f"HTTP_{name}"
+        environ[key] = f"{environ[key]},{value}" if key in environ else value
+    return environ
+
+
+def body_headers(headers, content_type, length=None):
+    """
+    Replaces the content type and length of ASGI response headers.
+    """
+    headers = [
+        (name, value) for name, value in headers
+        if name not in (b"content-type", b"content-length")
+    ]
+    headers.append((b"content-type", content_type.encode("latin-1")))
+    if length is not None:
+        headers.append((b"content-length", str(length).encode("latin-1")))
+    return headers
+
+
+async def read_body(receive):
+    body = bytearray()
+    while True:
+        message = await receive()
+        if message["type"] == "http.disconnect":
+            break
+        body += message.get("body", b"")
+        if not message.get("more_body"):
+            break
+    return bytes(body)
+
+
+async def wait_for_disconnect(receive):
+    while (await receive())["type"] != "http.disconnect":
+        pass
+
+
+async def send_response(send, status, headers, body):
+    await send({"type": "http.response.start", "status": status,
+                "headers": headers})
+    await send({"type": "http.response.body", "body": body})
+
+
+async def send_json(send, status, headers, payload):
+    body = app.json.dumps(payload).encode("utf-8")
+    await send_response(
+        send, status, body_headers(headers, "application/json", len(body)),
+        body)
+
+
+class ChatASGIApp:
+    """
+    ASGI app serving the chat routes' model calls on its event loop and
+    every other route through the Flask app's WSGI interface.
+
+    Attributes:
+        app: The Flask app.
+        wsgi: a2wsgi wrapper of the Flask app, or None when a2wsgi is not
+            installed and only chat routes are served.
+    """
+
+    def __init__(self, app, wsgi_threads=10):
+        self.app = app
+        self.wsgi = (
+            WSGIMiddleware(app, workers=wsgi_threads)
+            if WSGIMiddleware is not None else None
+        )
+        self._shared = {}  # key -> task of a completion shared by requests
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] == "lifespan":
+            await self.lifespan(receive, send)
+        elif scope["type"] == "http" and scope["path"].startswith(CHAT_PREFIX):
+            await self.chat(scope, receive, send)
+        elif self.wsgi is not None:
+            await self.wsgi(scope, receive, send)
+        else:
+            raise RuntimeError(
+                "Serving routes other than /chat/ requires the 'a2wsgi' package")
+
+    @staticmethod
+    async def lifespan(receive, send):
+        while True:
+            message = await receive()
+            if message["type"] == "lifespan.startup":
+                await send({"type": "lifespan.startup.complete"})
+            elif message["type"] == "lifespan.shutdown":
+                await send({"type": "lifespan.shutdown.complete"})
+                return
+
+    def dispatch(self, environ):
+        """
+        Runs the Flask view of a request, as Flask.wsgi_app does.
+
+        Returns:
+            tuple: (response, ASGI headers, body). The body is None when the
+            view deferred a chat.
+        """
+        ctx = self.app.request_context(environ)
+        error = None
+        try:
+            try:
+                ctx.push()
+                response = self.app.full_dispatch_request()
+            except Exception as e:
+                error = e
+                response = self.app.handle_exception(e)
+            body = (
+                None if getattr(response, "deferred_chat", None) is not None
+                else response.get_data()
+            )
+            headers = [
+                (name.lower().encode("latin-1"), value.encode("latin-1"))
+                for name, value in response.get_wsgi_headers(environ).items()
+            ]
+            return response, headers, body
+        finally:
+            ctx.pop(error)
+
+    async def chat(self, scope, receive, send):
+        environ = wsgi_environ(scope, await read_body(receive))
+        response, headers, body = await asyncio.to_thread(self.dispatch, environ)
+        deferred = getattr(response, "deferred_chat", None)
+        if deferred is None:
+            await send_response(send, response.status_code, headers, body)
+        elif deferred.stream:
+            await self.stream(deferred, headers, receive, send)
+        else:
+            try:
+                answer = await self.shared_completion(deferred)
+            except Exception as e:
+                message, status_code = chat_error_status(e)
+                await send_json(send, status_code, headers, {"error": message})
+                return
+            await send_json(send, 200, headers, {deferred.field: answer})
+
+    async def answered(self, deferred, answer):
+        if deferred.on_answer is None:
+            return
+        try:
+            await asyncio.to_thread(deferred.on_answer, answer)
+        except Exception as e:
+            logging.error(f"Error storing chat answer: {str(e)}")
+
+    async def complete(self, deferred):
+        answer = await self.app.extensions["llm"].acomplete(deferred.messages)
+        await self.answered(deferred, answer)
+        return answer
+
+    async def shared_completion(self, deferred):
+        """
+        Awaits a deferred completion, joining one already in flight for the
+        same key.
+        """
+        if deferred.key is None:
+            return await self.complete(deferred)
+        task = self._shared.get(deferred.key)
+        if task is None:
+            task = asyncio.ensure_future(self.complete(deferred))
+            self._shared[deferred.key] = task
+            task.add_done_callback(
+                lambda done: self._shared.pop(deferred.key, None))
+        # A client that goes away does not cancel the others' completion
+        return await asyncio.shield(task)
+
+    async def stream(self, deferred, headers, receive, send):
+        """
+        Relays a deferred chat as server-sent events, cancelling the
+        completion when the client disconnects.
+        """
+        try:
+            deltas = await self.app.extensions["llm"].astream(deferred.messages)
+        except Exception as e:
+            message, status_code = chat_error_status(e)
+            await send_json(send, status_code, headers, {"error": message})
+            return
+
+        await send({"type": "http.response.start", "status": 200,
+                    "headers": body_headers(headers, "text/event-stream")})
+        relay = asyncio.ensure_future(self.relay(deferred, deltas, send))
+        disconnect = asyncio.ensure_future(wait_for_disconnect(receive))
+        try:
+            await asyncio.wait(
+                {relay, disconnect}, return_when=asyncio.FIRST_COMPLETED)
+        finally:
+            disconnect.cancel()
+            if not relay.done():
+                relay.cancel()
+            await asyncio.gather(relay, disconnect, return_exceptions=True)
+
+    async def relay(self, deferred, deltas, send):
+        async def event(message, more_body=True):
+            await send({"type": "http.response.body",
+                        "body": message.encode("utf-8"), "more_body": more_body})
+
+        parts = []
+        try:
+            async for delta in deltas:
+                parts.append(delta)
+                await event(sse_event({"delta": delta}))
+        except Exception as e:
+            await event(sse_event({"error": str(e)}, event="error"), False)
+            return
+        finally:
+            await deltas.aclose()
+        await self.answered(deferred, "".join(parts))
+        await event(sse_event({}, event="done"), False)
+
+
+app.config.setdefault("WSGI_THREADS", int(os.getenv("WSGI_THREADS", 10)))
+application = ChatASGIApp(app, wsgi_threads=app.config["WSGI_THREADS"])
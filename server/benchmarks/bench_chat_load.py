@@ -0,0 +1,246 @@
+"""
+Load test for the chat path under gunicorn sync workers.
+
+The app is served by gunicorn with --workers sync workers, its chat client
+pointed at a fake OpenAI-compatible server that streams slowly. The latency
+of a query endpoint on gunicorn is measured on its own (--samples requests)
+and with a request sent every --interval seconds while --chats streamed
+chats are in flight, in two deployments:
+
+    wsgi  Chats are sent to the gunicorn workers too; each one holds a
+          worker for as long as it streams.
+    asgi  Chats are sent to the ASGI app (asgi.py, served by uvicorn), as
+          the reverse proxy does for /chat/; their model calls are awaited
+          on its event loop.
+
+The default endpoint, /status/db, needs no database. For a Mongo-backed
+endpoint such as /query/transactions/totals a local MongoDB is required;
+a benchmark user is signed up in the test database first.
+
+Needs gunicorn, uvicorn and a2wsgi (pip install gunicorn uvicorn a2wsgi).
+
+Usage (from the server directory):
+    python -m benchmarks.bench_chat_load [--chats 50] [--workers 4]
+        [--endpoint /status/db] [--samples 20] [--interval 0.1]
+"""
+import argparse
+import json
+import os
+import socket
+import statistics
+import subprocess
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import requests
+
+SERVER_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+TOKENS = 20
+TOKEN_DELAY = 0.1  # Each chat streams for about two seconds
+REQUEST_TIMEOUT = 120
+
+
+class SlowOpenAIHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def do_POST(self):
+        body = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Connection", "close")
+        self.end_headers()
+        for index in range(TOKENS):
+            time.sleep(TOKEN_DELAY)
+            chunk = {
+                "id": "chatcmpl-bench", "object": "chat.completion.chunk",
+                "created": 0, "model": body["model"],
+                "choices": [{"index": 0, "delta": {"content": f"t{index} "},
+                             "finish_reason": None}],
+            }
+            self.wfile.write(f"data: {json.dumps(chunk)}\n\n".encode("utf-8"))
+            self.wfile.flush()
+        self.wfile.write(b"data: [DONE]\n\n")
+        self.wfile.flush()
+
+    def log_message(self, format, *args):
+        pass
+
+
+class FakeOpenAIServer(ThreadingHTTPServer):
+    request_queue_size = 128  # Accept every chat's connection at once
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def start_server(command, port, env):
+    """
+    Starts a server process and waits until it answers /status.
+    """
+    process = subprocess.Popen(
+        command, cwd=SERVER_DIR, env=env,
+        stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    deadline = time.monotonic() + 30
+    while time.monotonic() < deadline:
+        try:
+            requests.get(f"http://127.0.0.1:{port}/status", timeout=1)
+            return process
+        except requests.RequestException:  # Workers still booting
+            time.sleep(0.1)
+    process.terminate()
+    raise RuntimeError(f"{command[2]} did not start on port {port}")
+
+
+def measure(url, session, samples):
+    timings = []
+    for _ in range(samples):
+        started = time.perf_counter()
+        session.get(url, timeout=REQUEST_TIMEOUT).raise_for_status()
+        timings.append((time.perf_counter() - started) * 1000)
+        time.sleep(0.02)
+    return summarize(timings)
+
+
+def probe(url, session, interval, busy):
+    """
+    Sends a request every interval seconds, each on its own connection,
+    while any of the busy threads is alive. A request queued behind
+    chats for a worker is timed from when it was sent.
+    """
+    timings = []
+
+    def get():
+        started = time.perf_counter()
+        requests.get(url, cookies=session.cookies,
+                     timeout=REQUEST_TIMEOUT).raise_for_status()
+        timings.append((time.perf_counter() - started) * 1000)
+
+    probes = []
+    while any(thread.is_alive() for thread in busy):
+        probes.append(threading.Thread(target=get))
+        probes[-1].start()
+        time.sleep(interval)
+    for thread in probes:
+        thread.join()
+    return summarize(timings)
+
+
+def summarize(timings):
+    timings.sort()
+    return (statistics.median(timings),
+            timings[max(int(len(timings) * 0.95) - 1, 0)], len(timings))
+
+
+def chat(base_url, index, results):
+    started = time.perf_counter()
+    first_token = None
+    response = requests.post(
+        f"{base_url}/chat/prompt",
+        json={"query": f"Load test question {index}", "stream": True},
+        stream=True, timeout=REQUEST_TIMEOUT,
+    )
+    # Chunks are read as they arrive, without line buffering
+    for chunk in response.iter_content(chunk_size=None):
+        if first_token is None and b"data: " in chunk:
+            first_token = time.perf_counter() - started
+    results.append((response.status_code, first_token,
+                    time.perf_counter() - started))
+
+
+def run_phase(query_url, chat_url, endpoint, chats, samples, interval):
+    session = requests.Session()
+    if endpoint.startswith("/query"):
+        session.post(f"{query_url}/user/signup", json={
+            "name": "Load Test", "email": "loadtest@example.com",
+            "password": "password123",
+        })
+        session.post(f"{query_url}/user/login", json={
+            "email": "loadtest@example.com", "password": "password123",
+        })
+
+    idle = measure(query_url + endpoint, session, samples)
+    results = []
+    threads = [
+        threading.Thread(target=chat, args=(chat_url, index, results))
+        for index in range(chats)
+    ]
+    for thread in threads:
+        thread.start()
+    loaded = probe(query_url + endpoint, session, interval, threads)
+    for thread in threads:
+        thread.join()
+    return idle, loaded, results
+
+
+def run(chats, workers, endpoint, samples, interval):
+    fake = FakeOpenAIServer(("127.0.0.1", 0), SlowOpenAIHandler)
+    threading.Thread(target=fake.serve_forever, daemon=True).start()
+    env = {
+        **os.environ,
+        "FLASK_ENV": "test",
+        "FLASK_SECRET_KEY": os.getenv("FLASK_SECRET_KEY", "bench"),
+        "AZURE_ENDPOINT": f"http://127.0.0.1:{fake.server_port}",
+        "AZURE_API_KEY": "bench",
+        "DEPLOYMENT_NAME": "bench-deployment",
+        "CHAT_MAX_CONCURRENCY": str(chats),
+    }
+
+    gunicorn_port, uvicorn_port = free_port(), free_port()
+    gunicorn = start_server(
+        [sys.executable, "-m", "gunicorn", "app:app",
+         "--worker-class", "sync", "--workers", str(workers),
+         "--bind", f"127.0.0.1:{gunicorn_port}", "--backlog", "2048"],
+        gunicorn_port, env)
+    uvicorn = start_server(
+        [sys.executable, "-m", "uvicorn", "asgi:application",
+         "--host", "127.0.0.1", "--port", str(uvicorn_port),
+         "--log-level", "warning"],
+        uvicorn_port, env)
+    query_url = f"http://127.0.0.1:{gunicorn_port}"
+    deployments = (
+        ("wsgi", query_url),
+        ("asgi", f"http://127.0.0.1:{uvicorn_port}"),
+    )
+
+    try:
+        rows = []
+        for name, chat_url in deployments:
+            for _ in range(workers):
+                chat(chat_url, "warmup", [])  # Creates the model clients
+            rows.append((name, *run_phase(
+                query_url, chat_url, endpoint, chats, samples, interval)))
+    finally:
+        gunicorn.terminate()
+        uvicorn.terminate()
+        gunicorn.wait()
+        uvicorn.wait()
+        fake.shutdown()
+
+    print(f"{endpoint} on gunicorn, {workers} sync workers, {chats} streamed "
+          f"chats, a request every {interval * 1000:.0f} ms while they run")
+    print(f"{'chats on':>8} {'idle median ms':>15} {'loaded median ms':>17} "
+          f"{'loaded p95 ms':>14} {'requests':>9} {'chats ok':>9} "
+          f"{'first token ms':>15}")
+    for name, idle, loaded, results in rows:
+        ok = [result for result in results if result[0] == 200]
+        first_token = (
+            f"{statistics.median(r[1] for r in ok) * 1000:.0f}" if ok else "-")
+        print(f"{name:>8} {idle[0]:>15.2f} {loaded[0]:>17.2f} "
+              f"{loaded[1]:>14.2f} {loaded[2]:>9} {f'{len(ok)}/{chats}':>9} "
+              f"{first_token:>15}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--chats", type=int, default=50)
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--endpoint", default="/status/db")
+    parser.add_argument("--samples", type=int, default=20)
+    parser.add_argument("--interval", type=float, default=0.1)
+    args = parser.parse_args()
+    run(args.chats, args.workers, args.endpoint, args.samples, args.interval)
@@ -0,0 +1,145 @@
+"""
+Benchmark for /chat/insights.
+
+Compares the previous path (a PandasAI agent over a DataFrame of the raw
+transaction documents) against the summary path (a compact frame reduced
+to a statistical summary and sent in a single prompt). Both paths use a
+stubbed LLM, so the timings cover only local work, and report the size of
+every prompt sent to the LLM. No database is needed: the documents are
+generated in memory the way they are read from Mongo.
+
+Tokens are counted with tiktoken when it is installed, and estimated as
+four characters per token otherwise.
+
+Usage (from the server directory):
+    python -m benchmarks.bench_insights [--sizes 1000,10000,100000]
+"""
+import argparse
+import random
+import time
+import uuid
+from datetime import datetime, timedelta
+
+import pandas as pd
+from pandasai import Agent
+from pandasai.llm.fake import FakeLLM
+
+from utils.insights import insights_messages
+from utils.summary import summarize_transactions, summary_context
+
+PROMPT = "Give me general trends about my spending data including details about the category!"
+MERCHANTS = [
+    ("STARBUCKS", "Food & Drink"),
+    ("SHELL OIL", "Gas"),
+    ("CON EDISON", "Bills & Utilities"),
+    ("AMAZON", "Shopping"),
+    ("NETFLIX", "Entertainment"),
+    ("MTA*NYCT PAYGO", "Travel"),
+]
+
+try:
+    import tiktoken
+
+    _encoding = tiktoken.get_encoding("cl100k_base")
+
+    def count_tokens(text):
+        return len(_encoding.encode(text))
+except ImportError:
+    def count_tokens(text):
+        return len(text) // 4
+
+
+def generate_documents(size):
+    start = datetime(2020, 1, 1)
+    documents = []
+    for _ in range(size):
+        date = start + timedelta(days=random.randrange(365 * 4))
+        description, category = random.choice(MERCHANTS)
+        documents.append({
+            "_id": uuid.uuid4().hex,
+            "user_id": "benchmark_user",
+            "transaction_date": date,
+            "year": date.year,
+            "month": date.month,
+            "description": description,
+            "category": category,
+            "amount": round(random.uniform(1, 200), 2),
+        })
+    return documents
+
+
+class RecordingLLM(FakeLLM):
+    """
+    FakeLLM that keeps every prompt PandasAI sends.
+    """
+
+    def __init__(self):
+        super().__init__(
+            output="result = {'type': 'string', "
+                   "'value': str(dfs[0].groupby('category')['amount'].sum())}")
+        self.prompts = []
+
+    def call(self, instruction, context=None):
+        self.prompts.append(instruction.to_string())
+        return super().call(instruction, context)
+
+
+def run_agent(documents):
+    """
+    The previous path: every field of every document, one agent per request.
+    """
+    llm = RecordingLLM()
+    df = pd.DataFrame(documents)
+    df["amount"] = pd.to_numeric(df["amount"], errors="coerce")
+    df["transaction_date"] = pd.to_datetime(
+        df["transaction_date"], errors="coerce")
+    agent = Agent([df], config={
+        "llm": llm, "enable_cache": False, "save_logs": False,
+        "open_charts": False,
+    })
+    agent.chat(PROMPT)
+    return llm.prompts
+
+
+def run_summary(documents):
+    """
+    The summary path, building the frame as build_transactions_frame does.
+    """
+    prompts = []
+    df = pd.DataFrame({
+        "transaction_date": pd.to_datetime(
+            [d["transaction_date"] for d in documents]),
+        "description": pd.Categorical([d["description"] for d in documents]),
+        "category": pd.Categorical([d["category"] for d in documents]),
+        "amount": pd.Series(
+            [d["amount"] for d in documents], dtype="float32"),
+    })
+    messages = insights_messages(
+        summary_context(summarize_transactions(df)), PROMPT)
+    prompts.append("\n".join(message["content"] for message in messages))
+    return prompts
+
+
+def run(sizes, repeat):
+    print(f"{'transactions':>12} {'path':>8} {'median ms':>10} "
+          f"{'llm calls':>9} {'prompt tokens':>13}")
+    for size in sizes:
+        documents = generate_documents(size)
+        for name, path in (("pandasai", run_agent), ("summary", run_summary)):
+            timings = []
+            for _ in range(repeat):
+                started = time.perf_counter()
+                prompts = path(documents)
+                timings.append((time.perf_counter() - started) * 1000)
+            timings.sort()
+            tokens = sum(count_tokens(prompt) for prompt in prompts)
+            print(f"{size:>12} {name:>8} {timings[len(timings) // 2]:>10.1f} "
+                  f"{len(prompts):>9} {tokens:>13}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--sizes", default="1000,10000,100000")
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+    run([int(size) for size in args.sizes.split(",")], args.repeat)
@@ -0,0 +1,65 @@
+"""
+Benchmark for jsonify throughput on transaction lists.
+
+Serializes pages of generated transaction documents, shaped as
+get_transactions reads them from Mongo, with jsonify under Flask's default
+JSON provider and under FastJSONProvider with each backend, and reports
+the median time, rows per second and output megabytes per second. No
+database is needed. The orjson backend is skipped when orjson is not
+installed.
+
+Usage (from the server directory):
+    python -m benchmarks.bench_json [--sizes 1000,5000,100000]
+"""
+import argparse
+import time
+
+from flask import jsonify
+from flask.json.provider import DefaultJSONProvider
+
+from app import app
+from benchmarks.bench_wire import generate_documents
+from utils import serialization
+from utils.serialization import FastJSONProvider
+
+
+def providers():
+    yield "flask default", DefaultJSONProvider(app)
+    yield "fast (json)", FastJSONProvider(app, backend="json")
+    if serialization.orjson is not None:
+        yield "fast (orjson)", FastJSONProvider(app, backend="orjson")
+
+
+def run(sizes, repeat):
+    print(f"{'rows':>7} {'provider':>14} {'median ms':>10} {'rows/s':>11} "
+          f"{'MB/s':>8} {'speedup':>8}")
+    original = app.json
+    try:
+        for size in sizes:
+            documents = generate_documents(size)
+            baseline = None
+            for name, provider in providers():
+                app.json = provider
+                timings = []
+                with app.app_context():
+                    for _ in range(repeat):
+                        started = time.perf_counter()
+                        payload = jsonify(documents).get_data()
+                        timings.append(time.perf_counter() - started)
+                timings.sort()
+                median = timings[len(timings) // 2]
+                baseline = baseline or median
+                print(f"{size:>7} {name:>14} {median * 1000:>10.1f} "
+                      f"{size / median:>11,.0f} "
+                      f"{len(payload) / median / 1e6:>8.1f} "
+                      f"{baseline / median:>7.1f}x")
+    finally:
+        app.json = original
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--sizes", default="1000,5000,100000")
+    parser.add_argument("--repeat", type=int, default=7)
+    args = parser.parse_args()
+    run([int(size) for size in args.sizes.split(",")], args.repeat)
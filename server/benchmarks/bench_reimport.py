@@ -0,0 +1,76 @@
+"""
+Benchmark for re-importing the same statement.
+
+Generates a Chase-format CSV and imports it repeatedly for one user,
+reporting the collection size and the time taken by each import. With
+content-derived transaction IDs the collection size should not change
+after the first import. Requires a local MongoDB and runs against the
+test database.
+
+Usage (from the server directory):
+    python -m benchmarks.bench_reimport [--rows 50000] [--imports 3]
+"""
+import argparse
+import io
+import os
+import random
+import time
+from datetime import datetime, timedelta
+
+os.environ["FLASK_ENV"] = "test"
+
+from database.db import get_budgetai_db  # noqa: E402
+from utils.upload import Upload  # noqa: E402
+
+USER_ID = "benchmark_user"
+HEADER = "Transaction Date,Post Date,Description,Category,Type,Amount,Memo\n"
+MERCHANTS = [
+    ("DOLLAR TREE", "Shopping"),
+    ("MTA*NYCT PAYGO", "Travel"),
+    ("STARBUCKS", "Food & Drink"),
+    ("SHELL OIL", "Gas"),
+    ("CON EDISON", "Bills & Utilities"),
+    ("AMC THEATRES", "Entertainment"),
+]
+
+
+def generate_csv(rows):
+    start = datetime(2020, 1, 1)
+    lines = [HEADER]
+    for _ in range(rows):
+        date = (start + timedelta(days=random.randrange(365 * 4)))
+        description, category = random.choice(MERCHANTS)
+        amount = -round(random.uniform(1, 200), 2)
+        lines.append(
+            f"{date:%m/%d/%Y},{date:%m/%d/%Y},{description},{category},"
+            f"Sale,{amount},\n"
+        )
+    return "".join(lines).encode("utf-8")
+
+
+def run(rows, imports):
+    db, client = get_budgetai_db()
+    db["transactions"].delete_many({"user_id": USER_ID})
+    data = generate_csv(rows)
+
+    print(f"{'import':>6} {'seconds':>8} {'inserted':>9} "
+          f"{'duplicates':>10} {'collection':>10}")
+    try:
+        for attempt in range(1, imports + 1):
+            started = time.perf_counter()
+            summary = Upload(db).process_stream(io.BytesIO(data), USER_ID)
+            elapsed = time.perf_counter() - started
+            size = db["transactions"].count_documents({"user_id": USER_ID})
+            print(f"{attempt:>6} {elapsed:>8.2f} {summary['inserted']:>9} "
+                  f"{summary['duplicates']:>10} {size:>10}")
+    finally:
+        db["transactions"].delete_many({"user_id": USER_ID})
+        client.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--rows", type=int, default=50000)
+    parser.add_argument("--imports", type=int, default=3)
+    args = parser.parse_args()
+    run(args.rows, args.imports)
@@ -0,0 +1,111 @@
+"""
+Benchmark for /query/transactions/totals.
+
+Seeds a benchmark user with a growing number of transactions, rebuilds
+their monthly totals rollup and times Query.get_transaction_totals, along
+with the number of database commands it issues. Requires a local MongoDB and runs against the test database.
+
+Usage (from the server directory):
+    python -m benchmarks.bench_totals [--sizes 100,1000,10000,100000]
+"""
+import argparse
+import os
+import random
+import time
+import uuid
+from datetime import datetime, timedelta
+
+from flask import session
+from pymongo import MongoClient, monitoring
+
+os.environ["FLASK_ENV"] = "test"
+
+from app import app  # noqa: E402
+from database.db import get_db_name  # noqa: E402
+from database.rollups import MONTHLY_TOTALS, rebuild_monthly_totals  # noqa: E402
+from utils.query import Query  # noqa: E402
+
+CATEGORIES = [
+    "Food & Drink",
+    "Bills & Utilities",
+    "Entertainment",
+    "Travel",
+    "Gas",
+    "Shopping",
+]
+USER_ID = "benchmark_user"
+
+
+class CommandCounter(monitoring.CommandListener):
+    def __init__(self):
+        self.count = 0
+
+    def started(self, event):
+        self.count += 1
+
+    def succeeded(self, event):
+        pass
+
+    def failed(self, event):
+        pass
+
+
+def seed(db, size):
+    db["transactions"].delete_many({"user_id": USER_ID})
+    start = datetime(2015, 1, 1)
+    batch = []
+    for _ in range(size):
+        date = start + timedelta(days=random.randrange(365 * 10))
+        batch.append({
+            "_id": uuid.uuid4().hex,
+            "user_id": USER_ID,
+            "transaction_date": date,
+            "year": date.year,
+            "month": date.month,
+            "description": "BENCHMARK MERCHANT",
+            "category": random.choice(CATEGORIES),
+            "amount": round(random.uniform(1, 200), 2),
+        })
+        if len(batch) == 10000:
+            db["transactions"].insert_many(batch)
+            batch = []
+    if batch:
+        db["transactions"].insert_many(batch)
+    rebuild_monthly_totals(db, USER_ID)
+
+
+def run(sizes, repeat):
+    counter = CommandCounter()
+    client = MongoClient(
+        os.getenv("MONGO_URI", "mongodb://localhost:27017/"),
+        event_listeners=[counter],
+    )
+    db = client[get_db_name()]
+
+    print(f"{'transactions':>12} {'median ms':>10} {'commands':>9}")
+    try:
+        for size in sizes:
+            seed(db, size)
+            timings = []
+            with app.test_request_context():
+                session["user"] = {"_id": USER_ID}
+                for _ in range(repeat):
+                    counter.count = 0
+                    started = time.perf_counter()
+                    Query(db).get_transaction_totals()
+                    timings.append((time.perf_counter() - started) * 1000)
+            timings.sort()
+            print(f"{size:>12} {timings[len(timings) // 2]:>10.2f} "
+                  f"{counter.count:>9}")
+    finally:
+        db["transactions"].delete_many({"user_id": USER_ID})
+        db[MONTHLY_TOTALS].delete_many({"user_id": USER_ID})
+        client.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--sizes", default="100,1000,10000,100000")
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+    run([int(size) for size in args.sizes.split(",")], args.repeat)
@@ -0,0 +1,90 @@
+"""
+Benchmark for the transaction list wire formats.
+
+Encodes generated transaction documents, shaped as they are read from
+Mongo, in every wire format of utils.wire and reports the payload size,
+raw and gzip compressed, and the median encoding time. The json format is
+the default row array, encoded with the app's jsonify. No database is
+needed. Formats whose optional package is not installed are skipped.
+
+Usage (from the server directory):
+    python -m benchmarks.bench_wire [--sizes 10000,100000]
+"""
+import argparse
+import gzip
+import random
+import time
+import uuid
+from datetime import datetime, timedelta
+
+from flask import jsonify
+
+from app import app
+from utils.wire import WIRE_FORMATS
+
+MERCHANTS = [
+    ("STARBUCKS", "Food & Drink"),
+    ("SHELL OIL", "Gas"),
+    ("CON EDISON", "Bills & Utilities"),
+    ("AMAZON", "Shopping"),
+    ("NETFLIX", "Entertainment"),
+    ("MTA*NYCT PAYGO", "Travel"),
+]
+
+
+def generate_documents(size):
+    start = datetime(2020, 1, 1)
+    documents = []
+    for _ in range(size):
+        date = start + timedelta(days=random.randrange(365 * 4))
+        description, category = random.choice(MERCHANTS)
+        documents.append({
+            "_id": uuid.uuid4().hex,
+            "user_id": "benchmark_user",
+            "transaction_date": date,
+            "year": date.year,
+            "month": date.month,
+            "description": f"{description} #{random.randrange(1000)}",
+            "category": category,
+            "amount": round(random.uniform(1, 200), 2),
+        })
+    documents.sort(key=lambda document: (
+        document["transaction_date"], document["_id"]))
+    return documents
+
+
+def encode_rows(documents):
+    with app.app_context():
+        return jsonify(documents).get_data()
+
+
+def run(sizes, repeat):
+    print(f"{'rows':>7} {'format':>8} {'bytes':>11} {'gzip bytes':>11} "
+          f"{'vs json':>8} {'median ms':>10}")
+    for size in sizes:
+        documents = generate_documents(size)
+        baseline = None
+        for name, (_, encode, missing) in WIRE_FORMATS.items():
+            if missing is not None:
+                print(f"{size:>7} {name:>8}   skipped, needs {missing}")
+                continue
+            encode = encode or encode_rows
+            timings = []
+            for _ in range(repeat):
+                started = time.perf_counter()
+                payload = encode(documents)
+                timings.append((time.perf_counter() - started) * 1000)
+            timings.sort()
+            compressed = len(gzip.compress(payload, compresslevel=6))
+            baseline = baseline or len(payload)
+            print(f"{size:>7} {name:>8} {len(payload):>11,} {compressed:>11,} "
+                  f"{len(payload) / baseline:>7.0%} "
+                  f"{timings[len(timings) // 2]:>10.1f}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--sizes", default="10000,100000")
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+    run([int(size) for size in args.sizes.split(",")], args.repeat)
@@ -1,15 +1,294 @@
+import logging
 import os
+import threading
 
+from flask import current_app, g
 from pymongo import MongoClient
+from pymongo.monitoring import ConnectionPoolListener
 
+DEFAULT_MONGO_URI = "mongodb://localhost:27017/"
 
-def get_budgetai_db():
-    client = MongoClient("mongodb://localhost:27017/")
+
+def get_db_name():
+    """
+    Returns the database name for the current environment.
+    """
     environment = os.getenv(
         "FLASK_ENV", "production"
     )  # Default to 'production' if not set
     if environment == "test":
-        db = client["test_budgetai_db"]
-    else:
-        db = client["prod_budgetai_db"]
-    return db, client
+        return "test_budgetai_db"
+    return "prod_budgetai_db"
+
+
+def get_budgetai_db():
+    """
+    Creates a standalone client and database handle.
+
+    Intended for scripts and tests that manage their own client lifetime.
+    Request handlers should use get_db() instead, which borrows the
+    process-wide pooled client.
+
+    Returns:
+        tuple: (database, client)
+    """
+    client = MongoClient(os.getenv("MONGO_URI", DEFAULT_MONGO_URI))
+    return client[get_db_name()], client
+
+
+class PoolMetrics(ConnectionPoolListener):
+    """
+    Connection pool listener that keeps running counters of pool activity
+    so they can be reported without touching the database.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self.counters = {
+                "connections_created": 0,
+                "connections_closed": 0,
+                "connections_in_use": 0,
+                "checkouts": 0,
+                "checkout_failures": 0,
+                "pools_cleared": 0,
+            }
+
+    def _incr(self, key, amount=1):
+        with self._lock:
+            self.counters[key] += amount
+
+    def snapshot(self):
+        with self._lock:
+            return dict(self.counters)
+
+    def pool_created(self, event):
+        pass
+
+    def pool_ready(self, event):
+        pass
+
+    def pool_cleared(self, event):
+        self._incr("pools_cleared")
+
+    def pool_closed(self, event):
+        pass
+
+    def connection_created(self, event):
+        self._incr("connections_created")
+
+    def connection_ready(self, event):
+        pass
+
+    def connection_closed(self, event):
+        self._incr("connections_closed")
+
+    def connection_check_out_started(self, event):
+        pass
+
+    def connection_check_out_failed(self, event):
+        self._incr("checkout_failures")
+
+    def connection_checked_out(self, event):
+        self._incr("checkouts")
+        self._incr("connections_in_use")
+
+    def connection_checked_in(self, event):
+        self._incr("connections_in_use", -1)
+
+
+class MongoConnectionManager:
+    """
+    Owns a single long-lived, pooled MongoClient per process.
+
+    The client is created lazily on first use and recreated after a fork,
+    so pre-fork servers (e.g. gunicorn) never share sockets between workers.
+
+    Attributes:
+        uri (str): MongoDB connection string.
+        options (dict): Pool and timeout options passed to MongoClient.
+        metrics (PoolMetrics): Pool event counters for this process.
+    """
+
+    def __init__(
+        self,
+        uri=DEFAULT_MONGO_URI,
+        max_pool_size=100,
+        min_pool_size=0,
+        max_idle_time_ms=None,
+        connect_timeout_ms=20000,
+        server_selection_timeout_ms=30000,
+        wait_queue_timeout_ms=None,
+    ):
+        self.uri = uri
+        self.options = {
+            "maxPoolSize": max_pool_size,
+            "minPoolSize": min_pool_size,
+            "maxIdleTimeMS": max_idle_time_ms,
+            "connectTimeoutMS": connect_timeout_ms,
+            "serverSelectionTimeoutMS": server_selection_timeout_ms,
+            "waitQueueTimeoutMS": wait_queue_timeout_ms,
+        }
+        self.metrics = PoolMetrics()
+        self._listeners = [self.metrics]
+        self._connect_hooks = []
+        self._client = None
+        self._pid = None
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_config(cls, config):
+        """
+        Builds a manager from a Flask config mapping.
+        """
+        return cls(
+            uri=config["MONGO_URI"],
+            max_pool_size=config["MONGO_MAX_POOL_SIZE"],
+            min_pool_size=config["MONGO_MIN_POOL_SIZE"],
+            max_idle_time_ms=config["MONGO_MAX_IDLE_TIME_MS"],
+            connect_timeout_ms=config["MONGO_CONNECT_TIMEOUT_MS"],
+            server_selection_timeout_ms=config[
+                "MONGO_SERVER_SELECTION_TIMEOUT_MS"],
+            wait_queue_timeout_ms=config["MONGO_WAIT_QUEUE_TIMEOUT_MS"],
+        )
+
+    def add_listener(self, listener):
+        """
+        Registers a pymongo event listener. Listeners are bound when the
+        client is created, so this must be called before first use.
+        """
+        if self._client is not None:
+            raise RuntimeError(
+                "Listeners must be registered before the client is created")
+        self._listeners.append(listener)
+
+    def on_connect(self, hook):
+        """
+        Registers a callback run with the default database handle each time
+        this process creates its client, e.g. to provision indexes.
+        """
+        self._connect_hooks.append(hook)
+
+    @property
+    def client(self):
+        """
+        Returns the pooled client for this process, creating it on first use.
+        """
+        pid = os.getpid()
+        if self._client is None or self._pid != pid:
+            with self._lock:
+                if self._client is None or self._pid != pid:
+                    options = {
+                        key: value
+                        for key, value in self.options.items()
+                        if value is not None
+                    }
+                    client = MongoClient(
+                        self.uri,
+                        event_listeners=self._listeners,
+                        **options,
+                    )
+                    self._client = client
+                    self._pid = pid
+                    self._run_connect_hooks(client)
+        return self._client
+
+    def _run_connect_hooks(self, client):
+        for hook in self._connect_hooks:
+            try:
+                hook(client[get_db_name()])
+            except Exception as e:
+                logging.error(f"Error running database startup hook: {str(e)}")
+
+    def get_db(self, name=None):
+        """
+        Returns a database handle backed by the pooled client.
+
+        Parameters:
+            name (str): Database name. Defaults to the environment database.
+        """
+        return self.client[name or get_db_name()]
+
+    def reset_after_fork(self):
+        """
+        Drops the inherited client in a forked child without closing it,
+        since its sockets still belong to the parent process.
+        """
+        self._client = None
+        self._pid = None
+        self._lock = threading.Lock()
+        self.metrics = PoolMetrics()
+        self._listeners[0] = self.metrics
+
+    def close(self):
+        """
+        Closes the pooled client owned by this process.
+        """
+        with self._lock:
+            if self._client is not None and self._pid == os.getpid():
+                self._client.close()
+            self._client = None
+            self._pid = None
+
+    def pool_stats(self):
+        """
+        Returns pool configuration and live counters for this process.
+        """
+        stats = self.metrics.snapshot()
+        stats["connected"] = self._client is not None
+        stats["pid"] = os.getpid()
+        stats["max_pool_size"] = self.options["maxPoolSize"]
+        stats["min_pool_size"] = self.options["minPoolSize"]
+        return stats
+
+
+def _env_int(name, default):
+    value = os.getenv(name)
+    return int(value) if value else default
+
+
+def init_db(app):
+    """
+    Attaches a MongoConnectionManager to the Flask app. Pool size and
+    timeouts can be set through the app config or environment variables.
+    """
+    app.config.setdefault(
+        "MONGO_URI", os.getenv("MONGO_URI", DEFAULT_MONGO_URI))
+    app.config.setdefault(
+        "MONGO_MAX_POOL_SIZE", _env_int("MONGO_MAX_POOL_SIZE", 100))
+    app.config.setdefault(
+        "MONGO_MIN_POOL_SIZE", _env_int("MONGO_MIN_POOL_SIZE", 0))
+    app.config.setdefault(
+        "MONGO_MAX_IDLE_TIME_MS", _env_int("MONGO_MAX_IDLE_TIME_MS", None))
+    app.config.setdefault(
+        "MONGO_CONNECT_TIMEOUT_MS",
+        _env_int("MONGO_CONNECT_TIMEOUT_MS", 20000))
+    app.config.setdefault(
+        "MONGO_SERVER_SELECTION_TIMEOUT_MS",
+        _env_int("MONGO_SERVER_SELECTION_TIMEOUT_MS", 30000),
+    )
+    app.config.setdefault(
+        "MONGO_WAIT_QUEUE_TIMEOUT_MS",
+        _env_int("MONGO_WAIT_QUEUE_TIMEOUT_MS", None))
+    app.config.setdefault(
+        "MONGO_ENSURE_INDEXES",
+        os.getenv("MONGO_ENSURE_INDEXES", "true").lower() == "true")
+
+    manager = MongoConnectionManager.from_config(app.config)
+    app.extensions["mongo"] = manager
+    if hasattr(os, "register_at_fork"):
+        os.register_at_fork(after_in_child=manager.reset_after_fork)
+    return manager
+
+
+def get_db():
+    """
+    Returns the database handle for the current app context, borrowed from
+    the app's pooled client. Callers must not close it.
+    """
+    if "db" not in g:
+        g.db = current_app.extensions["mongo"].get_db()
+    return g.db
@@ -0,0 +1,185 @@
+import logging
+
+from pymongo import ASCENDING, IndexModel, monitoring
+
+from database.db import get_budgetai_db
+
+# Indexes backing every query issued by Query, Upload, User and the
+# monthly totals rollup, plus housekeeping indexes
+INDEXES = {
+    "transactions": [
+        # Trailing _id lets paginated queries walk the index in cursor order
+        IndexModel(
+            [("user_id", ASCENDING), ("transaction_date", ASCENDING),
+             ("_id", ASCENDING)],
+            name="user_id_transaction_date_id",
+        ),
+        IndexModel(
+            [("user_id", ASCENDING), ("category", ASCENDING),
+             ("transaction_date", ASCENDING), ("_id", ASCENDING)],
+            name="user_id_category_transaction_date_id",
+        ),
+        # Trailing _id lets searches sorted by amount walk the index
+        IndexModel(
+            [("user_id", ASCENDING), ("amount", ASCENDING), ("_id", ASCENDING)],
+            name="user_id_amount_id",
+        ),
+    ],
+    "monthly_totals": [
+        IndexModel(
+            [("user_id", ASCENDING), ("year", ASCENDING), ("month", ASCENDING),
+             ("category", ASCENDING)],
+            name="user_id_year_month_category_unique",
+            unique=True,
+        ),
+    ],
+    "users": [
+        IndexModel([("email", ASCENDING)], name="email_unique", unique=True),
+    ],
+    "sessions": [
+        # Sessions are removed once they expire
+        IndexModel(
+            [("expires_at", ASCENDING)],
+            name="expires_at_ttl",
+            expireAfterSeconds=0,
+        ),
+        IndexModel([("user_id", ASCENDING)], name="user_id"),
+    ],
+    "ingest_jobs": [
+        # Job status documents expire a week after the upload
+        IndexModel(
+            [("created_at", ASCENDING)],
+            name="created_at_ttl",
+            expireAfterSeconds=7 * 24 * 60 * 60,
+        ),
+        # Finds jobs whose worker stopped renewing their heartbeat
+        IndexModel(
+            [("status", ASCENDING), ("heartbeat_at", ASCENDING)],
+            name="status_heartbeat_at",
+        ),
+    ],
+    "ingest_locks": [
+        # Leases of stopped workers are removed once they expire
+        IndexModel(
+            [("expires_at", ASCENDING)],
+            name="expires_at_ttl",
+            expireAfterSeconds=0,
+        ),
+    ],
+}
+
+# Read commands whose plans are checked by QueryPlanRecorder
+EXPLAINABLE_COMMANDS = ("find", "aggregate", "distinct", "count")
+
+
+def ensure_indexes(db):
+    """
+    Creates all application indexes. Index creation is idempotent, so this
+    is safe to run on every startup. A collection whose indexes cannot be
+    created, e.g. a unique index over existing duplicates, does not keep the
+    other collections from getting theirs.
+
+    Parameters:
+        db: Database handle.
+
+    Returns:
+        tuple: (index names created or confirmed by collection, error
+        message by collection whose indexes failed)
+    """
+    created = {}
+    failed = {}
+    for collection, indexes in INDEXES.items():
+        try:
+            created[collection] = db[collection].create_indexes(indexes)
+        except Exception as e:
+            logging.error(
+                f"Error creating indexes on {collection}: {str(e)}")
+            failed[collection] = str(e)
+    return created, failed
+
+
+class QueryPlanRecorder(monitoring.CommandListener):
+    """
+    Command listener that records every read command sent to the database,
+    so the commands can later be replayed through explain().
+    """
+
+    def __init__(self):
+        self.commands = []
+
+    def started(self, event):
+        if event.command_name in EXPLAINABLE_COMMANDS:
+            command = {
+                key: value
+                for key, value in event.command.items()
+                if not key.startswith("$") and key != "lsid"
+            }
+            self.commands.append((event.database_name, command))
+
+    def succeeded(self, event):
+        pass
+
+    def failed(self, event):
+        pass
+
+    def clear(self):
+        self.commands = []
+
+
+def find_collscans(plan):
+    """
+    Returns the COLLSCAN stages found in the winning plans of an explain
+    result. Rejected plans are ignored.
+    """
+    collscans = []
+    if isinstance(plan, dict):
+        if plan.get("stage") == "COLLSCAN":
+            collscans.append(plan)
+        for key, value in plan.items():
+            if key != "rejectedPlans":
+                collscans.extend(find_collscans(value))
+    elif isinstance(plan, list):
+        for item in plan:
+            collscans.extend(find_collscans(item))
+    return collscans
+
+
+def explain_collscans(client, commands):
+    """
+    Runs explain() on recorded commands.
+
+    Parameters:
+        client: MongoClient used to run the explain commands.
+        commands (list): (database name, command) pairs from a recorder.
+
+    Returns:
+        list: The commands whose winning plan contains a COLLSCAN.
+    """
+    offenders = []
+    for database_name, command in commands:
+        explained = client[database_name].command(
+            "explain", command, verbosity="queryPlanner"
+        )
+        if find_collscans(explained):
+            offenders.append(command)
+    return offenders
+
+
+def main():
+    """
+    Command-line entry point, run from the server directory:
+        python -m database.indexes
+    """
+    db, client = get_budgetai_db()
+    try:
+        created, failed = ensure_indexes(db)
+    finally:
+        client.close()
+    for collection, names in created.items():
+        print(f"{collection}: {', '.join(names)}")
+    if failed:
+        raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    main()
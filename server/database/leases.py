@@ -0,0 +1,72 @@
+import logging
+import time
+from contextlib import contextmanager
+from datetime import datetime, timedelta, timezone
+
+from pymongo.errors import DuplicateKeyError
+
+# One lease document per user whose transactions or monthly totals are being
+# written in bulk, by an upload or a rollup rebuild
+INGEST_LOCKS = "ingest_locks"
+
+
+def acquire_lease(db, user_id, owner, lease_seconds):
+    """
+    Takes a user's lease unless another owner holds an unexpired one.
+
+    Parameters:
+        db: Database handle.
+        user_id (str): The ID of the user.
+        owner (str): Identifies the holder, for renewing and releasing.
+        lease_seconds (float): Time the lease stays valid without renewal.
+
+    Returns:
+        bool: Whether the lease was taken.
+    """
+    now = datetime.now(timezone.utc)
+    try:
+        db[INGEST_LOCKS].update_one(
+            {"_id": user_id, "expires_at": {"$lt": now}},
+            {"$set": {
+                "owner": owner,
+                "expires_at": now + timedelta(seconds=lease_seconds),
+            }},
+            upsert=True,
+        )
+    except DuplicateKeyError:
+        return False  # Held by someone else
+    return True
+
+
+def renew_leases(db, owner, lease_seconds):
+    """
+    Extends every lease held by an owner.
+    """
+    db[INGEST_LOCKS].update_many(
+        {"owner": owner},
+        {"$set": {"expires_at": datetime.now(timezone.utc)
+                  + timedelta(seconds=lease_seconds)}},
+    )
+
+
+def release_lease(db, user_id, owner):
+    db[INGEST_LOCKS].delete_one({"_id": user_id, "owner": owner})
+
+
+@contextmanager
+def user_lease(db, user_id, owner, lease_seconds, poll_interval=1.0):
+    """
+    Holds a user's lease for the duration of a with block, waiting for it
+    while another owner holds it. The block must finish within
+    lease_seconds, as the lease is not renewed.
+    """
+    waiting = False
+    while not acquire_lease(db, user_id, owner, lease_seconds):
+        if not waiting:
+            logging.info(f"Waiting for the lease of user {user_id}")
+            waiting = True
+        time.sleep(poll_interval)
+    try:
+        yield
+    finally:
+        release_lease(db, user_id, owner)
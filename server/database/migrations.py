@@ -0,0 +1,270 @@
+import argparse
+import logging
+import os
+import socket
+from collections import defaultdict
+from datetime import datetime, timezone
+
+from pymongo import InsertOne, UpdateOne
+
+from database.db import get_budgetai_db
+from database.leases import user_lease
+from database.rollups import REBUILD_LEASE_SECONDS, rebuild_monthly_totals
+from utils.cache import bump_data_version
+from utils.upload import content_fingerprint, transaction_content
+
+LEGACY_DATE_FORMAT = "%m/%d/%Y"
+# One document per migration, recording when it last ran to completion
+MIGRATIONS = "migrations"
+TRANSACTION_DATES = "transaction_dates"
+
+
+def migrate_transaction_dates(db, batch_size=1000):
+    """
+    Rewrites legacy "MM/DD/YYYY" transaction_date strings as native datetimes
+    and adds the precomputed year/month keys used for monthly grouping.
+
+    The migration is batched and resumable: only documents that still hold a
+    string date are selected, so an interrupted run can simply be restarted.
+    Each update is guarded on the original string value, making concurrent
+    runs safe. The data version of every user whose transactions were
+    rewritten is bumped, so clients do not keep cached pre-migration
+    responses. A completed run is recorded in the migrations collection,
+    along with the number of dates it could not parse.
+
+    Parameters:
+        db: Database handle.
+        batch_size (int): Number of documents rewritten per bulk write.
+
+    Returns:
+        dict: Counts of migrated and unparseable documents.
+    """
+    collection = db["transactions"]
+    migrated = 0
+    invalid = 0
+    last_id = None
+
+    while True:
+        query = {"transaction_date": {"$type": "string"}}
+        if last_id is not None:
+            # Skip past unparseable documents left behind by earlier batches
+            query["_id"] = {"$gt": last_id}
+        batch = list(
+            collection.find(query, {"user_id": 1, "transaction_date": 1})
+            .sort("_id", 1)
+            .limit(batch_size)
+        )
+        if not batch:
+            break
+
+        operations = []
+        batch_users = set()
+        for document in batch:
+            try:
+                transaction_date = datetime.strptime(
+                    document["transaction_date"], LEGACY_DATE_FORMAT
+                )
+            except ValueError:
+                logging.error(
+                    f"Cannot migrate transaction {document['_id']}: invalid date '{document['transaction_date']}'"
+                )
+                invalid += 1
+                continue
+            operations.append(
+                UpdateOne(
+                    {
+                        "_id": document["_id"],
+                        "transaction_date": document["transaction_date"],
+                    },
+                    {
+                        "$set": {
+                            "transaction_date": transaction_date,
+                            "year": transaction_date.year,
+                            "month": transaction_date.month,
+                        }
+                    },
+                )
+            )
+            batch_users.add(document.get("user_id"))
+
+        if operations:
+            result = collection.bulk_write(operations, ordered=False)
+            migrated += result.modified_count
+            # Bumped per batch, so an interrupted run leaves no user behind
+            if result.modified_count:
+                for user_id in batch_users:
+                    bump_data_version(db, user_id)
+        last_id = batch[-1]["_id"]
+
+    _record_migration(db, invalid)
+    return {"migrated": migrated, "invalid": invalid}
+
+
+def _record_migration(db, invalid):
+    db[MIGRATIONS].update_one(
+        {"_id": TRANSACTION_DATES},
+        {"$set": {"completed_at": datetime.now(timezone.utc),
+                  "invalid": invalid}},
+        upsert=True,
+    )
+
+
+def check_transaction_dates(db):
+    """
+    Warns when transactions still hold string dates, which paginated
+    queries leave out. Run on startup.
+
+    Once the migration has completed only its record is read. Before that,
+    the transactions are searched for string dates, and the migration is
+    recorded as complete if there are none.
+
+    Parameters:
+        db: Database handle.
+
+    Returns:
+        int: The number of transactions with a string date.
+    """
+    record = db[MIGRATIONS].find_one({"_id": TRANSACTION_DATES})
+    if record is not None:
+        remaining = record["invalid"]
+    else:
+        remaining = db["transactions"].count_documents(
+            {"transaction_date": {"$type": "string"}})
+        if not remaining:
+            _record_migration(db, 0)
+            return 0
+    if remaining:
+        if record is None:
+            logging.error(
+                f"{remaining} transactions have string dates and are left out "
+                "of transaction lists; run 'python -m database.migrations'")
+        else:
+            logging.error(
+                f"{remaining} transactions have dates the migration could "
+                "not parse and are left out of transaction lists")
+    return remaining
+
+
+def rekey_transactions(db, batch_size=1000, lease_seconds=REBUILD_LEASE_SECONDS,
+                       poll_interval=1.0):
+    """
+    Re-keys transactions stored with random IDs, before uploads derived IDs
+    from content, to the fingerprint an upload of the same rows gives them,
+    so that re-uploading a statement imported back then inserts nothing.
+
+    The n transactions of a user with the same content get the fingerprints
+    of occurrences 0 to n-1, those already holding one keeping it. As _id
+    cannot change, a transaction is copied under its new ID, with
+    rekeyed_from naming the original, before the original is deleted; a
+    run interrupted in between deletes the originals first. Each user is
+    re-keyed while holding their upload lease, and their data version is
+    bumped if any ID changed. Transactions whose date is still a string are
+    left alone, so dates are migrated first.
+
+    Parameters:
+        db: Database handle.
+        batch_size (int): Number of transactions copied per bulk write.
+        lease_seconds (float): Time a user's lease is held for at most.
+        poll_interval (float): Seconds between attempts to take a lease
+            held by an upload.
+
+    Returns:
+        dict: Counts of re-keyed transactions and of their users.
+    """
+    owner = f"migration:{socket.gethostname()}:{os.getpid()}"
+    rekeyed = 0
+    users = 0
+    for user_id in db["transactions"].distinct("user_id"):
+        with user_lease(db, user_id, owner, lease_seconds, poll_interval):
+            count = _rekey_user(db["transactions"], user_id, batch_size)
+            if count:
+                bump_data_version(db, user_id)
+        rekeyed += count
+        users += bool(count)
+    return {"rekeyed": rekeyed, "users": users}
+
+
+def _rekey_user(collection, user_id, batch_size):
+    _delete_rekeyed_originals(collection, user_id)
+
+    groups = defaultdict(list)  # content -> _ids of the transactions
+    for document in collection.find(
+            {"user_id": user_id, "transaction_date": {"$type": "date"}},
+            {"transaction_date": 1, "description": 1, "amount": 1},
+    ).sort("_id", 1):
+        try:
+            content = transaction_content(
+                user_id, document["transaction_date"],
+                document["description"], document["amount"])
+        except (KeyError, TypeError, ValueError):
+            continue  # Incomplete transactions cannot match an upload
+        groups[content].append(document["_id"])
+
+    moves = []  # (current _id, fingerprint)
+    for content, ids in groups.items():
+        fingerprints = [
+            content_fingerprint(content, occurrence)
+            for occurrence in range(len(ids))]
+        kept = set(ids).intersection(fingerprints)
+        free = (fingerprint for fingerprint in fingerprints
+                if fingerprint not in kept)
+        moves.extend((_id, next(free)) for _id in ids if _id not in kept)
+
+    for start in range(0, len(moves), batch_size):
+        batch = dict(moves[start:start + batch_size])
+        collection.bulk_write([
+            InsertOne({**document, "_id": batch[document["_id"]],
+                       "rekeyed_from": document["_id"]})
+            for document in collection.find({"_id": {"$in": list(batch)}})
+        ], ordered=False)
+        _delete_rekeyed_originals(collection, user_id)
+    return len(moves)
+
+
+def _delete_rekeyed_originals(collection, user_id):
+    copies = list(collection.find(
+        {"user_id": user_id, "rekeyed_from": {"$exists": True}},
+        {"rekeyed_from": 1}))
+    if not copies:
+        return
+    collection.delete_many(
+        {"_id": {"$in": [copy["rekeyed_from"] for copy in copies]}})
+    collection.update_many(
+        {"_id": {"$in": [copy["_id"] for copy in copies]}},
+        {"$unset": {"rekeyed_from": ""}})
+
+
+def main():
+    """
+    Command-line entry point, run from the server directory:
+        python -m database.migrations [--batch-size N]
+    """
+    parser = argparse.ArgumentParser(
+        description="Convert string transaction dates to native datetimes "
+                    "and re-key transactions to their content fingerprint."
+    )
+    parser.add_argument("--batch-size", type=int, default=1000,
+                        help="Documents rewritten per bulk write.")
+    args = parser.parse_args()
+
+    db, client = get_budgetai_db()
+    try:
+        result = migrate_transaction_dates(db, batch_size=args.batch_size)
+        if result["migrated"]:
+            # Migrated transactions now have the year/month rollup keys
+            rebuild_monthly_totals(db)
+        rekeyed = rekey_transactions(db, batch_size=args.batch_size)
+    finally:
+        client.close()
+    print(
+        f"Migrated {result['migrated']} transactions "
+        f"({result['invalid']} with invalid dates left unchanged)."
+    )
+    print(
+        f"Re-keyed {rekeyed['rekeyed']} transactions of {rekeyed['users']} "
+        "users to their content fingerprint."
+    )
+
+
+if __name__ == "__main__":
+    main()
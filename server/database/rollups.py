@@ -0,0 +1,240 @@
+import argparse
+import logging
+import os
+import socket
+from collections import defaultdict
+
+from pymongo import UpdateOne
+
+from database.db import get_budgetai_db
+from database.leases import user_lease
+from utils.cache import bump_data_version
+
+MONTHLY_TOTALS = "monthly_totals"
+# Longest a rebuild holds a user's lease, which uploads wait for
+REBUILD_LEASE_SECONDS = 300
+
+# Totals from the rollup and a fresh aggregation add the same amounts in a
+# different order, so they may differ by floating point rounding
+TOTAL_TOLERANCE = 0.005
+
+
+def _rollup_key(document):
+    return (
+        document["user_id"],
+        document["year"],
+        document["month"],
+        document["category"],
+    )
+
+
+def _key_filter(key):
+    user_id, year, month, category = key
+    return {"user_id": user_id, "year": year, "month": month,
+            "category": category}
+
+
+def apply_transactions(db, transactions):
+    """
+    Adds newly inserted transactions to the monthly_totals rollup.
+
+    Transactions are grouped in memory first, so a batch costs one upsert
+    per (user, year, month, category) rather than one per transaction.
+
+    Parameters:
+        db: Database handle.
+        transactions (list): Transaction documents that were just inserted.
+
+    Returns:
+        int: The number of rollup documents updated or created.
+    """
+    increments = defaultdict(lambda: [0.0, 0])
+    for transaction in transactions:
+        if transaction.get("year") is None or transaction.get("month") is None:
+            continue
+        increment = increments[_rollup_key(transaction)]
+        increment[0] += transaction["amount"]
+        increment[1] += 1
+
+    if not increments:
+        return 0
+    operations = [
+        UpdateOne(
+            _key_filter(key),
+            {"$inc": {"total": total, "count": count}},
+            upsert=True,
+        )
+        for key, (total, count) in increments.items()
+    ]
+    db[MONTHLY_TOTALS].bulk_write(operations, ordered=False)
+    return len(operations)
+
+
+def aggregate_monthly_totals(db, user_id=None):
+    """
+    Computes monthly totals from the raw transactions.
+
+    Parameters:
+        db: Database handle.
+        user_id (str): Restrict to one user, or None for every user.
+
+    Returns:
+        dict: {(user_id, year, month, category): (total, count)}
+    """
+    match = {"year": {"$ne": None}, "month": {"$ne": None}}
+    if user_id is not None:
+        match["user_id"] = user_id
+    pipeline = [
+        {"$match": match},
+        {
+            "$group": {
+                "_id": {
+                    "user_id": "$user_id",
+                    "year": "$year",
+                    "month": "$month",
+                    "category": "$category",
+                },
+                "total": {"$sum": "$amount"},
+                "count": {"$sum": 1},
+            }
+        },
+    ]
+    return {
+        _rollup_key(record["_id"]): (record["total"], record["count"])
+        for record in db["transactions"].aggregate(pipeline, allowDiskUse=True)
+    }
+
+
+def rebuild_monthly_totals(db, user_id=None, batch_size=1000,
+                           lease_seconds=REBUILD_LEASE_SECONDS,
+                           poll_interval=1.0):
+    """
+    Replaces the monthly_totals rollup with a fresh aggregation of the raw
+    transactions, for one user or for everyone.
+
+    Each user is rebuilt while holding their lease in ingest_locks, so an
+    upload cannot add to their transactions and totals between the
+    aggregation and the write. Totals are overwritten in place before keys
+    without transactions are deleted, so concurrent reads never find a user
+    without totals, and the user's data version is bumped afterwards.
+
+    Parameters:
+        db: Database handle.
+        user_id (str): Rebuild a single user, or None for every user.
+        batch_size (int): Number of rollup documents written per bulk write.
+        lease_seconds (float): Time a user's lease is held for at most.
+        poll_interval (float): Seconds between attempts to take a lease
+            held by an upload.
+
+    Returns:
+        int: The number of rollup documents written.
+    """
+    if user_id is None:
+        user_ids = sorted(
+            set(db["transactions"].distinct("user_id"))
+            | set(db[MONTHLY_TOTALS].distinct("user_id")))
+    else:
+        user_ids = [user_id]
+
+    owner = f"rebuild:{socket.gethostname()}:{os.getpid()}"
+    written = 0
+    for rebuilt_user in user_ids:
+        with user_lease(db, rebuilt_user, owner, lease_seconds, poll_interval):
+            written += _rebuild_user_totals(db, rebuilt_user, batch_size)
+            bump_data_version(db, rebuilt_user)
+    return written
+
+
+def _rebuild_user_totals(db, user_id, batch_size):
+    totals = aggregate_monthly_totals(db, user_id)
+    operations = [
+        UpdateOne(
+            _key_filter(key),
+            {"$set": {"total": total, "count": count}},
+            upsert=True,
+        )
+        for key, (total, count) in totals.items()
+    ]
+    for start in range(0, len(operations), batch_size):
+        db[MONTHLY_TOTALS].bulk_write(
+            operations[start:start + batch_size], ordered=False)
+
+    # Months and categories that no longer have any transactions
+    stale = [
+        document["_id"]
+        for document in db[MONTHLY_TOTALS].find({"user_id": user_id})
+        if _rollup_key(document) not in totals
+    ]
+    if stale:
+        db[MONTHLY_TOTALS].delete_many({"_id": {"$in": stale}})
+    return len(operations)
+
+
+def check_monthly_totals(db, user_id=None):
+    """
+    Compares the monthly_totals rollup against a fresh aggregation.
+
+    Parameters:
+        db: Database handle.
+        user_id (str): Check a single user, or None for every user.
+
+    Returns:
+        list: One dict per mismatched (user, year, month, category), with the
+        expected and actual total and count. Empty when consistent.
+    """
+    expected = aggregate_monthly_totals(db, user_id)
+    actual = {
+        _rollup_key(document): (document["total"], document["count"])
+        for document in db[MONTHLY_TOTALS].find(
+            {} if user_id is None else {"user_id": user_id})
+    }
+
+    mismatches = []
+    for key in expected.keys() | actual.keys():
+        expected_total, expected_count = expected.get(key, (0, 0))
+        actual_total, actual_count = actual.get(key, (0, 0))
+        if (expected_count != actual_count
+                or abs(expected_total - actual_total) > TOTAL_TOLERANCE):
+            mismatches.append({
+                **_key_filter(key),
+                "expected_total": expected_total,
+                "actual_total": actual_total,
+                "expected_count": expected_count,
+                "actual_count": actual_count,
+            })
+    return mismatches
+
+
+def main():
+    """
+    Command-line entry point, run from the server directory:
+        python -m database.rollups rebuild [--user USER_ID]
+        python -m database.rollups check [--user USER_ID]
+    """
+    parser = argparse.ArgumentParser(
+        description="Rebuild or verify the monthly_totals rollup."
+    )
+    parser.add_argument("command", choices=("rebuild", "check"))
+    parser.add_argument("--user", default=None,
+                        help="Limit to a single user ID.")
+    args = parser.parse_args()
+
+    db, client = get_budgetai_db()
+    try:
+        if args.command == "rebuild":
+            written = rebuild_monthly_totals(db, args.user)
+            print(f"Rebuilt {written} monthly total documents.")
+            return
+
+        mismatches = check_monthly_totals(db, args.user)
+        for mismatch in mismatches:
+            logging.error(f"Monthly total mismatch: {mismatch}")
+        print(f"Found {len(mismatches)} mismatched monthly totals.")
+        if mismatches:
+            raise SystemExit(1)
+    finally:
+        client.close()
+
+
+if __name__ == "__main__":
+    main()
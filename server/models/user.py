@@ -1,10 +1,30 @@
+import logging
 import re
 import uuid
 
-from flask import jsonify, redirect, request, session
-from passlib.hash import pbkdf2_sha256
+from flask import current_app, jsonify, redirect, request, session
+from pymongo.errors import DuplicateKeyError
 
-from database.db import get_budgetai_db
+from database.db import get_db
+from database.rollups import MONTHLY_TOTALS
+from utils.cache import bump_data_version
+from utils.passwords import PasswordHasherBusyError
+from utils.sessions import revoke_user_sessions
+
+
+def too_many_attempts(retry_after):
+    """
+    Builds the response for a throttled password attempt.
+    """
+    return (
+        jsonify({"error": "Too many attempts, try again later"}),
+        429,
+        {"Retry-After": str(retry_after)},
+    )
+
+
+def hasher_busy():
+    return jsonify({"error": "Server busy, try again shortly"}), 503
 
 
 class User:
@@ -14,8 +34,7 @@ class User:
     interacts with the database to manage user data securely.
 
     Attributes:
-        db: Database connection for user operations.
-        client: Database client for performing CRUD operations.
+        db: Database handle borrowed from the app's pooled client.
     """
 
     class Profile:
@@ -34,19 +53,16 @@ class User:
             self.email = email
             self.password = password
 
-    def __init__(self):
-        """
-        Initializes the User class and establishes a connection to the database
-        for user management.
+    def __init__(self, db=None):
         """
-        self.db, self.client = get_budgetai_db()
+        Initializes the User class with a database handle for user management.
 
-    def __del__(self):
-        """
-        Cleans up the database client when the User object is deleted,
-        ensuring proper resource management.
+        Parameters:
+            db: Database handle. Defaults to the app's pooled connection.
         """
-        self.client.close()
+        self.db = db if db is not None else get_db()
+        self.hasher = current_app.extensions["password_hasher"]
+        self.throttle = current_app.extensions["auth_throttle"]
 
     def start_session(self, user_profile):
         """
@@ -58,6 +74,8 @@ class User:
         Returns:
             jsonify: JSON response containing the user data without the password.
         """
+        if hasattr(session, "regenerate"):
+            session.regenerate()  # New session id on every login
         session["logged_in"] = True
         session["user"] = {
             "_id": user_profile._id,
@@ -92,15 +110,28 @@ class User:
         if not re.match(r"[^@]+@[^@]+\.[^@]+", user_profile.email):
             return jsonify({"error": "Invalid email format"}), 400
 
-        # Hash the user's password
-        user_profile.password = pbkdf2_sha256.hash(user_profile.password)
+        retry_after = self.throttle.attempt(request.remote_addr)
+        if retry_after:
+            return too_many_attempts(retry_after)
 
-        # Check if the email address is already registered
-        if self.db["users"].find_one({"email": user_profile.email}):
+        # Check if the email address is already registered before spending
+        # CPU on the hash
+        if self.db["users"].find_one({"email": user_profile.email}, {"_id": 1}):
             return jsonify({"error": "Email address already in use"}), 400
 
+        # Hash the user's password
+        try:
+            user_profile.password = self.hasher.hash(user_profile.password)
+        except PasswordHasherBusyError:
+            return hasher_busy()
+
         # Add the user to the database
-        if self.db["users"].insert_one(user_profile.__dict__):
+        try:
+            inserted = self.db["users"].insert_one(user_profile.__dict__)
+        except DuplicateKeyError:
+            # Lost a race with a concurrent signup (unique email index)
+            return jsonify({"error": "Email address already in use"}), 400
+        if inserted:
             # Start session if signup is successful
             return self.start_session(user_profile)
 
@@ -110,6 +141,7 @@ class User:
         """
         Handles user login process by validating provided credentials,
         retrieving the user profile, and starting a session if successful.
+        Hashes made with outdated parameters are replaced on success.
 
         Returns:
             jsonify: JSON response indicating success or error.
@@ -120,11 +152,24 @@ class User:
         if not data or not all(key in data for key in ("email", "password")):
             return jsonify({"error": "Missing required fields"}), 400
 
+        retry_after = (self.throttle.attempt(request.remote_addr)
+                       or self.throttle.blocked(data["email"]))
+        if retry_after:
+            return too_many_attempts(retry_after)
+
         # Retrieve user from database
         user_data = self.db["users"].find_one({"email": data["email"]})
 
-        if user_data and pbkdf2_sha256.verify(
-                data["password"], user_data["password"]):
+        try:
+            verified = user_data is not None and self.hasher.verify(
+                data["password"], user_data["password"])
+        except PasswordHasherBusyError:
+            return hasher_busy()
+
+        if verified:
+            self.throttle.succeeded(data["email"])
+            if self.hasher.needs_update(user_data["password"]):
+                self.rehash(user_data["_id"], data["password"])
             user_profile = self.Profile(
                 _id=user_data["_id"],
                 name=user_data["name"],
@@ -133,8 +178,25 @@ class User:
             # Start a session with the user profile
             return self.start_session(user_profile)
 
+        self.throttle.failed(data["email"])
         return jsonify({"error": "Invalid login credentials"}), 401
 
+    def rehash(self, user_id, password):
+        """
+        Replaces a user's stored hash with one at the current work factor.
+        Failures are logged; the old hash keeps working.
+
+        Parameters:
+            user_id (str): The ID of the user.
+            password (str): The verified plain text password.
+        """
+        try:
+            self.db["users"].update_one(
+                {"_id": user_id},
+                {"$set": {"password": self.hasher.hash(password)}})
+        except Exception:
+            logging.exception("Password rehash failed for user %s", user_id)
+
     def signout(self):
         """
         Logs the user out by clearing the session data and redirects
@@ -146,6 +208,18 @@ class User:
         session.clear()  # Clear the session to log the user out
         return redirect("/")  # Redirect the user to the homepage
 
+    def signout_all(self):
+        """
+        Revokes every session of the logged in user, on all devices, and
+        redirects to the homepage.
+
+        Returns:
+            redirect: Redirects to the homepage after logging out.
+        """
+        revoke_user_sessions(session["user"]["_id"])
+        session.clear()
+        return redirect("/")
+
     def wipe(self):
         """
         Wipes user data from the database client and clears session.
@@ -163,16 +237,27 @@ class User:
         if not data or "password" not in data:
             return jsonify({"error": "Missing required fields"}), 400
 
+        retry_after = self.throttle.attempt(request.remote_addr)
+        if retry_after:
+            return too_many_attempts(retry_after)
+
         user_data = self.db["users"].find_one({"_id": user_id})
         if not user_data:
             return jsonify({"error": "User not found"}), 400
-        if not pbkdf2_sha256.verify(data["password"], user_data["password"]):
+        try:
+            verified = self.hasher.verify(data["password"], user_data["password"])
+        except PasswordHasherBusyError:
+            return hasher_busy()
+        if not verified:
             return jsonify({"error": "Invalid credentials"}), 400
 
         # Delete any corresponding transactions from database
         self.db["transactions"].delete_many({"user_id": user_id})
-        # Delete user from database
+        self.db[MONTHLY_TOTALS].delete_many({"user_id": user_id})
+        bump_data_version(self.db, user_id)
+        # Delete user from database and sign out everywhere
         self.db["users"].delete_one({"_id": user_id})
+        revoke_user_sessions(user_id)
 
         session.clear()
         return (
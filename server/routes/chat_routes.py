@@ -1,39 +1,81 @@
-import os
 import json
-from flask import Blueprint, jsonify, request
-import requests
-from openai import AzureOpenAI
-from dotenv import load_dotenv
-import pandas as pd
-from pandasai import Agent
-from utils.query import Query
 
+from flask import (
+    Blueprint,
+    Response,
+    current_app,
+    jsonify,
+    request,
+    session,
+    stream_with_context,
+)
+
+from database.db import get_db
+from utils.cache import get_data_version
 from utils.decorators import login_required
+from utils.insights import insights_messages
+from utils.llm import (
+    ChatBusyError,
+    chat_deferred,
+    complete_chat,
+    defer_chat,
+    stream_chat,
+)
 
 chat_routes = Blueprint("chat", __name__)
-load_dotenv()
 
-# Set up your Azure endpoint and API key (store these securely!)
-AZURE_ENDPOINT = os.getenv("AZURE_ENDPOINT")
-AZURE_OPENAI_API_KEY = os.getenv("AZURE_API_KEY")
-AZURE_DEPLOYMENT = os.getenv("DEPLOYMENT_NAME")
 
-client = AzureOpenAI(
-    azure_endpoint=AZURE_ENDPOINT,
-    api_key=AZURE_OPENAI_API_KEY,
-    api_version="2024-05-01-preview",
-)
+def sse_event(data, event=None):
+    """
+    Formats a server-sent event with a JSON payload.
+    """
+    message = f"data: {json.dumps(data)}\n\n"
+    if event is not None:
+        message = f"event: {event}\n" + message
+    return message
+
+
+def chat_error_status(error):
+    """
+    Maps a failed model call to an error message and status code: 503 when
+    every chat slot is busy, 504 on timeout and 502 for other model errors.
+    """
+    if isinstance(error, ChatBusyError):
+        return str(error), 503
+    if isinstance(error, TimeoutError):
+        return "The chat model timed out", 504
+    return str(error), 502
+
+
+def chat_error(error):
+    """
+    Builds the error response of a failed model call.
+    """
+    message, status_code = chat_error_status(error)
+    return jsonify({"error": message}), status_code
+
 
 @chat_routes.route("/prompt", methods=["POST"])
 # @login_required
 def ask_chatbot():
-      # Initialize Azure OpenAI client with key-based authentication
-      data = request.get_json()
-      if not data or 'query' not in data:
-          return jsonify({"Error:" "No query provided!"}), 400
+    """
+    Answers a chat prompt. When the request body sets "stream" to true, or
+    the client accepts text/event-stream, tokens are relayed as server-sent
+    events while they are generated:
+        data: {"delta": "..."}   for each token
+        event: done              once the answer is complete
+        event: error             if generation fails midway
+
+    Answers are cached, so repeated questions from the same user are
+    answered without calling the model until their data changes. Served by
+    the ASGI app, the model call is deferred to its event loop.
+    """
+    data = request.get_json()
+    if not data or 'query' not in data:
+        return jsonify({"error": "No query provided!"}), 400
 
-      # Prepare the chat prompt
-      chat_prompt = [
+    # Prepare the chat prompt
+    chat_prompt = [
         {
             "role": "system",
             "content": "You are an AI assistant that helps people find information."
@@ -42,54 +84,94 @@ def ask_chatbot():
             "role": "user",
             "content": data["query"]
         }
-      ]
-
-      # Generate the completion
-      completion = client.chat.completions.create(
-          model=AZURE_DEPLOYMENT,
-          messages=chat_prompt,
-          max_tokens=800,
-          temperature=0.7,
-          top_p=0.95,
-          frequency_penalty=0,
-          presence_penalty=0,
-          stop=None,
-          stream=False
-      )
-      completion_json = json.loads(completion.to_json())
-      content = completion_json["choices"][0]["message"]["content"]
-      return jsonify({"response": content})
+    ]
 
+    streaming = data.get("stream") is True or (
+        request.accept_mimetypes.best == "text/event-stream")
 
-@chat_routes.route("/insights", methods=["GET"])
-@login_required
-def get_insights():
-    """
-    Fetch transaction data, update the global PandasAI agent, and process the hardcoded prompt.
-    """
-    # Step 1: Fetch transaction data
-    transactions = Query().get_transactions(response_type="list")
+    # Answers are cached per user and data version
+    cache = current_app.extensions["prompt_cache"]
+    user_id = session.get("user", {}).get("_id")
+    scope = f"{user_id}:{get_data_version(user_id) if user_id else None}"
+    answer = cache.get(scope, data["query"])
 
-    if not transactions:
-        return jsonify({"error": "No transaction data available"}), 404
-    print(transactions)
+    if answer is None and chat_deferred():
+        return defer_chat(
+            chat_prompt, stream=streaming,
+            on_answer=lambda full: cache.set(scope, data["query"], full))
+
+    if not streaming:
+        if answer is None:
+            # Generate the completion
+            try:
+                answer = complete_chat(chat_prompt)
+            except Exception as e:
+                return chat_error(e)
+            cache.set(scope, data["query"], answer)
+        return jsonify({"response": answer})
+
+    if answer is not None:
+        deltas = iter([answer])
+    else:
+        try:
+            deltas = stream_chat(chat_prompt)
+        except Exception as e:
+            return chat_error(e)
 
-    transactions_df = pd.DataFrame(transactions)
-    transactions_df['amount'] = pd.to_numeric(transactions_df['amount'], errors='coerce')
-    transactions_df['transaction_date'] = pd.to_datetime(transactions_df['transaction_date'], errors='coerce')
+    def events():
+        parts = []
+        try:
+            for delta in deltas:
+                parts.append(delta)
+                yield sse_event({"delta": delta})
+        except Exception as e:
+            yield sse_event({"error": str(e)}, event="error")
+            return
+        if answer is None:
+            cache.set(scope, data["query"], "".join(parts))
+        yield sse_event({}, event="done")
 
-    if transactions_df.empty:
-        return jsonify({"error": "Transaction data is empty"}), 404
+    return Response(
+        stream_with_context(events()),
+        mimetype="text/event-stream",
+        # Proxies must not buffer the stream
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
 
-    agent = Agent([transactions_df])
 
-    # Step 4: Hardcoded prompt for insights
+@chat_routes.route("/insights", methods=["GET"])
+@login_required
+def get_insights():
+    """
+    Generate spending insights for the logged-in user from a statistical
+    summary of their transactions. Insights are regenerated only after the
+    user's transactions change.
+    """
+    user_id = session["user"]["_id"]
     prompt = "Give me general trends about my spending data including details about the category!"
+    insights_cache = current_app.extensions["insights_cache"]
+
+    if chat_deferred():
+        version = get_data_version(user_id)
+        entry, insights = insights_cache.lookup(
+            get_db(), user_id, version, prompt)
+        if entry["context"] is None:
+            return jsonify({"error": "No transaction data available"}), 404
+        if insights is not None:
+            return jsonify({"insights": insights}), 200
+        return defer_chat(
+            insights_messages(entry["context"], prompt), field="insights",
+            on_answer=lambda answer: insights_cache.store(entry, prompt, answer),
+            key=("insights", user_id, version, prompt))
 
-    # Step 5: Use the global agent to analyze the data
     try:
-        insights = agent.chat(prompt)
-        print(insights)
-        return jsonify({"insights": insights}), 200
+        insights = insights_cache.get_insights(
+            get_db(), user_id, get_data_version(user_id), prompt, complete_chat)
+    except (ChatBusyError, TimeoutError) as e:
+        return chat_error(e)
     except Exception as e:
         return jsonify({"error": str(e)}), 500
+
+    if insights is None:
+        return jsonify({"error": "No transaction data available"}), 404
+    return jsonify({"insights": insights}), 200
@@ -1,40 +1,70 @@
 from flask import Blueprint
 
+from utils.cache import cached_query
+from utils.compression import compress_response
 from utils.decorators import login_required
 from utils.query import Query
 
 query_routes = Blueprint("query", __name__)
+query_routes.after_request(compress_response)
 
 
 @query_routes.route("/transactions", methods=["GET"])
 @login_required
+@cached_query
 def get_all_transactions():
     return Query().get_transactions()
 
 
+@query_routes.route("/transactions/export", methods=["GET"])
+@login_required
+def export_transactions():
+    return Query().export_transactions()
+
+
 @query_routes.route("/transactions/category", methods=["POST"])
 @login_required
+@cached_query
 def get_transactions_by_category():
     return Query().get_by_category()
 
 
 @query_routes.route("/transactions/amount", methods=["POST"])
 @login_required
+@cached_query
 def get_transactions_by_amount():
     return Query().get_by_amount_range()
 
 
 @query_routes.route("/transactions/date", methods=["POST"])
 @login_required
+@cached_query
 def get_transactions_by_date():
     return Query().get_by_date_range()
 
+
+@query_routes.route("/transactions/search", methods=["GET", "POST"])
+@login_required
+@cached_query
+def search_transactions():
+    return Query().search_transactions()
+
+
 @query_routes.route("/transactions/category", methods=["GET"])
 @login_required
+@cached_query
 def get_transaction_categories():
     return Query().get_categories()
 
 @query_routes.route("/transactions/totals", methods=["GET"])
 @login_required
+@cached_query
 def get_transaction_totals():
     return Query().get_transaction_totals()
+
+
+@query_routes.route("/transactions/series", methods=["GET"])
+@login_required
+@cached_query
+def get_spending_series():
+    return Query().get_spending_series()
@@ -1,10 +1,8 @@
-import os
-
-from flask import Blueprint, current_app, jsonify, request
-from werkzeug.utils import secure_filename
+from flask import Blueprint, current_app, jsonify, request, session, url_for
 
 from utils.decorators import login_required
-from utils.upload import Upload
+from utils.jobs import get_job
+from utils.upload import MultipartFileStream
 
 upload_routes = Blueprint("upload", __name__)
 
@@ -14,25 +12,57 @@ upload_routes = Blueprint("upload", __name__)
 def upload():
     """
     Upload route for processing a CSV file.
-    This route accepts a file upload directly.
+    This route accepts either a multipart file upload or a raw request body
+    sent with a text/csv content type, both read as a stream. The CSV is
+    queued for background ingestion and its progress can be polled on
+    /upload/status/<job_id>.
 
     Returns:
-        JSON response indicating success or failure of the upload process.
+        JSON response with the ingestion job ID, or an error.
     """
-    # Validate the file
-    if "file" not in request.files:
+    if request.mimetype == "text/csv":
+        stream = request.stream
+    elif request.mimetype == "multipart/form-data":
+        # Decoded while it is read instead of through request.files, which
+        # parses and spools the whole body first
+        boundary = request.mimetype_params.get("boundary")
+        if not boundary:
+            return jsonify({"error": "Missing multipart boundary"}), 400
+        stream = MultipartFileStream(request.stream, boundary)
+        try:
+            found = stream.open()
+        except ValueError:
+            return jsonify({"error": "Malformed multipart body"}), 400
+        # Validate the file
+        if not found:
+            return jsonify({"error": "No file part"}), 400
+        if stream.filename == "":
+            return jsonify({"error": "No selected file"}), 400
+    else:
         return jsonify({"error": "No file part"}), 400
-    file = request.files["file"]
-    if file.filename == "":
-        return jsonify({"error": "No selected file"}), 400
 
-    # Save the file to the flask upload folder
-    filename = secure_filename(file.filename)  # Secure the file name
-    file_path = os.path.join(current_app.config["UPLOAD_FOLDER"], filename)
-    file.save(file_path)  # Save the file to the upload folder
+    # Queue the CSV stream for ingestion
+    job_id = current_app.extensions["ingest_queue"].submit(
+        stream, session["user"]["_id"])
+
+    return jsonify({
+        "message": "File uploaded and queued for processing",
+        "job_id": job_id,
+        "status_url": url_for("upload.upload_status", job_id=job_id),
+    }), 202
 
-    # Process the CSV file
-    Upload().process_csv(file_path)
 
-    return jsonify(
-        {"message": "File uploaded and processed successfully!"}), 200
+@upload_routes.route("/status/<job_id>", methods=["GET"])
+@login_required
+def upload_status(job_id):
+    """
+    Reports the progress of an ingestion job owned by the current user:
+    its status, rows processed, rows rejected and throughput.
+
+    Returns:
+        JSON response with the job status, or 404 if the job is unknown.
+    """
+    job = get_job(job_id, session["user"]["_id"])
+    if job is None:
+        return jsonify({"error": "Job not found"}), 404
+    return jsonify(job), 200
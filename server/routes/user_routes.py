@@ -36,6 +36,17 @@ def signout():
     return User().signout()
 
 
+@user_routes.route("/signout/all")
+@login_required
+def signout_all():
+    """
+    Handle requests to sign out of every session.
+    Calls the signout_all method from the User model to revoke all of the
+    user's sessions.
+    """
+    return User().signout_all()
+
+
 @user_routes.route("/wipe", methods=["POST"])
 @login_required
 def wipe():
@@ -0,0 +1,115 @@
+import time
+import unittest
+
+from flask import jsonify, session
+
+from app import app
+from utils.cache import MemoryCache, QueryCache
+
+
+class QueryCacheTest(unittest.TestCase):
+    """
+    QueryCacheTest verifies LRU/TTL eviction of the in-process cache and
+    per-user invalidation through the data version stored with the user.
+    """
+
+    def setUp(self):
+        self.calls = 0
+        # Data versions, as stored on the users' documents
+        self.versions = {"cache_user": 0, "other_user": 0}
+        self.cache = QueryCache(
+            MemoryCache(max_entries=2, ttl=60), get_version=self.versions.get)
+
+        @self.cache.cached
+        def view():
+            self.calls += 1
+            return jsonify({"calls": self.calls})
+
+        self.view = view
+
+    def request(self, user_id="cache_user", headers=None, **query_string):
+        with app.test_request_context(
+                query_string=query_string, headers=headers):
+            session["user"] = {"_id": user_id}
+            return self.view()
+
+    def test_hit_and_invalidate(self):
+        """
+        Test that a repeated request is served from the cache until the
+        user's data version is bumped, and that users do not share entries.
+        """
+        self.assertEqual(self.request().headers["X-Cache"], "MISS")
+        response = self.request()
+        self.assertEqual(response.headers["X-Cache"], "HIT")
+        self.assertEqual(response.json, {"calls": 1})
+
+        self.assertEqual(self.request("other_user").json, {"calls": 2})
+        self.assertEqual(self.request(limit=5).json, {"calls": 3})
+
+        self.versions["cache_user"] += 1
+        self.assertEqual(self.request().json, {"calls": 4})
+        stats = self.cache.stats()
+        self.assertEqual((stats["hits"], stats["misses"]), (1, 4))
+
+        # Without a known data version, responses are not cached
+        self.assertEqual(self.request("unknown_user").json, {"calls": 5})
+        self.assertEqual(self.request("unknown_user").json, {"calls": 6})
+
+    def test_not_modified(self):
+        """
+        Test that a request revalidating the current ETag gets a 304 without
+        running the view, and that invalidation changes the ETag.
+        """
+        etag = self.request().headers["ETag"]
+        self.assertEqual(
+            self.request(headers={"If-None-Match": etag}).status_code, 304)
+        # Compressed variants of the response revalidate too
+        gzip_etag = etag[:-1] + '-gzip"'
+        response = self.request(headers={"If-None-Match": gzip_etag})
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response.headers["ETag"], gzip_etag)
+        self.assertEqual(self.calls, 1)
+
+        self.versions["cache_user"] += 1
+        response = self.request(headers={"If-None-Match": etag})
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response.headers["ETag"], etag)
+        self.assertEqual(self.cache.stats()["not_modified"], 2)
+
+    def test_namespace(self):
+        """
+        Test that an ETag from another response schema or build is not
+        answered with a 304.
+        """
+        etag = self.request().headers["ETag"]
+        self.cache = QueryCache(
+            self.cache.backend, get_version=self.versions.get,
+            namespace="3.new-build")
+        self.view = self.cache.cached(self.view.__wrapped__)
+        response = self.request(headers={"If-None-Match": etag})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.headers["X-Cache"], "MISS")
+        self.assertNotEqual(response.headers["ETag"], etag)
+
+    def test_lru_eviction(self):
+        """
+        Test that the least recently used entry is evicted first.
+        """
+        backend = MemoryCache(max_entries=2, ttl=60)
+        backend.set("a", 1)
+        backend.set("b", 2)
+        backend.get("a")
+        backend.set("c", 3)
+        self.assertIsNone(backend.get("b"))
+        self.assertEqual(backend.get("a"), 1)
+        self.assertEqual(backend.stats()["evictions"], 1)
+
+    def test_ttl_expiry(self):
+        backend = MemoryCache(ttl=0)
+        backend.set("a", 1)
+        time.sleep(0.01)
+        self.assertIsNone(backend.get("a"))
+
+
+if __name__ == "__main__":
+    unittest.main()
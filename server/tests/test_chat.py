@@ -0,0 +1,333 @@
+import asyncio
+import json
+import threading
+import time
+import unittest
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from openai import AsyncAzureOpenAI
+
+from app import app
+from asgi import application
+from utils.llm import ChatBusyError, LLMRunner
+from utils.prompt_cache import PromptCache
+
+ANSWER_TOKENS = ["Hello", ", ", "world", "!"]
+
+
+class FakeOpenAIHandler(BaseHTTPRequestHandler):
+    """
+    Minimal OpenAI-compatible chat completions endpoint that answers every
+    request with ANSWER_TOKENS, streamed as server-sent events when asked.
+    """
+
+    requests = 0
+    delay = 0  # Seconds before answering, and between streamed tokens
+
+    def do_POST(self):
+        FakeOpenAIHandler.requests += 1
+        body = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+        time.sleep(self.delay)
+        if not body.get("stream"):
+            self.send_json({
+                "id": "chatcmpl-test",
+                "object": "chat.completion",
+                "created": 0,
+                "model": body["model"],
+                "choices": [{
+                    "index": 0,
+                    "finish_reason": "stop",
+                    "message": {"role": "assistant",
+                                "content": "".join(ANSWER_TOKENS)},
+                }],
+            })
+            return
+
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.end_headers()
+        # Azure starts with a chunk holding only content filter results
+        chunks = [{"choices": []}] + [
+            {"choices": [{"index": 0, "delta": {"content": token},
+                          "finish_reason": None}]}
+            for token in ANSWER_TOKENS
+        ]
+        for chunk in chunks:
+            time.sleep(self.delay)
+            chunk.update({"id": "chatcmpl-test", "object": "chat.completion.chunk",
+                          "created": 0, "model": body["model"]})
+            try:
+                self.wfile.write(
+                    f"data: {json.dumps(chunk)}\n\n".encode("utf-8"))
+                self.wfile.flush()
+            except ConnectionError:
+                return  # The client cancelled the stream
+        self.wfile.write(b"data: [DONE]\n\n")
+
+    def send_json(self, payload):
+        data = json.dumps(payload).encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def parse_events(body):
+    """
+    Splits a server-sent event stream into (event, data) pairs.
+    """
+    events = []
+    for block in body.strip().split("\n\n"):
+        fields = dict(line.split(": ", 1) for line in block.split("\n"))
+        events.append((fields.get("event", "message"), json.loads(fields["data"])))
+    return events
+
+
+def make_runner(server, **options):
+    """
+    Creates an LLMRunner whose client talks to a fake server.
+    """
+    return LLMRunner(
+        lambda: AsyncAzureOpenAI(
+            azure_endpoint=f"http://127.0.0.1:{server.server_port}",
+            api_key="test",
+            api_version=app.config["AZURE_API_VERSION"],
+        ),
+        "test-deployment",
+        **options,
+    )
+
+
+class ChatPromptTest(unittest.TestCase):
+    """
+    ChatPromptTest runs /chat/prompt against a local fake OpenAI server.
+    """
+
+    @classmethod
+    def setUpClass(cls):
+        """
+        Start the fake server and point the app's chat client at it.
+        """
+        cls.server = ThreadingHTTPServer(("127.0.0.1", 0), FakeOpenAIHandler)
+        threading.Thread(target=cls.server.serve_forever, daemon=True).start()
+        cls.original_client = app.extensions["llm"]
+        app.extensions["llm"] = make_runner(cls.server)
+
+    @classmethod
+    def tearDownClass(cls):
+        app.extensions["llm"] = cls.original_client
+        cls.server.shutdown()
+        cls.server.server_close()
+
+    def setUp(self):
+        self.app = app.test_client()
+        self.original_cache = app.extensions["prompt_cache"]
+        app.extensions["prompt_cache"] = PromptCache()
+        FakeOpenAIHandler.requests = 0
+
+    def tearDown(self):
+        app.extensions["prompt_cache"] = self.original_cache
+
+    def test_prompt(self):
+        response = self.app.post("/chat/prompt", json={"query": "Hi"})
+        self.assertEqual(response.json, {"response": "Hello, world!"})
+
+    def test_stream(self):
+        """
+        Test that tokens are relayed as SSE deltas followed by a done event.
+        """
+        response = self.app.post(
+            "/chat/prompt", json={"query": "Hi", "stream": True})
+        self.assertEqual(response.mimetype, "text/event-stream")
+
+        events = parse_events(response.get_data(as_text=True))
+        self.assertEqual(
+            [data["delta"] for event, data in events[:-1]], ANSWER_TOKENS)
+        self.assertEqual(events[-1][0], "done")
+
+    def test_cached_answers(self):
+        """
+        Test that repeated prompts, streamed or not, are answered from the
+        cache without another model request.
+        """
+        self.app.post("/chat/prompt", json={"query": "How much on food?"})
+        response = self.app.post(
+            "/chat/prompt", json={"query": "how much on food"})
+        self.assertEqual(response.json, {"response": "Hello, world!"})
+
+        response = self.app.post(
+            "/chat/prompt", json={"query": "How much on food?", "stream": True})
+        events = parse_events(response.get_data(as_text=True))
+        self.assertEqual(events[0][1], {"delta": "Hello, world!"})
+        self.assertEqual(FakeOpenAIHandler.requests, 1)
+
+    def test_missing_query(self):
+        response = self.app.post("/chat/prompt", json={})
+        self.assertEqual(response.status_code, 400)
+
+
+def call_asgi(path, payload, disconnect_after=None):
+    """
+    Sends a POST request with a JSON body to the ASGI app.
+
+    Parameters:
+        path (str): Request path.
+        payload (dict): JSON body.
+        disconnect_after (int): Number of response body messages after
+            which the client disconnects, or None.
+
+    Returns:
+        tuple: (status code, response headers dict, body bytes)
+    """
+    async def run():
+        sent = []
+        disconnected = asyncio.Event()
+        messages = [{"type": "http.request",
+                     "body": json.dumps(payload).encode("utf-8")}]
+
+        async def receive():
+            if messages:
+                return messages.pop(0)
+            await disconnected.wait()
+            return {"type": "http.disconnect"}
+
+        async def send(message):
+            sent.append(message)
+            bodies = [m for m in sent if m["type"] == "http.response.body"]
+            if disconnect_after is not None and len(bodies) >= disconnect_after:
+                disconnected.set()
+
+        scope = {
+            "type": "http", "method": "POST", "path": path, "root_path": "",
+            "query_string": b"", "http_version": "1.1", "scheme": "http",
+            "server": ("testserver", 80), "client": ("127.0.0.1", 50000),
+            "headers": [(b"content-type", b"application/json")],
+        }
+        await application(scope, receive, send)
+        return sent
+
+    sent = asyncio.run(run())
+    headers = {name.decode(): value.decode() for name, value in sent[0]["headers"]}
+    body = b"".join(m.get("body", b"") for m in sent[1:])
+    return sent[0]["status"], headers, body
+
+
+class ASGIChatTest(unittest.TestCase):
+    """
+    ASGIChatTest runs /chat/prompt through the ASGI app, which awaits the
+    model call on its event loop.
+    """
+
+    @classmethod
+    def setUpClass(cls):
+        cls.server = ThreadingHTTPServer(("127.0.0.1", 0), FakeOpenAIHandler)
+        threading.Thread(target=cls.server.serve_forever, daemon=True).start()
+        cls.original_client = app.extensions["llm"]
+
+    @classmethod
+    def tearDownClass(cls):
+        app.extensions["llm"] = cls.original_client
+        FakeOpenAIHandler.delay = 0
+        cls.server.shutdown()
+        cls.server.server_close()
+
+    def setUp(self):
+        app.extensions["llm"] = self.runner = make_runner(self.server)
+        self.original_cache = app.extensions["prompt_cache"]
+        app.extensions["prompt_cache"] = PromptCache()
+        FakeOpenAIHandler.requests = 0
+        FakeOpenAIHandler.delay = 0
+
+    def tearDown(self):
+        app.extensions["prompt_cache"] = self.original_cache
+
+    def test_prompt(self):
+        status, headers, body = call_asgi("/chat/prompt", {"query": "Hi"})
+        self.assertEqual(status, 200)
+        self.assertEqual(json.loads(body), {"response": "Hello, world!"})
+        # The answer is cached like on the WSGI path
+        call_asgi("/chat/prompt", {"query": "hi"})
+        self.assertEqual(FakeOpenAIHandler.requests, 1)
+
+    def test_stream(self):
+        status, headers, body = call_asgi(
+            "/chat/prompt", {"query": "Hi", "stream": True})
+        self.assertEqual(headers["content-type"], "text/event-stream")
+        events = parse_events(body.decode("utf-8"))
+        self.assertEqual(
+            [data["delta"] for event, data in events[:-1]], ANSWER_TOKENS)
+        self.assertEqual(events[-1][0], "done")
+
+    def test_disconnect(self):
+        """
+        Test that a client disconnecting mid-stream cancels the completion.
+        """
+        FakeOpenAIHandler.delay = 0.1
+        call_asgi("/chat/prompt", {"query": "Hi", "stream": True},
+                  disconnect_after=1)
+        stats = self.runner.stats()
+        self.assertEqual((stats["cancelled"], stats["in_flight"]), (1, 0))
+
+    def test_view_errors(self):
+        status, headers, body = call_asgi("/chat/prompt", {})
+        self.assertEqual(status, 400)
+        self.assertEqual(json.loads(body), {"error": "No query provided!"})
+
+
+class LLMRunnerTest(unittest.TestCase):
+    """
+    LLMRunnerTest verifies bounded concurrency, timeouts and cancellation
+    of chat completions against a slow fake OpenAI server.
+    """
+
+    @classmethod
+    def setUpClass(cls):
+        cls.server = ThreadingHTTPServer(("127.0.0.1", 0), FakeOpenAIHandler)
+        threading.Thread(target=cls.server.serve_forever, daemon=True).start()
+
+    @classmethod
+    def tearDownClass(cls):
+        FakeOpenAIHandler.delay = 0
+        cls.server.shutdown()
+        cls.server.server_close()
+
+    def setUp(self):
+        FakeOpenAIHandler.delay = 0.2
+
+    def test_busy(self):
+        """
+        Test that a chat is turned away when every slot stays taken.
+        """
+        runner = make_runner(self.server, max_concurrency=1, queue_timeout=0.05)
+        deltas = runner.stream([{"role": "user", "content": "Hi"}])
+        with self.assertRaises(ChatBusyError):
+            runner.complete([{"role": "user", "content": "Hi"}])
+        self.assertEqual("".join(deltas), "Hello, world!")
+        self.assertEqual(runner.stats()["rejected"], 1)
+        self.assertEqual(runner.stats()["in_flight"], 0)
+
+    def test_timeout(self):
+        runner = make_runner(self.server, timeout=0.05)
+        with self.assertRaises(TimeoutError):
+            runner.complete([{"role": "user", "content": "Hi"}])
+        self.assertEqual(runner.stats()["timeouts"], 1)
+
+    def test_cancel_on_close(self):
+        """
+        Test that closing a stream early, as a disconnecting client does,
+        cancels the completion and frees its slot.
+        """
+        runner = make_runner(self.server)
+        deltas = runner.stream([{"role": "user", "content": "Hi"}])
+        self.assertEqual(next(deltas), "Hello")
+        deltas.close()
+        stats = runner.stats()
+        self.assertEqual((stats["cancelled"], stats["in_flight"]), (1, 0))
+
+
+if __name__ == "__main__":
+    unittest.main()
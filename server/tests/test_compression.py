@@ -0,0 +1,49 @@
+import gzip
+import unittest
+
+from flask import jsonify
+
+from app import app
+from utils.compression import compress_response
+
+
+class CompressionTest(unittest.TestCase):
+    """
+    CompressionTest verifies content negotiation and the size threshold of
+    compress_response.
+    """
+
+    def respond(self, payload, accept_encoding="gzip, deflate"):
+        with app.test_request_context(
+                headers={"Accept-Encoding": accept_encoding}):
+            response = jsonify(payload)
+            response.set_etag("abc")
+            return compress_response(response)
+
+    def test_gzip(self):
+        payload = [{"category": "Gas", "amount": i} for i in range(200)]
+        response = self.respond(payload)
+        self.assertEqual(response.headers["Content-Encoding"], "gzip")
+        self.assertEqual(response.headers["ETag"], '"abc-gzip"')
+        self.assertIn("Accept-Encoding", response.headers["Vary"])
+        with app.app_context():
+            self.assertEqual(
+                gzip.decompress(response.get_data()),
+                jsonify(payload).get_data())
+
+    def test_small_response(self):
+        response = self.respond({"category": "Gas"})
+        self.assertNotIn("Content-Encoding", response.headers)
+        self.assertEqual(response.headers["ETag"], '"abc"')
+
+    def test_identity(self):
+        """
+        Test that clients that do not accept a supported coding get the
+        uncompressed body.
+        """
+        response = self.respond(list(range(1000)), accept_encoding="identity")
+        self.assertNotIn("Content-Encoding", response.headers)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,60 @@
+import gzip
+import json
+import unittest
+from datetime import datetime
+
+from utils.export import gzip_chunks, iter_csv, iter_ndjson
+
+
+class ExportTest(unittest.TestCase):
+    """
+    ExportTest verifies the streaming transaction export serializers.
+    """
+
+    def setUp(self):
+        self.transactions = [
+            {
+                "_id": f"export_{i}",
+                "transaction_date": datetime(2024, 9, 1 + i),
+                "description": "DOLLAR TREE, INC",
+                "category": "Shopping",
+                "amount": 1.29 * i,
+            }
+            for i in range(5)
+        ]
+
+    def test_ndjson(self):
+        """
+        Test that every transaction is written as one JSON object per line.
+        """
+        body = b"".join(iter_ndjson(iter(self.transactions)))
+        records = [json.loads(line) for line in body.decode().splitlines()]
+        self.assertEqual(len(records), 5)
+        self.assertEqual(records[1]["transaction_date"], "2024-09-02")
+        self.assertEqual(records[1]["description"], "DOLLAR TREE, INC")
+
+    def test_csv(self):
+        """
+        Test that the CSV export has a header row and quotes values that
+        contain commas. An empty export still has the header.
+        """
+        lines = b"".join(iter_csv(iter(self.transactions))).decode().splitlines()
+        self.assertEqual(
+            lines[0], "_id,transaction_date,description,category,amount")
+        self.assertEqual(len(lines), 6)
+        self.assertIn('"DOLLAR TREE, INC"', lines[1])
+
+        lines = b"".join(iter_csv(iter([]))).decode().splitlines()
+        self.assertEqual(len(lines), 1)
+
+    def test_gzip(self):
+        """
+        Test that compressed chunks decode to the original stream.
+        """
+        chunks = list(iter_ndjson(iter(self.transactions)))
+        compressed = b"".join(gzip_chunks(iter(chunks)))
+        self.assertEqual(gzip.decompress(compressed), b"".join(chunks))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -28,6 +28,18 @@ class FlaskStatusTest(unittest.TestCase):
         self.assertEqual(response.status_code, 200)
         self.assertEqual(response.json, {"message": "Application is running"})
 
+    def test_db_status(self):
+        """
+        Test the /status/db endpoint of the application.
+        Checks that pool counters are reported without opening a connection.
+        """
+        response = self.app.get("/status/db")
+        self.assertEqual(response.status_code, 200)
+        self.assertIn("connections_in_use", response.json)
+        self.assertIn("max_pool_size", response.json)
+        self.assertIn("index_failures", response.json)
+        self.assertIn("legacy_transaction_dates", response.json)
+
 
 if __name__ == "__main__":
     unittest.main()
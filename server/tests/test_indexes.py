@@ -0,0 +1,170 @@
+import os
+import unittest
+from datetime import datetime
+
+from flask import session
+from pymongo import MongoClient
+from pymongo.errors import OperationFailure
+
+from app import app
+from database.db import get_db_name
+from database.indexes import (
+    INDEXES,
+    QueryPlanRecorder,
+    ensure_indexes,
+    explain_collscans,
+    find_collscans,
+)
+from utils.query import Query
+
+
+class QueryPlanTest(unittest.TestCase):
+    """
+    QueryPlanTest replays every query issued by Query through explain() and
+    fails if any of them falls back to a collection scan.
+    """
+
+    @classmethod
+    def setUpClass(cls):
+        """
+        Connect with a command recorder, provision indexes and seed a user
+        with a few transactions.
+        """
+        os.environ["FLASK_ENV"] = "test"  # Use the test environment
+        cls.recorder = QueryPlanRecorder()
+        cls.client = MongoClient(
+            os.getenv("MONGO_URI", "mongodb://localhost:27017/"),
+            event_listeners=[cls.recorder],
+        )
+        cls.db = cls.client[get_db_name()]
+        ensure_indexes(cls.db)
+
+        cls.user_id = "query_plan_user"
+        cls.db["transactions"].insert_many([
+            {
+                "_id": f"query_plan_{day}",
+                "user_id": cls.user_id,
+                "transaction_date": datetime(2024, 9, day),
+                "year": 2024,
+                "month": 9,
+                "description": "DOLLAR TREE",
+                "category": "Shopping",
+                "amount": float(day),
+            }
+            for day in range(1, 11)
+        ])
+
+    @classmethod
+    def tearDownClass(cls):
+        """
+        Remove seeded transactions and close the client.
+        """
+        cls.db["transactions"].delete_many({"user_id": cls.user_id})
+        cls.client.close()
+
+    def assertNoCollscan(self, method, json=None):
+        """
+        Runs a Query method inside a request for the seeded user and asserts
+        that none of the commands it issued used a COLLSCAN.
+        """
+        self.recorder.clear()
+        with app.test_request_context(method="POST", json=json or {}):
+            session["user"] = {"_id": self.user_id}
+            method(Query(self.db))
+        self.assertTrue(self.recorder.commands)
+        self.assertEqual(
+            explain_collscans(self.client, self.recorder.commands), [])
+
+    def test_get_transactions(self):
+        self.assertNoCollscan(Query.get_transactions)
+
+    def test_get_by_category(self):
+        self.assertNoCollscan(
+            Query.get_by_category, json={"category": "Shopping"})
+
+    def test_get_by_amount_range(self):
+        self.assertNoCollscan(
+            Query.get_by_amount_range,
+            json={"min_amount": 2, "max_amount": 5},
+        )
+
+    def test_get_by_date_range(self):
+        self.assertNoCollscan(
+            Query.get_by_date_range,
+            json={"start_date": "2024-09-01", "end_date": "2024-09-05"},
+        )
+
+    def test_search_transactions(self):
+        self.assertNoCollscan(
+            Query.search_transactions,
+            json={"min_amount": 2, "max_amount": 5, "sort": "-amount"},
+        )
+        self.assertNoCollscan(
+            Query.search_transactions,
+            json={"category": ["Shopping", "Travel"],
+                  "start_date": "2024-09-01", "description": "dollar"},
+        )
+
+    def test_get_categories(self):
+        self.assertNoCollscan(Query.get_categories)
+
+    def test_get_transaction_totals(self):
+        self.assertNoCollscan(Query.get_transaction_totals)
+
+
+class FailingIndexCollection:
+    """
+    Collection whose index creation fails for the users collection only.
+    """
+
+    def __init__(self, name):
+        self.name = name
+
+    def create_indexes(self, indexes):
+        if self.name == "users":
+            raise OperationFailure("E11000 duplicate key error")
+        return [index.document["name"] for index in indexes]
+
+
+class EnsureIndexesTest(unittest.TestCase):
+    """
+    EnsureIndexesTest verifies that a collection whose indexes fail does not
+    stop the others from being provisioned. It does not need a database.
+    """
+
+    def test_failure_is_isolated(self):
+        db = {name: FailingIndexCollection(name) for name in INDEXES}
+        created, failed = ensure_indexes(db)
+        self.assertEqual(set(failed), {"users"})
+        self.assertIn("duplicate key", failed["users"])
+        self.assertEqual(set(created), set(INDEXES) - {"users"})
+        self.assertIn("expires_at_ttl", created["ingest_locks"])
+
+
+class FindCollscansTest(unittest.TestCase):
+    """
+    FindCollscansTest verifies how explain() results are searched for
+    collection scans. It does not need a database.
+    """
+
+    def test_find_collscans_ignores_rejected_plans(self):
+        """
+        A COLLSCAN that only appears among rejected plans is not reported.
+        """
+        plan = {
+            "queryPlanner": {
+                "winningPlan": {
+                    "stage": "FETCH",
+                    "inputStage": {"stage": "IXSCAN"},
+                },
+                "rejectedPlans": [{"stage": "COLLSCAN"}],
+            }
+        }
+        self.assertEqual(find_collscans(plan), [])
+        plan["queryPlanner"]["winningPlan"]["inputStage"] = {
+            "stage": "COLLSCAN"}
+        self.assertEqual(len(find_collscans(plan)), 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
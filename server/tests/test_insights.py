@@ -0,0 +1,140 @@
+import os
+import threading
+import unittest
+from datetime import datetime
+
+from database.db import get_budgetai_db
+from utils.insights import InsightsCache, build_transactions_frame
+
+
+class CountingLLM:
+    """
+    Stands in for the chat completion call and records the messages sent.
+    """
+
+    def __init__(self):
+        self.calls = []
+
+    def __call__(self, messages):
+        self.calls.append(messages)
+        return f"Answer {len(self.calls)}"
+
+
+class InsightsCacheTest(unittest.TestCase):
+    """
+    InsightsCacheTest verifies that insights are reused until the user's
+    data version changes, and that only the summary is sent to the LLM.
+    """
+
+    user_id = "insights_user"
+
+    @classmethod
+    def setUpClass(cls):
+        """
+        Configure the test environment and seed a user's transactions.
+        """
+        os.environ["FLASK_ENV"] = "test"  # Use the test environment
+        cls.db, cls.client = get_budgetai_db()
+        cls.db["transactions"].insert_many([
+            {
+                "_id": f"insights_{i}",
+                "user_id": cls.user_id,
+                "transaction_date": datetime(2024, 9, 1 + i),
+                "year": 2024,
+                "month": 9,
+                "description": "DOLLAR TREE",
+                "category": "Shopping" if i % 2 else "Gas",
+                "amount": 1.5 * i,
+            }
+            for i in range(6)
+        ])
+
+    @classmethod
+    def tearDownClass(cls):
+        """
+        Remove seeded transactions and close the database connection.
+        """
+        cls.db["transactions"].delete_many({"user_id": cls.user_id})
+        cls.client.close()
+
+    def setUp(self):
+        self.llm = CountingLLM()
+        self.cache = InsightsCache()
+
+    def test_frame_dtypes(self):
+        df = build_transactions_frame(self.db, self.user_id)
+        self.assertEqual(
+            list(df.columns),
+            ["transaction_date", "description", "category", "amount"],
+        )
+        self.assertEqual(str(df["category"].dtype), "category")
+        self.assertEqual(str(df["amount"].dtype), "float32")
+
+    def test_reuse_until_version_changes(self):
+        """
+        Test that the LLM is only asked again after the data version
+        changes, and that users without transactions get None.
+        """
+        for _ in range(3):
+            insights = self.cache.get_insights(
+                self.db, self.user_id, 1, "Trends?", self.llm)
+        self.assertEqual(insights, "Answer 1")
+        self.assertEqual(len(self.llm.calls), 1)
+        self.assertIn('"transactions":6', self.llm.calls[0][0]["content"])
+        self.assertNotIn("insights_0", self.llm.calls[0][0]["content"])
+
+        self.cache.get_insights(self.db, self.user_id, 2, "Trends?", self.llm)
+        self.assertEqual(len(self.llm.calls), 2)
+
+        self.assertIsNone(self.cache.get_insights(
+            self.db, "no_such_user", 1, "Trends?", self.llm))
+
+    def test_concurrent_generation(self):
+        """
+        Test that concurrent requests for a prompt share one generation, and
+        that cached insights are served while it runs.
+        """
+        started, release = threading.Event(), threading.Event()
+
+        def slow_llm(messages):
+            started.set()
+            release.wait(5)
+            return self.llm(messages)
+
+        self.cache.get_insights(self.db, self.user_id, 1, "Cached?", self.llm)
+        results = []
+        threads = [
+            threading.Thread(target=lambda: results.append(
+                self.cache.get_insights(
+                    self.db, self.user_id, 1, "Trends?", slow_llm)))
+            for _ in range(3)
+        ]
+        for thread in threads:
+            thread.start()
+        self.assertTrue(started.wait(5))
+        cached = []
+        lookup = threading.Thread(target=lambda: cached.append(
+            self.cache.get_insights(
+                self.db, self.user_id, 1, "Cached?", self.llm)))
+        lookup.start()
+        lookup.join(1)
+        self.assertEqual(cached, ["Answer 1"])
+
+        release.set()
+        for thread in threads:
+            thread.join(5)
+        self.assertEqual(results, ["Answer 2"] * 3)
+        self.assertEqual(len(self.llm.calls), 2)
+
+    def test_ttl(self):
+        """
+        Test that expired insights are generated again at the same version.
+        """
+        cache = InsightsCache(ttl=0)
+        for _ in range(2):
+            cache.get_insights(self.db, self.user_id, 1, "Trends?", self.llm)
+        self.assertEqual(len(self.llm.calls), 2)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,87 @@
+import os
+import tempfile
+import unittest
+
+from app import app
+from utils.metrics import MetricsRegistry
+
+
+class MetricsRegistryTest(unittest.TestCase):
+    """
+    MetricsRegistryTest verifies the Prometheus text rendering of counters,
+    histograms and stats gauges.
+    """
+
+    def test_render(self):
+        registry = MetricsRegistry()
+        counter = registry.counter("test_total", "Test counter", ("kind",))
+        histogram = registry.histogram(
+            "test_seconds", "Test histogram", buckets=(0.1, 1))
+        registry.stats_gauges(
+            "test_pool", "Test pool", lambda: {"in_use": 3, "pid": "x"})
+
+        counter.inc(kind='a"b')
+        counter.inc(2, kind='a"b')
+        for value in (0.05, 0.5, 5):
+            histogram.observe(value)
+
+        lines = registry.render().splitlines()
+        self.assertIn("# TYPE test_total counter", lines)
+        self.assertIn('test_total{kind="a\\"b"} 3', lines)
+        self.assertIn('test_seconds_bucket{le="0.1"} 1', lines)
+        self.assertIn('test_seconds_bucket{le="1"} 2', lines)
+        self.assertIn('test_seconds_bucket{le="+Inf"} 3', lines)
+        self.assertIn("test_seconds_count 3", lines)
+        self.assertIn("test_pool_in_use 3", lines)
+        self.assertNotIn("test_pool_pid", "\n".join(lines))
+
+
+class MetricsEndpointTest(unittest.TestCase):
+    """
+    MetricsEndpointTest verifies route latency recording, the /metrics
+    endpoint and per-request profiling.
+    """
+
+    def setUp(self):
+        self.app = app.test_client()
+
+    def test_metrics(self):
+        self.app.get("/status")
+        response = self.app.get("/metrics")
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.content_type.startswith("text/plain"))
+
+        body = response.get_data(as_text=True)
+        self.assertRegex(
+            body,
+            r'budgetai_http_request_duration_seconds_count\{method="GET",'
+            r'route="/status",status="200"\} \d+')
+        self.assertIn("budgetai_mongo_pool_max_pool_size", body)
+        self.assertIn("budgetai_llm_in_flight", body)
+
+    def test_unmatched_route(self):
+        self.app.get("/no-such-page")
+        body = self.app.get("/metrics").get_data(as_text=True)
+        self.assertIn('route="unmatched",status="404"', body)
+
+    def test_profile(self):
+        """
+        Test that only requests asking for a profile are profiled, and only
+        while profiling is enabled.
+        """
+        with tempfile.TemporaryDirectory() as directory:
+            app.config.update(PROFILE_REQUESTS=True, PROFILE_DIR=directory)
+            try:
+                self.app.get("/status")
+                self.app.get("/status", headers={"X-Profile": "1"})
+            finally:
+                app.config["PROFILE_REQUESTS"] = False
+            self.app.get("/status", headers={"X-Profile": "1"})
+
+            profiles = os.listdir(directory)
+            self.assertEqual(len(profiles), 1)
+            self.assertTrue(profiles[0].endswith("-GET-status.prof"))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,236 @@
+import io
+import os
+import unittest
+import uuid
+from datetime import datetime
+
+from database.db import get_budgetai_db
+from database.leases import INGEST_LOCKS
+from database.migrations import (
+    TRANSACTION_DATES,
+    check_transaction_dates,
+    migrate_transaction_dates,
+    rekey_transactions,
+)
+from utils.upload import Upload
+
+
+class InterruptingCollection:
+    """
+    Wraps a collection, running a hook before each bulk write.
+    """
+
+    def __init__(self, collection, before_write):
+        self.collection = collection
+        self.before_write = before_write
+
+    def __getattr__(self, name):
+        return getattr(self.collection, name)
+
+    def bulk_write(self, operations, ordered=True):
+        self.before_write()
+        return self.collection.bulk_write(operations, ordered=ordered)
+
+
+class MigrateTransactionDatesTest(unittest.TestCase):
+    """
+    MigrateTransactionDatesTest verifies that legacy string dates are
+    rewritten in resumable batches, that invalid dates are skipped and that
+    every migrated user's data version is bumped, and that legacy
+    transactions are re-keyed to their content fingerprint.
+    """
+
+    user_id = "migration_user"
+
+    @classmethod
+    def setUpClass(cls):
+        """
+        Configure the test environment and database connection.
+        """
+        os.environ["FLASK_ENV"] = "test"  # Use the test environment
+        cls.db, cls.client = get_budgetai_db()
+
+    @classmethod
+    def tearDownClass(cls):
+        """
+        Close the database connection.
+        """
+        cls.client.close()
+
+    def setUp(self):
+        """
+        Seed legacy transactions in a collection of their own, so that other
+        tests' transactions are not migrated.
+        """
+        self.transactions = self.db["migration_test_transactions"]
+        self.migrations = self.db["migration_test_runs"]
+        self.totals = self.db["migration_test_totals"]
+        self.transactions.insert_many([
+            {"_id": f"migration_{day}", "user_id": self.user_id,
+             "transaction_date": f"09/{day:02d}/2024", "amount": -1.0}
+            for day in range(1, 6)
+        ] + [
+            {"_id": "migration_invalid", "user_id": self.user_id,
+             "transaction_date": "2024-09-31", "amount": -1.0},
+        ])
+        self.db["users"].insert_one({"_id": self.user_id, "data_version": 0})
+
+    def tearDown(self):
+        """
+        Remove the seeded transactions and user.
+        """
+        self.transactions.drop()
+        self.migrations.drop()
+        self.totals.drop()
+        self.db["users"].delete_one({"_id": self.user_id})
+
+    def migration_db(self, transactions=None):
+        return {
+            "transactions": transactions or self.transactions,
+            "users": self.db["users"],
+            "migrations": self.migrations,
+            "monthly_totals": self.totals,
+            INGEST_LOCKS: self.db[INGEST_LOCKS],
+        }
+
+    def data_version(self):
+        return self.db["users"].find_one({"_id": self.user_id})["data_version"]
+
+    def test_migrate(self):
+        result = migrate_transaction_dates(self.migration_db(), batch_size=2)
+        self.assertEqual(result, {"migrated": 5, "invalid": 1})
+
+        migrated = self.transactions.find_one({"_id": "migration_3"})
+        self.assertEqual(migrated["transaction_date"], datetime(2024, 9, 3))
+        self.assertEqual((migrated["year"], migrated["month"]), (2024, 9))
+        # Invalid dates are left for a person to fix
+        self.assertEqual(
+            self.transactions.find_one(
+                {"_id": "migration_invalid"})["transaction_date"],
+            "2024-09-31")
+        self.assertGreater(self.data_version(), 0)
+
+        # Nothing is left to migrate and the version is unchanged
+        version = self.data_version()
+        self.assertEqual(
+            migrate_transaction_dates(self.migration_db(), batch_size=2),
+            {"migrated": 0, "invalid": 1})
+        self.assertEqual(self.data_version(), version)
+
+    def test_resume(self):
+        writes = []
+
+        def interrupt():
+            writes.append(1)
+            if len(writes) == 2:
+                raise RuntimeError("Interrupted")
+
+        with self.assertRaises(RuntimeError):
+            migrate_transaction_dates(
+                self.migration_db(
+                    InterruptingCollection(self.transactions, interrupt)),
+                batch_size=2)
+        # The first batch was migrated, and its user's version bumped
+        self.assertEqual(
+            self.transactions.count_documents(
+                {"transaction_date": {"$type": "date"}}), 2)
+        self.assertEqual(self.data_version(), 1)
+
+        result = migrate_transaction_dates(self.migration_db(), batch_size=2)
+        self.assertEqual(result, {"migrated": 3, "invalid": 1})
+        self.assertEqual(
+            self.transactions.count_documents(
+                {"transaction_date": {"$type": "string"}}), 1)
+
+    def test_guarded_update(self):
+        def concurrent_edit():
+            # The date changes between the read and the migration's write
+            self.transactions.update_one(
+                {"_id": "migration_1"},
+                {"$set": {"transaction_date": "10/01/2024"}})
+
+        result = migrate_transaction_dates(
+            self.migration_db(
+                InterruptingCollection(self.transactions, concurrent_edit)),
+            batch_size=10)
+        self.assertEqual(result, {"migrated": 4, "invalid": 1})
+        # The concurrent change is not overwritten with the stale date
+        self.assertEqual(
+            self.transactions.find_one({"_id": "migration_1"})["transaction_date"],
+            "10/01/2024")
+
+    def test_check_transaction_dates(self):
+        """
+        Test that transactions left out of lists are counted until the
+        migration has run, and only unparseable dates after it.
+        """
+        db = self.migration_db()
+        self.assertEqual(check_transaction_dates(db), 6)
+        self.assertIsNone(self.migrations.find_one({"_id": TRANSACTION_DATES}))
+
+        migrate_transaction_dates(db)
+        self.assertEqual(check_transaction_dates(db), 1)
+
+        # Without legacy dates, the check records the migration as complete
+        self.migrations.drop()
+        self.transactions.delete_one({"_id": "migration_invalid"})
+        self.assertEqual(check_transaction_dates(db), 0)
+        self.assertEqual(
+            self.migrations.find_one({"_id": TRANSACTION_DATES})["invalid"], 0)
+
+    def seed_legacy(self, description, day, amount):
+        self.transactions.insert_one({
+            "_id": uuid.uuid4().hex, "user_id": self.user_id,
+            "transaction_date": datetime(2024, 9, day), "year": 2024,
+            "month": 9, "description": description, "category": "Shopping",
+            "amount": amount,
+        })
+
+    def test_rekey(self):
+        """
+        Test that legacy transactions are re-keyed so that re-uploading
+        their statement inserts nothing.
+        """
+        for _ in range(2):
+            self.seed_legacy("DOLLAR TREE", 30, 1.29)
+        self.seed_legacy("SHELL", 29, 30.0)
+        version = self.data_version()
+
+        db = self.migration_db()
+        self.assertEqual(
+            rekey_transactions(db, batch_size=2), {"rekeyed": 3, "users": 1})
+        self.assertEqual(self.data_version(), version + 1)
+        self.assertEqual(
+            self.transactions.count_documents(
+                {"rekeyed_from": {"$exists": True}}), 0)
+        # Re-keying again changes nothing
+        self.assertEqual(
+            rekey_transactions(db), {"rekeyed": 0, "users": 0})
+
+        csv = (
+            b"Transaction Date,Post Date,Description,Category,Type,Amount,Memo\n"
+            b"09/30/2024,10/01/2024,DOLLAR TREE,Shopping,Sale,-1.29,\n"
+            b"09/30/2024,10/01/2024,DOLLAR TREE,Shopping,Sale,-1.29,\n"
+            b"09/29/2024,09/30/2024,SHELL,Gas,Sale,-30.00,\n"
+        )
+        summary = Upload(db).process_stream(io.BytesIO(csv), self.user_id)
+        self.assertEqual((summary["inserted"], summary["duplicates"]), (0, 3))
+
+    def test_rekey_resume(self):
+        """
+        Test that a copy left by an interrupted run replaces its original.
+        """
+        self.seed_legacy("SHELL", 29, 30.0)
+        original = self.transactions.find_one({"description": "SHELL"})
+        self.transactions.insert_one(
+            {**original, "_id": "copy", "rekeyed_from": original["_id"]})
+
+        rekey_transactions(self.migration_db())
+        documents = list(self.transactions.find({"description": "SHELL"}))
+        self.assertEqual(len(documents), 1)
+        self.assertNotIn("rekeyed_from", documents[0])
+        self.assertNotEqual(documents[0]["_id"], original["_id"])
+
+
+if __name__ == "__main__":
+    unittest.main()
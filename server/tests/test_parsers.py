@@ -0,0 +1,98 @@
+import io
+import unittest
+from datetime import datetime
+
+import pandas as pd
+
+from utils.parsers import (
+    ChaseFormat,
+    DebitCreditFormat,
+    SignedAmountFormat,
+    UnsupportedFormatError,
+    detect_format,
+    normalize_column,
+)
+
+
+def read_chunk(csv_text):
+    """
+    Reads CSV text the way Upload.process_stream does.
+    """
+    chunk = pd.read_csv(
+        io.StringIO(csv_text), dtype=str, keep_default_na=False)
+    chunk.columns = [normalize_column(column) for column in chunk.columns]
+    return chunk
+
+
+class ParserTest(unittest.TestCase):
+    """
+    ParserTest verifies bank format detection from CSV headers and the
+    vectorized parsing of each format.
+    """
+
+    def test_detect_format(self):
+        """
+        Test that each layout is recognized from its header, regardless of
+        case and surrounding whitespace.
+        """
+        self.assertIsInstance(
+            detect_format(["Transaction Date", "Post Date", "Description",
+                           "Category", "Type", "Amount", "Memo"]),
+            ChaseFormat,
+        )
+        self.assertIsInstance(
+            detect_format([" date", "DESCRIPTION", "Debit", "Credit"]),
+            DebitCreditFormat,
+        )
+        self.assertIsInstance(
+            detect_format(["Date", "Description", "Amount"]),
+            SignedAmountFormat,
+        )
+        with self.assertRaises(UnsupportedFormatError):
+            detect_format(["Foo", "Bar"])
+
+    def test_parse_chase(self):
+        """
+        Test that only valid 'Sale' rows are accepted, with the amount sign
+        flipped, and that every rejected row gets a reason.
+        """
+        chunk = read_chunk(
+            "Transaction Date,Post Date,Description,Category,Type,Amount,Memo\n"
+            "09/30/2024,10/01/2024,DOLLAR TREE,Shopping,Sale,-1.29,\n"
+            "09/30/2024,09/30/2024,Payment Thank You-Mobile,,Payment,1.29,\n"
+            "13/45/2024,09/29/2024,MTA*NYCT PAYGO,Travel,Sale,-2.90,\n"
+            "09/28/2024,09/29/2024,MTA*NYCT PAYGO,Travel,Sale,abc,\n"
+        )
+        parsed, reasons = ChaseFormat().parse(chunk)
+
+        self.assertEqual(len(parsed), 1)
+        self.assertEqual(
+            parsed["transaction_date"].iloc[0], datetime(2024, 9, 30))
+        self.assertEqual(parsed["description"].iloc[0], "DOLLAR TREE")
+        self.assertEqual(parsed["category"].iloc[0], "Shopping")
+        self.assertAlmostEqual(parsed["amount"].iloc[0], 1.29)
+
+        self.assertEqual(list(reasons.index), [1, 2, 3])
+        self.assertIn("Only 'Sale' transactions", reasons[1])
+        self.assertIn("Invalid transaction date", reasons[2])
+        self.assertIn("Malformed amount", reasons[3])
+
+    def test_parse_debit_credit(self):
+        """
+        Test that debits are imported as spending and credit rows skipped.
+        """
+        chunk = read_chunk(
+            "Date,Description,Debit,Credit\n"
+            "2024-01-05,COFFEE,4.50,\n"
+            "2024-01-06,RENT,\"$1,200.00\",\n"
+            "2024-01-07,PAYMENT,,100.00\n"
+        )
+        parsed, reasons = DebitCreditFormat().parse(chunk)
+
+        self.assertEqual(list(parsed["amount"]), [4.5, 1200.0])
+        self.assertEqual(list(parsed["category"]), ["Uncategorized"] * 2)
+        self.assertEqual(list(reasons.index), [2])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,99 @@
+import threading
+import unittest
+
+from passlib.hash import pbkdf2_sha256
+
+from utils.passwords import AuthThrottle, PasswordHasher, PasswordHasherBusyError
+
+
+class PasswordHasherTest(unittest.TestCase):
+    """
+    PasswordHasherTest verifies hashing in the process pool, rehash detection
+    and rejection when the pool is full.
+    """
+
+    @classmethod
+    def setUpClass(cls):
+        cls.hasher = PasswordHasher(rounds=1000, max_workers=1)
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.hasher.executor.shutdown()
+
+    def test_hash_and_verify(self):
+        hashed = self.hasher.hash("password123")
+        self.assertEqual(pbkdf2_sha256.from_string(hashed).rounds, 1000)
+        self.assertTrue(self.hasher.verify("password123", hashed))
+        self.assertFalse(self.hasher.verify("wrongpassword", hashed))
+
+    def test_start_method(self):
+        """
+        Test that workers are not forked from the threaded server process.
+        """
+        self.assertNotEqual(
+            self.hasher.executor._mp_context.get_start_method(), "fork")
+
+    def test_needs_update(self):
+        """
+        Test that hashes made with another work factor are flagged for
+        rehashing.
+        """
+        self.assertFalse(self.hasher.needs_update(self.hasher.hash("password123")))
+        self.assertTrue(self.hasher.needs_update(
+            pbkdf2_sha256.using(rounds=2000).hash("password123")))
+
+    def test_busy(self):
+        hasher = PasswordHasher(max_workers=0, max_pending=1)
+        started, release = threading.Event(), threading.Event()
+
+        def slow(password):
+            started.set()
+            release.wait()
+            return password
+
+        thread = threading.Thread(target=hasher._run, args=(slow, "a"))
+        thread.start()
+        started.wait()
+        with self.assertRaises(PasswordHasherBusyError):
+            hasher.hash("password123")
+        release.set()
+        thread.join()
+        self.assertEqual(hasher.stats()["rejected"], 1)
+
+
+class AuthThrottleTest(unittest.TestCase):
+    """
+    AuthThrottleTest verifies the per-IP and per-email sliding windows.
+    """
+
+    def setUp(self):
+        self.now = 0
+        self.throttle = AuthThrottle(
+            ip_limit=3, email_limit=2, window=60, clock=lambda: self.now)
+
+    def test_ip_limit(self):
+        for _ in range(3):
+            self.assertIsNone(self.throttle.attempt("10.0.0.1"))
+        self.assertEqual(self.throttle.attempt("10.0.0.1"), 61)
+        self.assertIsNone(self.throttle.attempt("10.0.0.2"))
+
+        # The window slides past the first attempts
+        self.now = 60
+        self.assertIsNone(self.throttle.attempt("10.0.0.1"))
+
+    def test_failed_logins(self):
+        """
+        Test that only failed logins count against an email, and that a
+        successful login clears them.
+        """
+        self.throttle.failed("User@example.com")
+        self.assertIsNone(self.throttle.blocked("user@example.com"))
+        self.throttle.succeeded("user@example.com")
+        self.throttle.failed("user@example.com")
+        self.assertIsNone(self.throttle.blocked("user@example.com"))
+        self.throttle.failed("user@example.com")
+        self.assertIsNotNone(self.throttle.blocked("user@example.com"))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,60 @@
+import unittest
+
+import numpy as np
+
+from utils.prompt_cache import PromptCache, normalize_prompt
+
+VOCABULARY = ["spend", "spent", "food", "gas", "month", "last"]
+
+
+def bag_of_words(text):
+    """
+    Tiny deterministic embedding for tests, with "spend" and "spent"
+    sharing a dimension.
+    """
+    words = normalize_prompt(text).replace("spent", "spend").split()
+    vector = np.array(
+        [words.count(word) for word in VOCABULARY], dtype="float32")
+    return vector / (np.linalg.norm(vector) or 1.0)
+
+
+class PromptCacheTest(unittest.TestCase):
+    """
+    PromptCacheTest verifies exact and semantic lookups, scoping and LRU
+    eviction of cached chat answers.
+    """
+
+    def test_exact_match(self):
+        cache = PromptCache()
+        cache.set("user:1", "How much did I spend on food?", "About $200.")
+        self.assertEqual(
+            cache.get("user:1", "  how much did I spend on FOOD "), "About $200.")
+        self.assertIsNone(cache.get("user:2", "How much did I spend on food?"))
+        self.assertEqual(cache.stats()["exact_hits"], 1)
+        self.assertEqual(cache.stats()["misses"], 1)
+
+    def test_semantic_match(self):
+        """
+        Test that a similar prompt in the same scope is a hit and an
+        unrelated one is not.
+        """
+        cache = PromptCache(embed=bag_of_words, similarity_threshold=0.9)
+        cache.set("user:1", "food spend last month", "About $200.")
+        self.assertEqual(
+            cache.get("user:1", "food spent last month?"), "About $200.")
+        self.assertIsNone(cache.get("user:1", "gas"))
+        self.assertEqual(cache.stats()["semantic_hits"], 1)
+
+    def test_eviction(self):
+        cache = PromptCache(max_entries=2, embed=bag_of_words)
+        cache.set("user:1", "food", "a")
+        cache.set("user:1", "gas", "b")
+        cache.get("user:1", "food")
+        cache.set("user:1", "month", "c")
+        self.assertIsNone(cache.get("user:1", "gas"))
+        self.assertEqual(cache.get("user:1", "food"), "a")
+        self.assertEqual(cache.stats()["evictions"], 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,281 @@
+import gzip
+import json
+import os
+import unittest
+from datetime import datetime
+
+from app import app
+from database.db import get_budgetai_db
+from utils.query import decode_cursor, encode_cursor
+from utils.wire import COLUMNS_MIMETYPE
+
+
+class QueryPaginationTest(unittest.TestCase):
+    """
+    QueryPaginationTest verifies cursor pagination and field projection on
+    the /query/transactions endpoints.
+    """
+
+    def setUp(self):
+        """
+        Set up a test client and sign up a user that owns the seeded
+        transactions.
+        """
+        self.app = app.test_client()
+        self.app.testing = True
+        self.app.post(
+            "/user/signup",
+            json={
+                "name": "Test Pagination User",
+                "email": "testpaginationuser@example.com",
+                "password": "password123",
+            },
+        )
+        # The user already exists after the first test
+        self.app.post(
+            "/user/login",
+            json={
+                "email": "testpaginationuser@example.com",
+                "password": "password123",
+            },
+        )
+        user = self.db["users"].find_one(
+            {"email": "testpaginationuser@example.com"})
+
+        self.db["transactions"].delete_many({"user_id": user["_id"]})
+        # Several transactions share a date so pages split ties on _id
+        self.db["transactions"].insert_many([
+            {
+                "_id": f"pagination_{i:02d}",
+                "user_id": user["_id"],
+                "transaction_date": datetime(2024, 9, 1 + i // 3),
+                "year": 2024,
+                "month": 9,
+                "description": "DOLLAR TREE",
+                "category": "Shopping" if i % 2 else "Travel",
+                "amount": float(i),
+            }
+            for i in range(10)
+        ])
+
+    @classmethod
+    def setUpClass(cls):
+        """
+        Configure the test environment and database connection.
+        """
+        os.environ["FLASK_ENV"] = "test"  # Use the test environment
+        cls.db, cls.client = get_budgetai_db()
+
+    @classmethod
+    def tearDownClass(cls):
+        """
+        Remove seeded data and close the database connection.
+        """
+        cls.db["transactions"].delete_many({})
+        cls.db["users"].delete_many({})
+        cls.client.close()
+
+    def fetch_all(self, params):
+        """
+        Follows X-Next-Cursor until the last page, returning every page.
+        """
+        pages = []
+        while True:
+            response = self.app.get("/query/transactions", query_string=params)
+            self.assertEqual(response.status_code, 200)
+            pages.append(response.json)
+            cursor = response.headers.get("X-Next-Cursor")
+            if not cursor:
+                return pages
+            params = {**params, "after": cursor}
+
+    def test_pagination(self):
+        """
+        Test that pages are ordered, sized by limit and cover every
+        transaction exactly once.
+        """
+        pages = self.fetch_all({"limit": 3})
+        self.assertEqual([len(page) for page in pages], [3, 3, 3, 1])
+        ids = [t["_id"] for page in pages for t in page]
+        self.assertEqual(ids, [f"pagination_{i:02d}" for i in range(10)])
+
+    def test_legacy_dates(self):
+        """
+        Test that a transaction whose date is still a string does not break
+        paging past it.
+        """
+        user = self.db["users"].find_one(
+            {"email": "testpaginationuser@example.com"})
+        self.db["transactions"].insert_one({
+            "_id": "pagination_legacy",
+            "user_id": user["_id"],
+            "transaction_date": "09/01/2024",
+            "description": "DOLLAR TREE",
+            "category": "Shopping",
+            "amount": 1.0,
+        })
+        pages = self.fetch_all({"limit": 3})
+        ids = [t["_id"] for page in pages for t in page]
+        self.assertEqual(ids, [f"pagination_{i:02d}" for i in range(10)])
+
+    def test_projection(self):
+        """
+        Test that only the requested fields, plus the cursor fields, are
+        returned.
+        """
+        pages = self.fetch_all({"fields": "amount,category"})
+        self.assertEqual(
+            set(pages[0][0]), {"_id", "transaction_date", "amount", "category"})
+
+        response = self.app.get(
+            "/query/transactions", query_string={"fields": "user_id"})
+        self.assertEqual(response.status_code, 400)
+
+    def test_category_pagination(self):
+        """
+        Test that POST endpoints accept paging options in the JSON body.
+        """
+        response = self.app.post(
+            "/query/transactions/category",
+            json={"category": "Shopping", "limit": 4},
+        )
+        self.assertEqual(len(response.json), 4)
+        response = self.app.post(
+            "/query/transactions/category",
+            json={"category": "Shopping", "limit": 4,
+                  "after": response.headers["X-Next-Cursor"]},
+        )
+        self.assertEqual(
+            [t["_id"] for t in response.json], ["pagination_09"])
+        self.assertNotIn("X-Next-Cursor", response.headers)
+
+    def test_invalid_options(self):
+        """
+        Test that malformed limits and cursors are rejected.
+        """
+        for params in ({"limit": 0}, {"limit": "ten"}, {"after": "not-a-cursor"}):
+            response = self.app.get("/query/transactions", query_string=params)
+            self.assertEqual(response.status_code, 400)
+
+    def test_columns_format(self):
+        """
+        Test that the columnar format, chosen by parameter or Accept header,
+        drops user_id and dictionary-encodes categories.
+        """
+        for kwargs in ({"query_string": {"format": "columns", "limit": 4}},
+                       {"query_string": {"limit": 4},
+                        "headers": {"Accept": COLUMNS_MIMETYPE}}):
+            response = self.app.get("/query/transactions", **kwargs)
+            self.assertEqual(response.mimetype, COLUMNS_MIMETYPE)
+            document = json.loads(response.data)
+            self.assertEqual(document["length"], 4)
+            self.assertNotIn("user_id", document["columns"])
+            self.assertEqual(
+                document["columns"]["category"],
+                {"dictionary": ["Travel", "Shopping"],
+                 "indices": [0, 1, 0, 1]})
+            self.assertIn("X-Next-Cursor", response.headers)
+
+        response = self.app.get(
+            "/query/transactions", query_string={"format": "xml"})
+        self.assertEqual(response.status_code, 400)
+
+    def test_search(self):
+        """
+        Test that search combines filters, sorts descending and pages with
+        cursors on the sort field.
+        """
+        params = {"category": "Shopping", "min_amount": 3, "sort": "-amount",
+                  "limit": 2}
+        response = self.app.post("/query/transactions/search", json=params)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(
+            [t["_id"] for t in response.json],
+            ["pagination_09", "pagination_07"])
+        response = self.app.post(
+            "/query/transactions/search",
+            json={**params, "after": response.headers["X-Next-Cursor"]})
+        self.assertEqual(
+            [t["_id"] for t in response.json],
+            ["pagination_05", "pagination_03"])
+
+        response = self.app.get(
+            "/query/transactions/search",
+            query_string={"start_date": "2024-09-02", "end_date": "2024-09-02",
+                          "description": "dollar"})
+        self.assertEqual(
+            [t["_id"] for t in response.json],
+            ["pagination_03", "pagination_04", "pagination_05"])
+
+        # A transaction without an amount does not break amount cursors
+        user = self.db["users"].find_one(
+            {"email": "testpaginationuser@example.com"})
+        self.db["transactions"].insert_one({
+            "_id": "pagination_no_amount",
+            "user_id": user["_id"],
+            "transaction_date": datetime(2024, 9, 1),
+            "description": "DOLLAR TREE",
+            "category": "Shopping",
+            "amount": None,
+        })
+        response = self.app.post(
+            "/query/transactions/search", json={"sort": "amount", "limit": 4})
+        response = self.app.post(
+            "/query/transactions/search",
+            json={"sort": "amount", "limit": 8,
+                  "after": response.headers["X-Next-Cursor"]})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(
+            [t["_id"] for t in response.json],
+            [f"pagination_{i:02d}" for i in range(4, 10)])
+
+        response = self.app.get(
+            "/query/transactions/search", query_string={"sort": "category"})
+        self.assertEqual(response.status_code, 400)
+
+    def test_search_explain(self):
+        """
+        Test that explain mode reports the chosen index and the plan.
+        """
+        response = self.app.get(
+            "/query/transactions/search",
+            query_string={"category": "Shopping", "explain": "true"})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(
+            response.json["index"], "user_id_category_transaction_date_id")
+        self.assertEqual(response.json["plan"]["returned"], 5)
+
+    def test_export_encoding(self):
+        """
+        Test that the export is compressed only when gzip is accepted with a
+        non-zero quality.
+        """
+        for accept_encoding, compressed in (
+                ("gzip, deflate", True), ("*", True),
+                ("gzip;q=0, deflate", False), ("identity", False)):
+            response = self.app.get(
+                "/query/transactions/export",
+                headers={"Accept-Encoding": accept_encoding})
+            self.assertEqual(response.status_code, 200)
+            body = response.get_data()
+            self.assertEqual(
+                response.headers.get("Content-Encoding") == "gzip", compressed)
+            if compressed:
+                body = gzip.decompress(body)
+            self.assertEqual(len(body.decode().splitlines()), 10)
+
+    def test_cursor_round_trip(self):
+        transaction = {"_id": "abc|def", "transaction_date": datetime(2024, 9, 1),
+                       "amount": 12.5}
+        self.assertEqual(
+            decode_cursor(encode_cursor(transaction)),
+            (datetime(2024, 9, 1), "abc|def"),
+        )
+        self.assertEqual(
+            decode_cursor(encode_cursor(transaction, "amount"), "amount"),
+            (12.5, "abc|def"),
+        )
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,137 @@
+import os
+import threading
+import unittest
+from datetime import datetime
+
+from app import app
+from database.db import get_budgetai_db
+from database.leases import INGEST_LOCKS, acquire_lease, release_lease
+from database.rollups import (
+    MONTHLY_TOTALS,
+    check_monthly_totals,
+    rebuild_monthly_totals,
+)
+from utils.upload import Upload
+
+
+class MonthlyTotalsTest(unittest.TestCase):
+    """
+    MonthlyTotalsTest verifies that the monthly_totals rollup is kept in step
+    with inserted transactions and can be checked and rebuilt.
+    """
+
+    user_id = "rollup_user"
+
+    @classmethod
+    def setUpClass(cls):
+        """
+        Configure the test environment and database connection.
+        """
+        os.environ["FLASK_ENV"] = "test"  # Use the test environment
+        cls.db, cls.client = get_budgetai_db()
+
+    @classmethod
+    def tearDownClass(cls):
+        """
+        Close the database connection.
+        """
+        cls.client.close()
+
+    def setUp(self):
+        self.app_context = app.app_context()
+        self.app_context.push()
+        self.upload = Upload(self.db)
+        self.db["users"].insert_one({"_id": self.user_id, "data_version": 0})
+
+    def tearDown(self):
+        """
+        Remove the seeded transactions and totals.
+        """
+        self.db["transactions"].delete_many({"user_id": self.user_id})
+        self.db[MONTHLY_TOTALS].delete_many({"user_id": self.user_id})
+        self.db["users"].delete_one({"_id": self.user_id})
+        self.db[INGEST_LOCKS].delete_one({"_id": self.user_id})
+        self.app_context.pop()
+
+    def make_transaction(self, _id, day, category, amount):
+        return Upload.Transaction(
+            _id, self.user_id, datetime(2024, 9, day), "MERCHANT", category,
+            amount)
+
+    def totals(self):
+        return {
+            (document["month"], document["category"]): document["total"]
+            for document in self.db[MONTHLY_TOTALS].find(
+                {"user_id": self.user_id})
+        }
+
+    def test_incremental_update(self):
+        """
+        Test that inserts are added to the rollup and duplicates are not.
+        """
+        transactions = [
+            self.make_transaction("rollup_1", 1, "Gas", 10.0),
+            self.make_transaction("rollup_2", 2, "Gas", 5.5),
+            self.make_transaction("rollup_3", 3, "Shopping", 1.29),
+        ]
+        self.assertEqual(self.upload.create_transactions(transactions), 3)
+        self.assertEqual(self.upload.create_transactions(transactions[:2]), 0)
+
+        self.assertEqual(
+            self.totals(), {(9, "Gas"): 15.5, (9, "Shopping"): 1.29})
+        self.assertEqual(check_monthly_totals(self.db, self.user_id), [])
+
+    def test_check_and_rebuild(self):
+        """
+        Test that drift is reported by the checker and fixed by a rebuild.
+        """
+        self.upload.create_transactions(
+            [self.make_transaction("rollup_4", 4, "Gas", 20.0)])
+        self.db[MONTHLY_TOTALS].update_one(
+            {"user_id": self.user_id}, {"$inc": {"total": 1.0}})
+        # Totals of a month without transactions
+        self.db[MONTHLY_TOTALS].insert_one({
+            "user_id": self.user_id, "year": 2023, "month": 1,
+            "category": "Gas", "total": 5.0, "count": 1,
+        })
+
+        mismatches = sorted(
+            check_monthly_totals(self.db, self.user_id),
+            key=lambda mismatch: mismatch["year"])
+        self.assertEqual(len(mismatches), 2)
+        self.assertEqual(mismatches[0]["actual_total"], 5.0)
+        self.assertEqual(mismatches[1]["expected_total"], 20.0)
+        self.assertEqual(mismatches[1]["actual_total"], 21.0)
+
+        self.assertEqual(rebuild_monthly_totals(self.db, self.user_id), 1)
+        self.assertEqual(check_monthly_totals(self.db, self.user_id), [])
+        self.assertEqual(self.totals(), {(9, "Gas"): 20.0})
+
+    def test_rebuild_waits_for_lease(self):
+        """
+        Test that a rebuild waits for an upload holding the user's lease and
+        then bumps the user's data version.
+        """
+        self.upload.create_transactions(
+            [self.make_transaction("rollup_5", 5, "Gas", 7.0)])
+        version = self.db["users"].find_one({"_id": self.user_id})["data_version"]
+        self.assertTrue(acquire_lease(self.db, self.user_id, "upload", 60))
+
+        rebuild = threading.Thread(
+            target=rebuild_monthly_totals, args=(self.db, self.user_id),
+            kwargs={"poll_interval": 0.05})
+        rebuild.start()
+        rebuild.join(0.3)
+        self.assertTrue(rebuild.is_alive())
+
+        release_lease(self.db, self.user_id, "upload")
+        rebuild.join(5)
+        self.assertFalse(rebuild.is_alive())
+        self.assertEqual(
+            self.db["users"].find_one({"_id": self.user_id})["data_version"],
+            version + 1)
+        self.assertIsNone(self.db[INGEST_LOCKS].find_one({"_id": self.user_id}))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,92 @@
+import unittest
+from datetime import datetime
+
+from utils.search import compile_search, parse_sort, plan_index, summarize_explain
+
+
+class SearchPlannerTest(unittest.TestCase):
+    """
+    SearchPlannerTest verifies how search filters are compiled into a Mongo
+    query and which index the planner picks for it.
+    """
+
+    def best_index(self, params, sort="transaction_date"):
+        query, error, status_code = compile_search("user1", params)
+        self.assertEqual(status_code, 200, error)
+        return plan_index(query, sort)[0]["index"]
+
+    def test_compile(self):
+        query, _, status_code = compile_search("user1", {
+            "category": ["Gas", "Travel", "Gas"],
+            "min_amount": "2.5",
+            "max_amount": 10,
+            "start_date": "2024-09-01",
+            "end_date": "2024-09-30",
+            "description": "shell (",
+            "limit": 5,
+        })
+        self.assertEqual(status_code, 200)
+        self.assertEqual(query, {
+            "user_id": "user1",
+            "category": {"$in": ["Gas", "Travel"]},
+            "amount": {"$gte": 2.5, "$lte": 10},
+            "transaction_date": {"$gte": datetime(2024, 9, 1),
+                                 "$lt": datetime(2024, 10, 1)},
+            "description": {"$regex": r"shell\ \(", "$options": "i"},
+        })
+        self.assertEqual(
+            compile_search("user1", {"category": "Gas"})[0],
+            {"user_id": "user1", "category": "Gas"})
+
+    def test_invalid_filters(self):
+        for params in ({"min_amount": True}, {"max_amount": "many"},
+                       {"min_amount": 5, "max_amount": 1},
+                       {"category": {"name": "Gas"}},
+                       {"start_date": "09/01/2024"}):
+            with self.subTest(params=params):
+                self.assertEqual(compile_search("user1", params)[2], 400)
+
+    def test_parse_sort(self):
+        self.assertEqual(parse_sort(None), ("transaction_date", 1, None))
+        self.assertEqual(parse_sort("-amount"), ("amount", -1, None))
+        self.assertIsNotNone(parse_sort("--amount")[2])
+        self.assertIsNotNone(parse_sort("category")[2])
+
+    def test_plan_index(self):
+        # Equality on category comes first, and the index also gives the order
+        self.assertEqual(
+            self.best_index({"category": "Gas", "min_amount": 1}),
+            "user_id_category_transaction_date_id")
+        # An index that gives the order beats one that bounds a range
+        self.assertEqual(
+            self.best_index({"min_amount": 1, "start_date": "2024-09-01"}),
+            "user_id_transaction_date_id")
+        self.assertEqual(
+            self.best_index({"min_amount": 1}, sort="amount"),
+            "user_id_amount_id")
+        # Without an equality match, an index in amount order avoids a sort
+        self.assertEqual(self.best_index({}, sort="amount"), "user_id_amount_id")
+
+    def test_summarize_explain(self):
+        explained = {
+            "queryPlanner": {
+                "winningPlan": {
+                    "stage": "LIMIT",
+                    "inputStage": {
+                        "stage": "FETCH",
+                        "inputStage": {"stage": "IXSCAN",
+                                       "indexName": "user_id_amount_id"},
+                    },
+                },
+            },
+            "executionStats": {"nReturned": 3, "totalKeysExamined": 4,
+                               "totalDocsExamined": 3, "executionTimeMillis": 0},
+        }
+        self.assertEqual(summarize_explain(explained), {
+            "stages": [{"stage": "LIMIT"}, {"stage": "FETCH"},
+                       {"stage": "IXSCAN", "indexName": "user_id_amount_id"}],
+            "returned": 3,
+            "keys_examined": 4,
+            "documents_examined": 3,
+            "time_ms": 0,
+        })
@@ -0,0 +1,105 @@
+import unittest
+from datetime import date, datetime, timedelta, timezone
+
+from bson import Decimal128, ObjectId
+from flask import Flask, jsonify, request, session
+
+from utils import serialization
+from utils.serialization import FastJSONProvider, init_json
+
+DOCUMENT = {
+    "_id": ObjectId("64b7f0c2a1b2c3d4e5f60718"),
+    "user_id": "user1",
+    "transaction_date": datetime(2024, 9, 1, 8, 30),
+    "posted": date(2024, 9, 2),
+    "description": "CAFÉ",
+    "category": "Food & Drink",
+    "amount": Decimal128("5.50"),
+}
+
+
+class FastJSONProviderTest(unittest.TestCase):
+    """
+    FastJSONProviderTest verifies that both backends serialize BSON values
+    the same way and that the provider works as the app's JSON provider.
+    """
+
+    def setUp(self):
+        self.app = Flask(__name__)
+        self.app.secret_key = "test"
+        init_json(self.app)
+
+        @self.app.route("/echo", methods=["POST"])
+        def echo():
+            return jsonify(request.get_json())
+
+        @self.app.route("/login")
+        def login():
+            session["user"] = {"_id": "user1", "since": datetime(2024, 1, 1)}
+            return jsonify(DOCUMENT)
+
+        @self.app.route("/me")
+        def me():
+            return jsonify(session.get("user"))
+
+    def backends(self):
+        backends = ["json"]
+        if serialization.orjson is not None:
+            backends.append("orjson")
+        return [FastJSONProvider(self.app, backend=name) for name in backends]
+
+    def test_bson_values(self):
+        for provider in self.backends():
+            with self.subTest(backend=provider.backend):
+                self.assertEqual(
+                    provider.loads(provider.dumps(DOCUMENT)),
+                    {
+                        "_id": "64b7f0c2a1b2c3d4e5f60718",
+                        "user_id": "user1",
+                        "transaction_date": "2024-09-01T08:30:00Z",
+                        "posted": "2024-09-02",
+                        "description": "CAFÉ",
+                        "category": "Food & Drink",
+                        "amount": "5.50",
+                    })
+
+    def test_backends_match(self):
+        value = [
+            DOCUMENT,
+            {"b": 1, "a": [1.5, None, True]},
+            datetime(2024, 9, 1, tzinfo=timezone.utc),
+            datetime(2024, 9, 1, 12, 0, 0, 250, tzinfo=timezone(timedelta(hours=2))),
+        ]
+        outputs = {
+            provider.backend: provider.dumps_bytes(value, newline=True)
+            for provider in self.backends()
+        }
+        self.assertEqual(len(set(outputs.values())), 1, outputs)
+
+    def test_big_integer(self):
+        for provider in self.backends():
+            with self.subTest(backend=provider.backend):
+                self.assertEqual(provider.dumps({"n": 2 ** 70}), '{"n":1180591620717411303424}')
+
+    def test_unsupported_type(self):
+        for provider in self.backends():
+            with self.subTest(backend=provider.backend):
+                with self.assertRaises(TypeError):
+                    provider.dumps({"value": object()})
+
+    def test_response(self):
+        client = self.app.test_client()
+        response = client.post("/echo", json={"b": [1, 2], "a": "é"})
+        self.assertEqual(response.mimetype, "application/json")
+        self.assertEqual(response.get_data(), '{"a":"é","b":[1,2]}\n'.encode("utf-8"))
+
+        response = client.get("/login")
+        self.assertEqual(response.json["transaction_date"], "2024-09-01T08:30:00Z")
+        # The session serializer keeps round tripping tagged values
+        self.assertEqual(
+            client.get("/me").json, {"_id": "user1", "since": "2024-01-01T00:00:00Z"})
+
+    def test_debug_indent(self):
+        self.app.debug = True
+        response = self.app.test_client().post("/echo", json={"a": 1})
+        self.assertEqual(response.get_data(), b'{\n  "a": 1\n}\n')
@@ -0,0 +1,103 @@
+import unittest
+from datetime import datetime, timedelta
+
+import numpy as np
+
+from utils.series import build_series, lttb_indices, rollup_records
+
+
+def record(period, category, total):
+    return {"period": period, "category": category, "total": total}
+
+
+class SeriesTest(unittest.TestCase):
+    """
+    SeriesTest verifies period bucketing, running totals, moving averages
+    and LTTB downsampling of spending series.
+    """
+
+    def test_monthly_split(self):
+        series = build_series(
+            [
+                record(datetime(2024, 1, 1), "Gas", 10.0),
+                record(datetime(2024, 1, 1), "Food", 5.0),
+                record(datetime(2024, 3, 1), "Gas", 20.0),
+            ],
+            granularity="month", split=True, window=2)
+        self.assertEqual(
+            series["periods"], ["2024-01-01", "2024-02-01", "2024-03-01"])
+        self.assertEqual(list(series["series"]), ["Total", "Food", "Gas"])
+        total = series["series"]["Total"]
+        # February has no spending and is zero-filled
+        self.assertEqual(total["total"], [15.0, 0.0, 20.0])
+        self.assertEqual(total["running_total"], [15.0, 15.0, 35.0])
+        self.assertEqual(total["moving_average"], [15.0, 7.5, 10.0])
+        self.assertEqual(series["series"]["Food"]["total"], [5.0, 0.0, 0.0])
+        self.assertFalse(series["downsampled"])
+
+    def test_split_category_names(self):
+        series = build_series(
+            [
+                record(datetime(2024, 1, 1), "Total", 10.0),
+                record(datetime(2024, 1, 1), None, 5.0),
+                record(datetime(2024, 2, 1), "Gas", 1.0),
+            ],
+            split=True)
+        self.assertEqual(
+            list(series["series"]), ["Total", "Gas", "Total (category)",
+                                     "Uncategorized"])
+        # Uncategorized spending counts towards the Total
+        self.assertEqual(series["series"]["Total"]["total"], [15.0, 1.0])
+        self.assertEqual(
+            series["series"]["Total (category)"]["total"], [10.0, 0.0])
+
+    def test_weeks_start_on_monday(self):
+        series = build_series(
+            [
+                record(datetime(2024, 9, 1), "Gas", 1.0),  # Sunday
+                record(datetime(2024, 9, 2), "Gas", 2.0),  # Monday
+                record(datetime(2024, 9, 8), "Food", 3.0),  # Sunday
+            ],
+            granularity="week")
+        self.assertEqual(series["periods"], ["2024-08-26", "2024-09-02"])
+        self.assertEqual(series["series"]["Total"]["total"], [1.0, 5.0])
+        self.assertEqual(list(series["series"]), ["Total"])
+
+    def test_yearly_from_rollup(self):
+        records = rollup_records([
+            {"year": 2023, "month": 12, "category": "Gas", "total": 4.0},
+            {"year": 2024, "month": 1, "category": "Gas", "total": 6.0},
+            {"year": 2024, "month": 7, "category": "Gas", "total": 1.5},
+        ])
+        series = build_series(records, granularity="year")
+        self.assertEqual(series["periods"], ["2023-01-01", "2024-01-01"])
+        self.assertEqual(series["series"]["Total"]["total"], [4.0, 7.5])
+
+    def test_downsampling(self):
+        records = [
+            record(datetime(2020, 1, 1) + timedelta(days=day),
+                   "Gas", 100.0 if day == 500 else 1.0)
+            for day in range(2000)
+        ]
+        series = build_series(records, granularity="day", points=100)
+        self.assertTrue(series["downsampled"])
+        self.assertEqual(len(series["periods"]), 100)
+        self.assertEqual(series["periods"][0], "2020-01-01")
+        self.assertEqual(series["periods"][-1], "2025-06-22")
+        total = series["series"]["Total"]
+        # The spike survives downsampling and running totals stay exact
+        self.assertIn(100.0, total["total"])
+        self.assertEqual(total["running_total"][-1], 2099.0)
+
+    def test_lttb_indices(self):
+        values = np.sin(np.linspace(0, 20, 1000))
+        kept = lttb_indices(values, 50)
+        self.assertEqual(len(kept), 50)
+        self.assertEqual((kept[0], kept[-1]), (0, 999))
+        self.assertTrue(np.all(np.diff(kept) > 0))
+        np.testing.assert_array_equal(lttb_indices(values[:10], 50), np.arange(10))
+
+    def test_empty(self):
+        series = build_series([], granularity="day")
+        self.assertEqual(series["periods"], [])
+        self.assertEqual(series["series"], {})
@@ -0,0 +1,134 @@
+import unittest
+
+from flask import Flask, jsonify, session
+
+from utils.sessions import ServerSessionInterface, revoke_user_sessions
+
+
+class DictSessionStore:
+    """
+    Session store kept in a dict, counting loads from the store.
+    """
+
+    name = "dict"
+
+    def __init__(self):
+        self.sessions = {}
+        self.loads = 0
+
+    def load(self, sid):
+        self.loads += 1
+        entry = self.sessions.get(sid)
+        return entry[0] if entry else None
+
+    def save(self, sid, data, user_id, expires_at):
+        self.sessions[sid] = (data, user_id)
+
+    def delete(self, sid):
+        self.sessions.pop(sid, None)
+
+    def delete_user(self, user_id):
+        sids = [sid for sid, entry in self.sessions.items()
+                if entry[1] == user_id]
+        for sid in sids:
+            del self.sessions[sid]
+        return len(sids)
+
+
+def create_app(store):
+    """
+    Creates a minimal app whose routes sign in, read and revoke sessions.
+    """
+    app = Flask(__name__)
+    app.secret_key = "test"
+    app.session_interface = ServerSessionInterface(store)
+
+    @app.route("/login/<user_id>")
+    def login(user_id):
+        session.regenerate()
+        session["logged_in"] = True
+        session["user"] = {"_id": user_id, "name": "Test User"}
+        return "ok"
+
+    @app.route("/me")
+    def me():
+        return jsonify(session.get("user"))
+
+    @app.route("/signout")
+    def signout():
+        session.clear()
+        return "ok"
+
+    @app.route("/revoke/<user_id>")
+    def revoke(user_id):
+        return jsonify(revoke_user_sessions(user_id))
+
+    return app
+
+
+class ServerSessionTest(unittest.TestCase):
+    """
+    ServerSessionTest verifies that sessions live in the store, the cookie
+    only carries a signed id, and sessions can be revoked.
+    """
+
+    def setUp(self):
+        self.store = DictSessionStore()
+        self.app = create_app(self.store)
+        self.client = self.app.test_client()
+
+    def cookie(self):
+        return self.client.get_cookie("session").value
+
+    def test_cookie_holds_signed_id(self):
+        self.client.get("/login/user1")
+        self.assertNotIn("Test User", self.cookie())
+        self.assertLess(len(self.cookie()), 100)
+        self.assertEqual(self.client.get("/me").json["_id"], "user1")
+
+        # A tampered cookie starts an empty session
+        self.client.set_cookie("session", self.cookie()[:-1] + "x")
+        self.assertIsNone(self.client.get("/me").json)
+
+    def test_cached_lookups(self):
+        """
+        Test that repeated requests are resolved from the in-process cache.
+        """
+        self.client.get("/login/user1")
+        for _ in range(3):
+            self.client.get("/me")
+        self.assertEqual(self.store.loads, 0)
+        self.assertEqual(self.app.session_interface.stats()["hits"], 3)
+
+    def test_login_regenerates_id(self):
+        self.client.get("/login/user1")
+        first = self.cookie()
+        self.client.get("/login/user1")
+        self.assertNotEqual(self.cookie(), first)
+        self.assertEqual(len(self.store.sessions), 1)
+
+    def test_signout(self):
+        self.client.get("/login/user1")
+        self.client.get("/signout")
+        self.assertEqual(self.store.sessions, {})
+        self.assertIsNone(self.client.get_cookie("session"))
+
+    def test_revoke_user(self):
+        """
+        Test that revoking a user's sessions signs out every client of that
+        user only.
+        """
+        other = self.app.test_client()
+        other.get("/login/user1")
+        third = self.app.test_client()
+        third.get("/login/user2")
+        self.client.get("/login/user1")
+
+        self.assertEqual(self.client.get("/revoke/user1").json, 2)
+        self.assertIsNone(self.client.get("/me").json)
+        self.assertIsNone(other.get("/me").json)
+        self.assertEqual(third.get("/me").json["_id"], "user2")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,77 @@
+import json
+import unittest
+
+import pandas as pd
+
+from utils.summary import summarize_transactions, summary_context
+
+
+def make_frame(rows):
+    df = pd.DataFrame(
+        rows, columns=["transaction_date", "description", "category", "amount"])
+    df["transaction_date"] = pd.to_datetime(df["transaction_date"])
+    df["description"] = pd.Categorical(df["description"])
+    df["category"] = pd.Categorical(df["category"])
+    df["amount"] = df["amount"].astype("float32")
+    return df
+
+
+class SummaryTest(unittest.TestCase):
+    """
+    SummaryTest verifies the statistical summary sent to the LLM in place
+    of raw transactions.
+    """
+
+    def setUp(self):
+        rows = [
+            (f"2024-0{month}-03", "NETFLIX", "Entertainment", 15.49)
+            for month in range(1, 5)
+        ]
+        rows += [
+            (f"2024-0{month}-{day:02d}", "STARBUCKS", "Food & Drink", 5.0 + day)
+            for month in range(1, 5) for day in range(1, 8)
+        ]
+        rows.append(("2024-03-15", "STEAKHOUSE", "Food & Drink", 400.0))
+        self.df = make_frame(rows)
+        self.summary = summarize_transactions(self.df)
+
+    def test_totals(self):
+        self.assertEqual(self.summary["transactions"], 33)
+        self.assertEqual(self.summary["first_date"], "2024-01-01")
+        self.assertAlmostEqual(
+            self.summary["total"], 15.49 * 4 + 9.0 * 28 + 400.0, places=2)
+        categories = {c["category"]: c for c in self.summary["categories"]}
+        self.assertEqual(categories["Entertainment"]["count"], 4)
+        self.assertEqual(
+            [m["merchant"] for m in self.summary["top_merchants"]],
+            ["STEAKHOUSE", "STARBUCKS", "NETFLIX"],
+        )
+
+    def test_monthly_changes(self):
+        """
+        Test that month-over-month changes are computed, and that the first
+        month has none.
+        """
+        monthly = {m["month"]: m for m in self.summary["monthly"]}
+        self.assertIsNone(monthly["2024-01"]["change"])
+        self.assertAlmostEqual(monthly["2024-03"]["change"], 400.0, places=2)
+        self.assertAlmostEqual(monthly["2024-04"]["change"], -400.0, places=2)
+
+    def test_recurring_and_outliers(self):
+        self.assertEqual(
+            [r["merchant"] for r in self.summary["recurring"]], ["NETFLIX"])
+        self.assertEqual(
+            [o["merchant"] for o in self.summary["outliers"]], ["STEAKHOUSE"])
+
+    def test_context(self):
+        """
+        Test that the context is compact JSON that round-trips.
+        """
+        context = summary_context(self.summary)
+        self.assertNotIn(", ", context)
+        self.assertEqual(json.loads(context)["transactions"], 33)
+        self.assertEqual(summarize_transactions(self.df.iloc[:0]), {})
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -1,9 +1,23 @@
 import io
 import os
+import time
 import unittest
+from collections import Counter
+from datetime import datetime
+
+import pandas as pd
+from pymongo.errors import BulkWriteError
+from werkzeug.datastructures import FileStorage
+from werkzeug.test import encode_multipart
 
 from app import app
 from database.db import get_budgetai_db
+from utils.upload import (
+    MultipartFileStream,
+    Upload,
+    content_fingerprint,
+    transaction_content,
+)
 
 
 class UploadTest(unittest.TestCase):
@@ -64,9 +78,25 @@ class UploadTest(unittest.TestCase):
         Close the database client connection.
         """
         cls.db["transactions"].delete_many({})
+        cls.db["ingest_jobs"].delete_many({})
         cls.db["users"].delete_many({})
         cls.client.close()
 
+    def wait_for_job(self, response, timeout=10):
+        """
+        Polls the status of the ingestion job queued by an upload response
+        until it finishes, returning the final status JSON.
+        """
+        self.assertEqual(response.status_code, 202)
+        status_url = response.json["status_url"]
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            status = self.app.get(status_url).json
+            if status["status"] in ("done", "failed"):
+                return status
+            time.sleep(0.1)
+        self.fail("Ingestion job did not finish in time")
+
     def test_upload(self):
         # Create and login new user
         self.app.post(
@@ -91,16 +121,19 @@ class UploadTest(unittest.TestCase):
         # Send a POST request to the /upload endpoint
         response = self.app.post("/upload/csv", data=data)
 
-        # Check if the response status code is 200
-        self.assertEqual(response.status_code, 200)
-
         # Check if the message in the JSON response matches the expected
         # success message
         self.assertEqual(
             response.json.get(
-                "message"), "File uploaded and processed successfully"
+                "message"), "File uploaded and queued for processing"
         )
 
+        # Wait for the job and check the reported row counts
+        status = self.wait_for_job(response)
+        self.assertEqual(status["status"], "done")
+        self.assertEqual(status["inserted"], 1)
+        self.assertEqual(status["rows_rejected"], 0)
+
         # Verify if the transaction was inserted into the database
         inserted_user = self.db["users"].find_one(
             {"email": "testuser@example.com"})
@@ -111,8 +144,12 @@ class UploadTest(unittest.TestCase):
         # Verify inserted transaction values
         self.assertEqual(
             inserted_transaction["transaction_date"],
-            self.sample_transaction_data["transaction_date"],
+            datetime.strptime(
+                self.sample_transaction_data["transaction_date"], "%m/%d/%Y"
+            ),
         )
+        self.assertEqual(inserted_transaction["year"], 2024)
+        self.assertEqual(inserted_transaction["month"], 9)
         self.assertEqual(
             inserted_transaction["description"],
             self.sample_transaction_data["description"],
@@ -121,6 +158,182 @@ class UploadTest(unittest.TestCase):
             inserted_transaction["category"], self.sample_transaction_data["category"]
         )
 
+    def test_reupload(self):
+        """
+        Test that uploading the same statement twice does not duplicate
+        transactions.
+        """
+        self.app.post(
+            "/user/signup",
+            json={
+                "name": "Test Reupload User",
+                "email": "testreuploaduser@example.com",
+                "password": "password123",
+            },
+        )
+
+        responses = [
+            self.app.post(
+                "/upload/csv",
+                data={"file": (io.BytesIO(self.sample_csv.encode("utf-8")),
+                               "sample.csv")},
+            )
+            for _ in range(2)
+        ]
+        statuses = [self.wait_for_job(response) for response in responses]
+        self.assertEqual(statuses[0]["inserted"], 1)
+        self.assertEqual(statuses[1]["inserted"], 0)
+        self.assertEqual(statuses[1]["duplicates"], 1)
+
+        inserted_user = self.db["users"].find_one(
+            {"email": "testreuploaduser@example.com"})
+        self.assertEqual(
+            self.db["transactions"].count_documents(
+                {"user_id": inserted_user["_id"]}),
+            1,
+        )
+
+
+class MultipartFileStreamTest(unittest.TestCase):
+    """
+    MultipartFileStreamTest verifies that the file field of a multipart body
+    is decoded incrementally, without a database.
+    """
+
+    def test_file_field(self):
+        content = b"Transaction Date,Amount\n" + b"09/30/2024,-1.29\n" * 10000
+        boundary, body = encode_multipart({
+            "note": "statement",
+            "file": FileStorage(io.BytesIO(content), "sample.csv"),
+        })
+        stream = MultipartFileStream(io.BytesIO(body), boundary, chunk_size=1000)
+        self.assertTrue(stream.open())
+        self.assertEqual(stream.filename, "sample.csv")
+        self.assertEqual(stream.read(), content)
+
+    def test_missing_field(self):
+        boundary, body = encode_multipart({"note": "statement"})
+        self.assertFalse(MultipartFileStream(io.BytesIO(body), boundary).open())
+
+    def test_malformed_body(self):
+        boundary, body = encode_multipart({"note": "statement"})
+        with self.assertRaises(ValueError):
+            MultipartFileStream(io.BytesIO(body[:20]), boundary).open()
+
+
+class FailingCollection:
+    """
+    Collection whose bulk writes fail with the given write errors, or with
+    the next of a list of them on each call.
+    """
+
+    def __init__(self, details=None, name=None, calls=None):
+        self.details = details
+        self.name = name
+        self.calls = calls if calls is not None else []
+
+    def bulk_write(self, operations, ordered=True):
+        self.calls.append((self.name, "bulk_write"))
+        details = self.details
+        if isinstance(details, list):
+            details = details.pop(0)
+        if details is not None:
+            raise BulkWriteError(details)
+
+    def update_one(self, *args, **kwargs):
+        self.calls.append((self.name, "update_one"))
+
+
+class WriteTransactionsTest(unittest.TestCase):
+    """
+    WriteTransactionsTest verifies how bulk write errors are counted,
+    without a database.
+    """
+
+    def transactions(self, count):
+        return [
+            Upload.Transaction(
+                f"write_{i}", "user1", datetime(2024, 9, 1), "DOLLAR TREE",
+                "Shopping", -1.0)
+            for i in range(count)
+        ]
+
+    def test_write_errors(self):
+        upload = Upload(db={
+            "transactions": FailingCollection({
+                "upserted": [{"index": 0, "_id": "write_0"}],
+                "writeErrors": [
+                    {"index": 1, "code": 11000, "errmsg": "duplicate key"},
+                    {"index": 2, "code": 121, "errmsg": "validation failed"},
+                ],
+            }),
+            "monthly_totals": FailingCollection(),
+            "users": FailingCollection(),
+        })
+        self.assertEqual(
+            upload.write_transactions(self.transactions(4)),
+            {"inserted": 1, "duplicates": 2, "failed": 1})
+
+    def test_fingerprint(self):
+        # The IDs of a parsed chunk match those derived one at a time
+        parsed = pd.DataFrame({
+            "transaction_date": pd.to_datetime(["2024-09-30", "2024-09-30"]),
+            "description": ["DOLLAR TREE", "DOLLAR TREE"],
+            "category": ["Shopping", "Shopping"],
+            "amount": [1.29, 1.29],
+        })
+        transactions = Upload(db={}).build_transactions(
+            parsed, "user1", Counter())
+        content = transaction_content(
+            "user1", datetime(2024, 9, 30), "DOLLAR TREE", 1.29)
+        self.assertEqual(
+            [transaction._id for transaction in transactions],
+            [content_fingerprint(content, 0), content_fingerprint(content, 1)])
+
+    def test_version_bumped_after_rollup(self):
+        calls = []
+        upload = Upload(db={
+            "transactions": FailingCollection({
+                "upserted": [{"index": 0, "_id": "write_0"}],
+                "writeErrors": [],
+            }),
+            "monthly_totals": FailingCollection(
+                {"writeErrors": []}, "monthly_totals", calls),
+            "users": FailingCollection(name="users", calls=calls),
+        })
+        upload.write_transactions(self.transactions(1))
+        # The version is bumped once the rollup is written, even if that fails
+        self.assertEqual(
+            calls, [("monthly_totals", "bulk_write"), ("users", "update_one")])
+
+    def test_malformed_lines(self):
+        upload = Upload(db={
+            # Each batch holds one valid row: the first is inserted and the
+            # second was inserted concurrently by another upload
+            "transactions": FailingCollection([
+                {"upserted": [{"index": 0, "_id": "write_0"}],
+                 "writeErrors": []},
+                {"writeErrors": [
+                    {"index": 0, "code": 11000, "errmsg": "duplicate key"}]},
+            ]),
+            "monthly_totals": FailingCollection(),
+            "users": FailingCollection(),
+        })
+        csv = (
+            b"Transaction Date,Post Date,Description,Category,Type,Amount,Memo\n"
+            b"09/30/2024,10/01/2024,DOLLAR TREE,Shopping,Sale,-1.29,\n"
+            b"09/30/2024,10/01/2024,DOLLAR,TREE,Shopping,Sale,-1.29,\n"
+            b"09/29/2024,09/30/2024,SHELL,Gas,Sale,-30.00,\n"
+        )
+        summary = upload.process_stream(io.BytesIO(csv), "user1", batch_size=2)
+        # The row with an extra field is rejected and later rows still load
+        self.assertEqual(summary["rejected"], 1)
+        self.assertEqual(
+            (summary["inserted"], summary["duplicates"], summary["failed"]),
+            (1, 1, 0))
+        self.assertEqual(
+            summary["rejected_rows"], [{"line": 3, "reason": "Too many fields."}])
+
 
 if __name__ == "__main__":
     unittest.main()
@@ -148,6 +148,38 @@ class UserLoginTest(unittest.TestCase):
             "name", response.get_json()
         )  # Verify user is returned in response
 
+    def test_login_rehash(self):
+        """
+        Test that logging in replaces a hash made with an outdated work
+        factor.
+        """
+        self.app.post(
+            "/user/signup",
+            json={
+                "name": "Test Rehash User",
+                "email": "testrehashuser@example.com",
+                "password": "password123",
+            },
+        )
+        self.db["users"].update_one(
+            {"email": "testrehashuser@example.com"},
+            {"$set": {"password": pbkdf2_sha256.using(rounds=1000).hash(
+                "password123")}},
+        )
+        response = self.app.post(
+            "/user/login",
+            json={
+                "email": "testrehashuser@example.com",
+                "password": "password123"},
+        )
+        self.assertEqual(response.status_code, 200)
+
+        stored = self.db["users"].find_one(
+            {"email": "testrehashuser@example.com"})["password"]
+        self.assertEqual(
+            pbkdf2_sha256.from_string(stored).rounds,
+            app.config["PASSWORD_HASH_ROUNDS"])
+
     def test_login_invalid_credentials(self):
         """
         Test the login process with invalid credentials.
@@ -0,0 +1,81 @@
+import json
+import unittest
+from datetime import datetime
+
+from werkzeug.datastructures import MIMEAccept
+
+from utils import wire
+from utils.wire import (
+    COLUMNS_MIMETYPE,
+    columns_document,
+    encode_columns,
+    negotiate_format,
+)
+
+TRANSACTIONS = [
+    {"_id": "a", "user_id": "u", "transaction_date": datetime(2024, 9, 1),
+     "description": "SHELL OIL", "category": "Gas", "amount": 40.0},
+    {"_id": "b", "user_id": "u", "transaction_date": datetime(2024, 9, 2),
+     "description": "STARBUCKS", "category": "Food & Drink", "amount": 5.5},
+    {"_id": "c", "user_id": "u", "transaction_date": datetime(2024, 9, 3),
+     "description": "SHELL OIL", "category": "Gas", "amount": 35.0},
+]
+
+
+class WireFormatTest(unittest.TestCase):
+    """
+    WireFormatTest verifies the columnar encodings of transaction lists and
+    format negotiation.
+    """
+
+    def test_columns(self):
+        document = json.loads(encode_columns(TRANSACTIONS))
+        self.assertEqual(document, {
+            "length": 3,
+            "columns": {
+                "_id": ["a", "b", "c"],
+                "transaction_date": [
+                    "2024-09-01T00:00:00", "2024-09-02T00:00:00",
+                    "2024-09-03T00:00:00"],
+                "description": ["SHELL OIL", "STARBUCKS", "SHELL OIL"],
+                "category": {"dictionary": ["Gas", "Food & Drink"],
+                             "indices": [0, 1, 0]},
+                "amount": [40.0, 5.5, 35.0],
+            },
+        })
+
+    def test_missing_fields(self):
+        document = columns_document([{"_id": "a"}, {"_id": "b", "amount": 1.0}])
+        self.assertEqual(document["columns"]["amount"], [None, 1.0])
+
+    @unittest.skipIf(wire.msgpack is None, "msgpack is not installed")
+    def test_msgpack(self):
+        self.assertEqual(
+            wire.msgpack.unpackb(wire.encode_msgpack(TRANSACTIONS)),
+            columns_document(TRANSACTIONS))
+
+    @unittest.skipIf(wire.pyarrow is None, "pyarrow is not installed")
+    def test_arrow(self):
+        table = wire.pyarrow.ipc.open_stream(
+            wire.encode_arrow(TRANSACTIONS)).read_all()
+        self.assertNotIn("user_id", table.column_names)
+        self.assertEqual(
+            table.column("category").type,
+            wire.pyarrow.dictionary(wire.pyarrow.int32(), wire.pyarrow.string()))
+        self.assertEqual(table.column("amount").to_pylist(), [40.0, 5.5, 35.0])
+
+    def test_negotiate(self):
+        """
+        Test that the format parameter wins over Accept, and that clients
+        accepting anything get JSON rows.
+        """
+        accept_any = MIMEAccept([("*/*", 1)])
+        accept_columns = MIMEAccept([(COLUMNS_MIMETYPE, 1), ("*/*", 0.1)])
+        self.assertEqual(negotiate_format(None, accept_any)[0], "json")
+        self.assertEqual(negotiate_format(None, accept_columns)[0], "columns")
+        self.assertEqual(negotiate_format("json", accept_columns)[0], "json")
+        self.assertEqual(negotiate_format("xml", accept_any)[2], 400)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,367 @@
+"""
+Per-user cache for query responses.
+
+Cached responses are keyed by user, data version, route and request
+parameters. The data version is a counter on the user's document that
+every write to their transactions increments, so after a change every
+worker process misses on its older entries and stale responses are never
+served; they simply age out through LRU or TTL eviction.
+
+The same key gives every cached response a strong ETag, so a client that
+revalidates with If-None-Match gets a 304 while the user's data version is
+unchanged, without the view running. Every cached request and revalidation
+still costs one lookup of the user's document by _id for the version: it is
+read from Mongo rather than from a per-process copy, which could lag behind
+a bump made by another process.
+"""
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+from functools import wraps
+
+from flask import current_app, has_app_context, make_response, request, session
+
+from database.db import get_db
+
+try:
+    import redis
+except ImportError:  # Optional dependency, only needed for the redis backend
+    redis = None
+
+# Response headers stored alongside a cached body
+CACHED_HEADERS = ("Content-Type", "X-Next-Cursor", "Vary")
+
+# Field of the users collection holding the data version
+DATA_VERSION = "data_version"
+
+# Suffixes compress_response adds to an ETag for each content coding
+ETAG_ENCODING_SUFFIXES = ("", "-gzip", "-br")
+
+# Version of the cached routes' response bodies, part of every key and ETag.
+# Increment it whenever one of them changes shape, so that clients holding a
+# response of the previous shape do not get a 304 for it.
+RESPONSE_SCHEMA = 2
+
+
+class MemoryCache:
+    """
+    In-process LRU cache with a TTL on every entry.
+
+    Attributes:
+        max_entries (int): Entries kept before the least recently used are
+            evicted.
+        ttl (int): Seconds an entry stays valid.
+    """
+
+    name = "memory"
+
+    def __init__(self, max_entries=1024, ttl=300):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.evictions = 0
+        self._entries = OrderedDict()  # key -> (expires at, value)
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            expires_at, value = entry
+            if expires_at < time.monotonic():
+                del self._entries[key]
+                self.evictions += 1
+                return None
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key, value):
+        with self._lock:
+            self._entries[key] = (time.monotonic() + self.ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def stats(self):
+        return {"entries": len(self._entries), "evictions": self.evictions}
+
+
+class RedisCache:
+    """
+    Cache backed by a Redis-compatible server, shared by every worker
+    process. Entries expire after the TTL; LRU eviction is left to the
+    server's maxmemory-policy.
+
+    Attributes:
+        url (str): Redis connection URL.
+        ttl (int): Seconds an entry stays valid.
+        prefix (str): Prefix of every key written by the cache.
+    """
+
+    name = "redis"
+
+    def __init__(self, url="redis://localhost:6379/0", ttl=300,
+                 prefix="budgetai:"):
+        if redis is None:
+            raise RuntimeError(
+                "The redis cache backend requires the 'redis' package")
+        self.client = redis.Redis.from_url(url)
+        self.ttl = ttl
+        self.prefix = prefix
+
+    def get(self, key):
+        data = self.client.get(self.prefix + key)
+        if data is None:
+            return None
+        meta, body = data.split(b"\n", 1)
+        status, headers = json.loads(meta)
+        return status, headers, body
+
+    def set(self, key, value):
+        status, headers, body = value
+        meta = json.dumps([status, headers]).encode("utf-8")
+        self.client.set(self.prefix + key, meta + b"\n" + body, ex=self.ttl)
+
+    def stats(self):
+        return {}
+
+
+class QueryCache:
+    """
+    Caches successful query responses per user and counts hits and misses.
+    Backend errors are logged and treated as misses, so an unavailable
+    cache server never fails a request.
+
+    Attributes:
+        backend: MemoryCache or RedisCache storing the responses.
+        get_version (callable): Returns the data version of a user, or None
+            when it is unknown and responses must not be cached.
+        namespace (str): Response schema and build the keys are scoped to.
+    """
+
+    def __init__(self, backend, get_version=None,
+                 namespace=str(RESPONSE_SCHEMA)):
+        self.backend = backend
+        self.get_version = get_version or get_data_version
+        self.namespace = namespace
+        self.hits = 0
+        self.misses = 0
+        self.not_modified = 0
+        self.invalidations = 0
+        self._lock = threading.Lock()
+
+    def _count(self, counter):
+        with self._lock:
+            setattr(self, counter, getattr(self, counter) + 1)
+
+    def make_key(self, user_id, version):
+        """
+        Builds the cache key of the current request for a user at a data
+        version.
+        """
+        params = {
+            "args": sorted(request.args.items(multi=True)),
+            "body": request.get_json(silent=True) if request.is_json else None,
+            # Transaction lists are negotiated on Accept
+            "accept": request.headers.get("Accept"),
+        }
+        digest = hashlib.blake2b(
+            json.dumps(params, sort_keys=True, default=str).encode("utf-8"),
+            digest_size=16,
+        ).hexdigest()
+        return (f"query:{self.namespace}:{user_id}:{version}:"
+                f"{request.method}:{request.path}:{digest}")
+
+    def make_etag(self, key):
+        """
+        Derives the ETag of a response from its cache key, which holds the
+        response schema, build and the user's data version.
+        """
+        return hashlib.blake2b(key.encode("utf-8"), digest_size=16).hexdigest()
+
+    @staticmethod
+    def matching_etag(etag):
+        """
+        Returns the variant of an ETag (plain or with a content coding
+        suffix) named in the request's If-None-Match header, or None.
+        """
+        if request.method not in ("GET", "HEAD"):
+            return None
+        for suffix in ETAG_ENCODING_SUFFIXES:
+            if request.if_none_match.contains(etag + suffix):
+                return etag + suffix
+        return None
+
+    def cached(self, view):
+        """
+        Decorator that serves a route from the cache when the user's data has
+        not changed since the response was stored, or answers 304 when the
+        client already holds it. Only 200 responses are cached.
+        """
+        @wraps(view)
+        def wrap(*args, **kwargs):
+            user_id = session.get("user", {}).get("_id")
+            if user_id is None:
+                return view(*args, **kwargs)
+
+            version = self.get_version(user_id)
+            if version is None:
+                return view(*args, **kwargs)
+            key = self.make_key(user_id, version)
+            etag = self.make_etag(key)
+
+            matched = self.matching_etag(etag)
+            if matched is not None:
+                self._count("not_modified")
+                response = current_app.response_class(status=304)
+                response.set_etag(matched)
+                return self.revalidate(response)
+
+            try:
+                entry = self.backend.get(key)
+            except Exception as e:
+                logging.error(f"Query cache lookup failed: {str(e)}")
+                entry = None
+
+            if entry is not None:
+                self._count("hits")
+                status, headers, body = entry
+                response = current_app.response_class(
+                    body, status=status, headers=headers)
+                response.headers["X-Cache"] = "HIT"
+                response.set_etag(etag)
+                return self.revalidate(response)
+
+            self._count("misses")
+            response = make_response(view(*args, **kwargs))
+            if response.status_code == 200 and not response.is_streamed:
+                headers = {
+                    name: response.headers[name]
+                    for name in CACHED_HEADERS if name in response.headers
+                }
+                try:
+                    self.backend.set(
+                        key, (response.status_code, headers, response.get_data()))
+                except Exception as e:
+                    logging.error(f"Query cache store failed: {str(e)}")
+                response.set_etag(etag)
+                self.revalidate(response)
+            response.headers["X-Cache"] = "MISS"
+            return response
+
+        return wrap
+
+    @staticmethod
+    def revalidate(response):
+        """
+        Lets browsers keep a user's response but revalidate it every time.
+        """
+        response.headers["Cache-Control"] = "private, no-cache"
+        return response
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            "backend": self.backend.name,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": round(self.hits / lookups, 3) if lookups else None,
+            "not_modified": self.not_modified,
+            "invalidations": self.invalidations,
+            **self.backend.stats(),
+        }
+
+
+def init_query_cache(app):
+    """
+    Attaches a QueryCache to the Flask app, using the backend named by
+    QUERY_CACHE_BACKEND ("memory", "redis" or "none").
+    """
+    app.config.setdefault(
+        "QUERY_CACHE_BACKEND", os.getenv("QUERY_CACHE_BACKEND", "memory"))
+    app.config.setdefault(
+        "QUERY_CACHE_MAX_ENTRIES", int(os.getenv("QUERY_CACHE_MAX_ENTRIES", 1024)))
+    app.config.setdefault(
+        "QUERY_CACHE_TTL", int(os.getenv("QUERY_CACHE_TTL", 300)))
+    app.config.setdefault(
+        "QUERY_CACHE_REDIS_URL",
+        os.getenv("QUERY_CACHE_REDIS_URL", "redis://localhost:6379/0"))
+    # Identifies the deployed build, such as a git commit
+    app.config.setdefault("APP_VERSION", os.getenv("APP_VERSION", ""))
+
+    backend_name = app.config["QUERY_CACHE_BACKEND"]
+    if backend_name == "none":
+        return None
+    if backend_name == "redis":
+        backend = RedisCache(
+            app.config["QUERY_CACHE_REDIS_URL"], ttl=app.config["QUERY_CACHE_TTL"])
+    else:
+        backend = MemoryCache(
+            max_entries=app.config["QUERY_CACHE_MAX_ENTRIES"],
+            ttl=app.config["QUERY_CACHE_TTL"],
+        )
+    cache = QueryCache(
+        backend, namespace=f"{RESPONSE_SCHEMA}.{app.config['APP_VERSION']}")
+    app.extensions["query_cache"] = cache
+    return cache
+
+
+def cached_query(view):
+    """
+    Route decorator that caches the view through the app's QueryCache, if
+    one is configured.
+    """
+    @wraps(view)
+    def wrap(*args, **kwargs):
+        cache = current_app.extensions.get("query_cache")
+        if cache is None:
+            return view(*args, **kwargs)
+        return cache.cached(view)(*args, **kwargs)
+
+    return wrap
+
+
+def get_data_version(user_id, db=None):
+    """
+    Returns the current data version of a user, or None when the user does
+    not exist or the version cannot be read.
+
+    Parameters:
+        user_id (str): The ID of the user.
+        db: Database handle, the request's database by default.
+    """
+    db = db if db is not None else get_db()
+    try:
+        user = db["users"].find_one({"_id": user_id}, {DATA_VERSION: 1})
+    except Exception as e:
+        logging.error(f"Data version lookup failed: {str(e)}")
+        return None
+    if user is None:
+        return None
+    return user.get(DATA_VERSION, 0)
+
+
+def bump_data_version(db, user_id):
+    """
+    Increments the data version of a user, so that no worker serves query
+    results cached before the change. Called after any write to the user's
+    transactions.
+
+    Parameters:
+        db: Database handle.
+        user_id (str): The ID of the user whose data changed.
+    """
+    try:
+        db["users"].update_one({"_id": user_id}, {"$inc": {DATA_VERSION: 1}})
+    except Exception as e:
+        logging.error(f"Data version update failed: {str(e)}")
+        return
+    if has_app_context():
+        cache = current_app.extensions.get("query_cache")
+        if cache is not None:
+            cache._count("invalidations")
@@ -0,0 +1,81 @@
+"""
+Response compression for JSON and text responses.
+
+Responses at or above COMPRESS_MIN_SIZE bytes are compressed with brotli
+(when the optional brotli package is installed) or gzip, whichever the
+client prefers. Streamed responses, such as exports, compress themselves.
+"""
+import gzip
+import os
+
+from flask import current_app, request
+
+from utils.wire import ARROW_MIMETYPE, COLUMNS_MIMETYPE, MSGPACK_MIMETYPE
+
+try:
+    import brotli
+except ImportError:  # Optional dependency, only needed for brotli encoding
+    brotli = None
+
+COMPRESSIBLE_TYPES = (
+    "application/json", "text/csv", "text/plain",
+    COLUMNS_MIMETYPE, MSGPACK_MIMETYPE, ARROW_MIMETYPE,
+)
+
+
+def available_encodings():
+    """
+    Returns the supported content codings, most preferred first.
+    """
+    return ("br", "gzip") if brotli is not None else ("gzip",)
+
+
+def compress(data, encoding, config):
+    """
+    Compresses a body with a content coding from available_encodings().
+    """
+    if encoding == "br":
+        return brotli.compress(data, quality=config["COMPRESS_BROTLI_QUALITY"])
+    return gzip.compress(data, compresslevel=config["COMPRESS_LEVEL"])
+
+
+def compress_response(response):
+    """
+    after_request hook that compresses eligible responses. Strong ETags get
+    the coding as a suffix, since each coding is a different representation.
+    """
+    if (response.status_code != 200
+            or response.direct_passthrough
+            or response.is_streamed
+            or "Content-Encoding" in response.headers
+            or response.mimetype not in COMPRESSIBLE_TYPES):
+        return response
+
+    config = current_app.config
+    data = response.get_data()
+    if len(data) < config["COMPRESS_MIN_SIZE"]:
+        return response
+
+    response.vary.add("Accept-Encoding")
+    encoding = request.accept_encodings.best_match(available_encodings())
+    if encoding is None:
+        return response
+
+    response.set_data(compress(data, encoding, config))
+    response.headers["Content-Encoding"] = encoding
+    etag, weak = response.get_etag()
+    if etag and not weak:
+        response.set_etag(f"{etag}-{encoding}")
+    return response
+
+
+def init_compression(app):
+    """
+    Sets the COMPRESS_* defaults used by compress_response.
+    """
+    app.config.setdefault(
+        "COMPRESS_MIN_SIZE", int(os.getenv("COMPRESS_MIN_SIZE", 1024)))
+    app.config.setdefault(
+        "COMPRESS_LEVEL", int(os.getenv("COMPRESS_LEVEL", 6)))
+    app.config.setdefault(
+        "COMPRESS_BROTLI_QUALITY", int(os.getenv("COMPRESS_BROTLI_QUALITY", 4)))
@@ -7,6 +7,8 @@ def login_required(f):
     """
     Decorator to restrict access to certain routes to logged-in users only.
     If the user is not logged in, they are redirected to the home page.
+    The session is resolved once per request by the session interface,
+    usually from its in-process cache, so the check itself is a dict lookup.
     """
 
     @wraps(f)
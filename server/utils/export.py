@@ -0,0 +1,93 @@
+"""
+Streaming serializers for transaction exports.
+
+Each serializer consumes a Mongo cursor and yields encoded chunks, so an
+export never holds more than one cursor batch and one output buffer in
+memory regardless of how many transactions are exported.
+"""
+import csv
+import io
+import json
+import zlib
+from datetime import datetime
+
+# Fields written to every export, in CSV column order
+EXPORT_FIELDS = ("_id", "transaction_date", "description", "category", "amount")
+
+# Encoded output is buffered up to this size before a chunk is yielded
+CHUNK_SIZE = 64 * 1024
+
+
+def _export_value(value):
+    if isinstance(value, datetime):
+        return value.date().isoformat()
+    return value
+
+
+def _buffered(lines):
+    """
+    Joins small encoded lines into chunks of about CHUNK_SIZE bytes.
+    """
+    buffer = []
+    size = 0
+    for line in lines:
+        buffer.append(line)
+        size += len(line)
+        if size >= CHUNK_SIZE:
+            yield b"".join(buffer)
+            buffer = []
+            size = 0
+    if buffer:
+        yield b"".join(buffer)
+
+
+def iter_ndjson(transactions):
+    """
+    Yields transactions as newline-delimited JSON, one object per line.
+    """
+    def lines():
+        for transaction in transactions:
+            record = {
+                field: _export_value(transaction.get(field))
+                for field in EXPORT_FIELDS
+            }
+            yield (json.dumps(record) + "\n").encode("utf-8")
+
+    return _buffered(lines())
+
+
+def iter_csv(transactions):
+    """
+    Yields transactions as CSV with a header row.
+    """
+    def lines():
+        row = io.StringIO()
+        writer = csv.writer(row)
+        writer.writerow(EXPORT_FIELDS)
+        for transaction in transactions:
+            yield row.getvalue().encode("utf-8")
+            row.seek(0)
+            row.truncate()
+            writer.writerow(
+                [_export_value(transaction.get(field)) for field in EXPORT_FIELDS])
+        yield row.getvalue().encode("utf-8")
+
+    return _buffered(lines())
+
+
+def gzip_chunks(chunks):
+    """
+    Compresses a stream of chunks into a single gzip member, flushing after
+    each chunk so clients can decode output as it arrives.
+    """
+    compressor = zlib.compressobj(wbits=zlib.MAX_WBITS | 16)
+    for chunk in chunks:
+        yield compressor.compress(chunk) + compressor.flush(zlib.Z_SYNC_FLUSH)
+    yield compressor.flush()
+
+
+# Supported export formats: name -> (serializer, mimetype, file extension)
+EXPORT_FORMATS = {
+    "ndjson": (iter_ndjson, "application/x-ndjson", "ndjson"),
+    "csv": (iter_csv, "text/csv", "csv"),
+}
@@ -0,0 +1,232 @@
+"""
+Spending insights generated from a statistical summary of a user's
+transactions.
+
+Only the compact summary (see utils.summary) is sent to the LLM, never the
+raw transactions. Summaries and answers are cached per user and tagged
+with the user's data version (see utils.cache), so they are rebuilt only
+after the user's transactions change.
+"""
+import os
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future
+
+import pandas as pd
+
+from utils.summary import summarize_transactions, summary_context
+
+# Columns summarized; identifiers and derived keys are left out
+FRAME_COLUMNS = ("transaction_date", "description", "category", "amount")
+
+
+def build_transactions_frame(db, user_id):
+    """
+    Loads a user's transactions into a compact DataFrame: only the columns
+    the summary needs, with categorical text columns and float32 amounts.
+
+    Parameters:
+        db: Database handle.
+        user_id (str): The ID of the user.
+
+    Returns:
+        DataFrame: One row per transaction, ordered by date.
+    """
+    columns = {column: [] for column in FRAME_COLUMNS}
+    cursor = db["transactions"].find(
+        {"user_id": user_id},
+        {"_id": 0, **dict.fromkeys(FRAME_COLUMNS, 1)},
+    ).sort("transaction_date", 1)
+    for transaction in cursor:
+        for column, values in columns.items():
+            values.append(transaction.get(column))
+
+    return pd.DataFrame({
+        "transaction_date": pd.to_datetime(
+            columns["transaction_date"], errors="coerce"),
+        "description": pd.Categorical(columns["description"]),
+        "category": pd.Categorical(columns["category"]),
+        "amount": pd.to_numeric(
+            pd.Series(columns["amount"], dtype=object), errors="coerce"
+        ).astype("float32"),
+    })
+
+
+def insights_messages(context, prompt):
+    """
+    Builds the chat messages asking the LLM to answer a prompt from a
+    spending summary.
+    """
+    return [
+        {
+            "role": "system",
+            "content": (
+                "You are a personal finance assistant. Answer using only the "
+                "spending summary below. Amounts are in dollars; positive "
+                "amounts are spending. change_pct is the month-over-month "
+                "change as a fraction.\n" + context
+            ),
+        },
+        {"role": "user", "content": prompt},
+    ]
+
+
+class InsightsCache:
+    """
+    LRU cache holding, per user, the statistical summary of their
+    transactions and the insights already generated from it. Entries expire
+    after the TTL even if the data version did not change.
+
+    Locks are only held to read and update the cache. Concurrent requests
+    needing the same summary or the same insights wait for the one request
+    building them instead of building them again; other users never wait.
+
+    Attributes:
+        max_users (int): Users kept before the least recently used entry is
+            evicted.
+        ttl (float): Seconds an entry stays valid.
+    """
+
+    def __init__(self, max_users=64, ttl=3600):
+        self.max_users = max_users
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()  # user_id -> entry dict
+        self._in_flight = {}  # key -> Future of the summary or insights
+        self._lock = threading.Lock()
+
+    def _shared(self, key, build):
+        """
+        Runs build for the first caller with a key; callers arriving while it
+        runs wait for and return its result, or raise its error.
+        """
+        with self._lock:
+            future = self._in_flight.get(key)
+            building = future is None
+            if building:
+                future = self._in_flight[key] = Future()
+        if not building:
+            return future.result()
+        try:
+            result = build()
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        else:
+            future.set_result(result)
+            return result
+        finally:
+            with self._lock:
+                del self._in_flight[key]
+
+    def _entry(self, db, user_id, version):
+        with self._lock:
+            entry = self._entries.get(user_id)
+            if entry is not None and version is not None \
+                    and entry["version"] == version \
+                    and entry["expires_at"] > time.monotonic():
+                self._entries.move_to_end(user_id)
+                return entry
+
+        def build():
+            summary = summarize_transactions(
+                build_transactions_frame(db, user_id))
+            entry = {
+                "version": version,
+                "expires_at": time.monotonic() + self.ttl,
+                "context": summary_context(summary) if summary else None,
+                "insights": {},
+            }
+            with self._lock:
+                self._entries[user_id] = entry
+                self._entries.move_to_end(user_id)
+                while len(self._entries) > self.max_users:
+                    self._entries.popitem(last=False)
+            return entry
+
+        if version is None:
+            return build()
+        return self._shared(("summary", user_id, version), build)
+
+    def lookup(self, db, user_id, version, prompt):
+        """
+        Returns the cache entry of a user, rebuilding its summary if the
+        data version changed, and the insights already generated for a
+        prompt, without calling the LLM.
+
+        Returns:
+            tuple: (entry, insights or None). The entry's "context" is None
+            when the user has no transactions.
+        """
+        entry = self._entry(db, user_id, version)
+        insights = entry["insights"].get(prompt)
+        if entry["context"] is not None:
+            if insights is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+        return entry, insights
+
+    @staticmethod
+    def store(entry, prompt, insights):
+        """
+        Stores insights generated for a prompt from an entry of lookup.
+        """
+        entry["insights"][prompt] = insights
+
+    def get_insights(self, db, user_id, version, prompt, complete):
+        """
+        Returns the insights for a prompt, generating them only when the
+        user's data changed since they were last generated. A version of
+        None disables reuse.
+
+        Parameters:
+            db: Database handle.
+            user_id (str): The ID of the user.
+            version: The user's data version.
+            prompt (str): The question to answer.
+            complete (callable): Sends chat messages to the LLM and returns
+                the answer text.
+
+        Returns:
+            str: The answer, or None when the user has no transactions.
+        """
+        entry, insights = self.lookup(db, user_id, version, prompt)
+        if entry["context"] is None or insights is not None:
+            return insights
+
+        def generate():
+            # Generated by a request that finished since the lookup
+            if prompt in entry["insights"]:
+                return entry["insights"][prompt]
+            insights = complete(insights_messages(entry["context"], prompt))
+            self.store(entry, prompt, insights)
+            return insights
+
+        if version is None:
+            return generate()
+        # Concurrent requests for the same prompt wait for one generation
+        return self._shared(("insights", user_id, version, prompt), generate)
+
+    def stats(self):
+        return {"users": len(self._entries), "hits": self.hits,
+                "misses": self.misses}
+
+
+def init_insights_cache(app):
+    """
+    Attaches an InsightsCache to the Flask app.
+    """
+    app.config.setdefault(
+        "INSIGHTS_CACHE_MAX_USERS",
+        int(os.getenv("INSIGHTS_CACHE_MAX_USERS", 64)))
+    app.config.setdefault(
+        "INSIGHTS_CACHE_TTL", float(os.getenv("INSIGHTS_CACHE_TTL", 3600)))
+    cache = InsightsCache(
+        max_users=app.config["INSIGHTS_CACHE_MAX_USERS"],
+        ttl=app.config["INSIGHTS_CACHE_TTL"],
+    )
+    app.extensions["insights_cache"] = cache
+    return cache
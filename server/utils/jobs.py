@@ -0,0 +1,308 @@
+import logging
+import os
+import shutil
+import socket
+import tempfile
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta, timezone
+
+from database.db import get_db
+from database.leases import acquire_lease, release_lease, renew_leases
+from utils.metrics import INGEST_ROWS_PER_SECOND
+from utils.upload import Upload
+
+# Uploads larger than this are spooled to a temporary file instead of memory
+SPOOL_MAX_MEMORY = 8 * 1024 * 1024
+
+INGEST_JOBS = "ingest_jobs"
+ACTIVE_STATUSES = ("queued", "running")
+INTERRUPTED_ERROR = (
+    "The server stopped before this upload was processed; upload the file again")
+
+
+class IngestionJobQueue:
+    """
+    Runs CSV ingestion in the background on a thread pool.
+
+    Job state and progress are stored in the ingest_jobs collection so any
+    worker process can report on them. Jobs from the same user run one at a
+    time across every worker process: a job starts only once it holds the
+    user's lease in the ingest_locks collection. Within a process, a user's
+    jobs start in submission order.
+
+    A dispatcher thread starts jobs as leases become free and periodically
+    renews the leases and the heartbeat_at of the jobs this process owns.
+    Jobs whose heartbeat is older than the lease, because the process that
+    owned them stopped, are marked as failed by any process.
+
+    Attributes:
+        app: Flask app whose context the jobs run in.
+        max_workers (int): Maximum number of jobs running at once.
+        batch_size (int): Number of transactions per bulk write.
+        lease_seconds (float): Time a lease or heartbeat stays valid without
+            being renewed.
+        poll_interval (float): Seconds between attempts to start jobs
+            waiting for a lease held by another process.
+    """
+
+    def __init__(self, app, max_workers=2, batch_size=10000, lease_seconds=60,
+                 poll_interval=1.0):
+        self.app = app
+        self.max_workers = max_workers
+        self.batch_size = batch_size
+        self.lease_seconds = lease_seconds
+        self.poll_interval = poll_interval
+        self._executor = None
+        self._pid = None
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._pending = []  # (job_id, user_id, spool) waiting for a lease
+        self._running_users = set()
+        self.worker_id = None
+
+    @property
+    def executor(self):
+        # Created lazily, and again after a fork, since threads do not
+        # survive into forked workers
+        if self._executor is None or self._pid != os.getpid():
+            self._executor = ThreadPoolExecutor(
+                max_workers=self.max_workers,
+                thread_name_prefix="ingest",
+            )
+            self._pid = os.getpid()
+            self._pending = []
+            self._running_users = set()
+            self._wake = threading.Event()
+            self.worker_id = (
+                f"{socket.gethostname()}:{self._pid}:{uuid.uuid4().hex[:8]}")
+            threading.Thread(
+                target=self._dispatch_forever, name="ingest-dispatcher",
+                daemon=True,
+            ).start()
+        return self._executor
+
+    def _db(self):
+        return self.app.extensions["mongo"].get_db()
+
+    def submit(self, stream, user_id):
+        """
+        Spools the upload so it outlives the request, records a queued job
+        and schedules it behind any earlier jobs from the same user.
+
+        Parameters:
+            stream: Binary file-like object holding the CSV data.
+            user_id (str): The ID of the user uploading the file.
+
+        Returns:
+            str: The job ID.
+        """
+        spool = tempfile.SpooledTemporaryFile(max_size=SPOOL_MAX_MEMORY)
+        shutil.copyfileobj(stream, spool)
+        spool.seek(0)
+
+        with self._lock:
+            self.executor  # Starts the dispatcher in this process
+            worker_id = self.worker_id
+        job_id = uuid.uuid4().hex
+        now = datetime.now(timezone.utc)
+        get_db()[INGEST_JOBS].insert_one({
+            "_id": job_id,
+            "user_id": user_id,
+            "status": "queued",
+            "owner": worker_id,
+            "created_at": now,
+            "heartbeat_at": now,
+            "rows_processed": 0,
+            "rows_rejected": 0,
+            "inserted": 0,
+            "duplicates": 0,
+            "failed": 0,
+        })
+
+        with self._lock:
+            self._pending.append((job_id, user_id, spool))
+        self._wake.set()
+        return job_id
+
+    def _acquire(self, user_id):
+        """
+        Takes the user's lease unless another job holds an unexpired one.
+        """
+        return acquire_lease(
+            self._db(), user_id, self.worker_id, self.lease_seconds)
+
+    def _release(self, user_id):
+        release_lease(self._db(), user_id, self.worker_id)
+
+    def _dispatch(self):
+        """
+        Starts every pending job whose user's lease can be taken.
+        """
+        with self._lock:
+            pending = list(self._pending)
+            busy = set(self._running_users)
+        for job in pending:
+            job_id, user_id, spool = job
+            if user_id in busy:
+                continue  # Keep the user's later jobs in submission order
+            busy.add(user_id)
+            if not self._acquire(user_id):
+                continue
+            with self._lock:
+                self._pending.remove(job)
+                self._running_users.add(user_id)
+            self.executor.submit(self._run_job, job_id, user_id, spool)
+
+    def _dispatch_forever(self):
+        heartbeat_interval = self.lease_seconds / 3
+        next_heartbeat = time.monotonic()
+        while True:
+            try:
+                self._dispatch()
+                if time.monotonic() >= next_heartbeat:
+                    self.heartbeat()
+                    self.fail_stale_jobs()
+                    next_heartbeat = time.monotonic() + heartbeat_interval
+            except Exception as e:
+                logging.error(f"Ingestion dispatcher error: {str(e)}")
+            self._wake.wait(self.poll_interval)
+            self._wake.clear()
+
+    def heartbeat(self):
+        """
+        Renews the leases and job heartbeats owned by this process.
+        """
+        db = self._db()
+        renew_leases(db, self.worker_id, self.lease_seconds)
+        db[INGEST_JOBS].update_many(
+            {"owner": self.worker_id, "status": {"$in": list(ACTIVE_STATUSES)}},
+            {"$set": {"heartbeat_at": datetime.now(timezone.utc)}},
+        )
+
+    def fail_stale_jobs(self, db=None):
+        """
+        Marks queued and running jobs whose owner stopped renewing their
+        heartbeat as failed. Their uploads were only held by that process,
+        so they cannot be resumed. Run on startup and by the dispatcher.
+
+        Parameters:
+            db: Database handle, the app's database by default.
+
+        Returns:
+            int: Number of jobs marked as failed.
+        """
+        db = db if db is not None else self._db()
+        now = datetime.now(timezone.utc)
+        stale = now - timedelta(seconds=self.lease_seconds)
+        result = db[INGEST_JOBS].update_many(
+            {
+                "status": {"$in": list(ACTIVE_STATUSES)},
+                "$or": [{"heartbeat_at": {"$lt": stale}},
+                        {"heartbeat_at": {"$exists": False}}],
+            },
+            {"$set": {
+                "status": "failed",
+                "error": INTERRUPTED_ERROR,
+                "finished_at": now,
+            }},
+        )
+        if result.modified_count:
+            logging.warning(
+                f"Marked {result.modified_count} interrupted ingestion jobs as failed")
+        return result.modified_count
+
+    def _run_job(self, job_id, user_id, spool):
+        try:
+            with self.app.app_context():
+                self._run(job_id, user_id, spool)
+        finally:
+            spool.close()
+            try:
+                self._release(user_id)
+            except Exception as e:
+                logging.error(f"Error releasing ingestion lease: {str(e)}")
+            with self._lock:
+                self._running_users.discard(user_id)
+            self._wake.set()
+
+    def _run(self, job_id, user_id, spool):
+        db = get_db()
+        jobs = db[INGEST_JOBS]
+        started = time.perf_counter()
+        jobs.update_one(
+            {"_id": job_id},
+            {"$set": {"status": "running",
+                      "started_at": datetime.now(timezone.utc),
+                      "heartbeat_at": datetime.now(timezone.utc)}},
+        )
+
+        def report(summary, **fields):
+            rows = summary["inserted"] + summary["duplicates"]
+            elapsed = time.perf_counter() - started
+            jobs.update_one({"_id": job_id}, {"$set": {
+                "rows_processed":
+                    rows + summary["failed"] + summary["rejected"],
+                "rows_rejected": summary["rejected"],
+                "inserted": summary["inserted"],
+                "duplicates": summary["duplicates"],
+                "failed": summary["failed"],
+                "rows_per_second": round(rows / elapsed, 1) if elapsed else None,
+                **fields,
+            }})
+
+        try:
+            summary = Upload(db).process_stream(
+                spool, user_id, batch_size=self.batch_size, progress=report)
+        except Exception as e:
+            logging.error(f"Ingestion job {job_id} failed: {str(e)}")
+            jobs.update_one({"_id": job_id}, {"$set": {
+                "status": "failed",
+                "error": str(e),
+                "finished_at": datetime.now(timezone.utc),
+            }})
+            return
+
+        rows = summary["inserted"] + summary["duplicates"]
+        elapsed = time.perf_counter() - started
+        if rows and elapsed:
+            INGEST_ROWS_PER_SECOND.observe(rows / elapsed)
+        report(
+            summary,
+            status="done",
+            rejected_rows=summary["rejected_rows"],
+            finished_at=datetime.now(timezone.utc),
+        )
+
+
+def init_ingestion_queue(app):
+    """
+    Attaches an IngestionJobQueue to the Flask app.
+    """
+    app.config.setdefault(
+        "UPLOAD_WORKERS", int(os.getenv("UPLOAD_WORKERS", 2)))
+    app.config.setdefault(
+        "UPLOAD_LEASE_SECONDS", float(os.getenv("UPLOAD_LEASE_SECONDS", 60)))
+    app.config.setdefault(
+        "UPLOAD_POLL_INTERVAL", float(os.getenv("UPLOAD_POLL_INTERVAL", 1)))
+    queue = IngestionJobQueue(
+        app,
+        max_workers=app.config["UPLOAD_WORKERS"],
+        batch_size=app.config["UPLOAD_BATCH_SIZE"],
+        lease_seconds=app.config["UPLOAD_LEASE_SECONDS"],
+        poll_interval=app.config["UPLOAD_POLL_INTERVAL"],
+    )
+    app.extensions["ingest_queue"] = queue
+    # Jobs of a previous run were lost with its process
+    app.extensions["mongo"].on_connect(queue.fail_stale_jobs)
+    return queue
+
+
+def get_job(job_id, user_id):
+    """
+    Returns the status document of a user's ingestion job, or None.
+    """
+    return get_db()[INGEST_JOBS].find_one(
+        {"_id": job_id, "user_id": user_id}, {"user_id": 0})
@@ -0,0 +1,485 @@
+"""
+Azure OpenAI chat client shared by the chat routes.
+
+Model calls use AsyncAzureOpenAI. Served by the ASGI app (see asgi.py), the
+chat views defer their model call with defer_chat, and the call is awaited
+on the server's event loop, so an in-flight chat holds no worker thread.
+Under a WSGI server, calls run on a dedicated background event loop while
+the request thread waits for the result.
+
+Concurrency is bounded: when every slot is taken, new chats are turned away
+after a short wait. Calls are cancelled when they time out or, for
+streams, when the client disconnects.
+"""
+import asyncio
+import os
+import queue
+import threading
+import time
+import weakref
+from contextlib import contextmanager
+
+from flask import Response, current_app, request
+from openai import AsyncAzureOpenAI
+
+from utils.metrics import LLM_FIRST_TOKEN, LLM_REQUEST_DURATION, LLM_TOKENS
+
+# Default generation settings of the chat routes
+CHAT_OPTIONS = {
+    "max_tokens": 800,
+    "temperature": 0.7,
+    "top_p": 0.95,
+    "frequency_penalty": 0,
+    "presence_penalty": 0,
+    "stop": None,
+}
+
+
+# WSGI environ key set by the ASGI app on requests whose model calls it runs
+ASYNC_CHAT_ENVIRON_KEY = "budgetai.async_chat"
+# Seconds between attempts to take a chat slot on an event loop
+SLOT_POLL_INTERVAL = 0.05
+
+
+class ChatBusyError(Exception):
+    """
+    Raised when no chat slot frees up within the queue timeout.
+    """
+
+
+class DeferredChat:
+    """
+    A chat completion a view leaves to the ASGI app, which runs it on its
+    event loop and sends the answer in the view's response.
+
+    Attributes:
+        messages (list): Chat messages to send.
+        stream (bool): Relay the answer as server-sent events.
+        field (str): Key of the answer in the JSON response.
+        on_answer (callable): Called with the complete answer, e.g. to
+            cache it. It runs on a worker thread.
+        key: Concurrent deferred chats with the same key, unless None,
+            share one completion.
+    """
+
+    def __init__(self, messages, stream=False, field="response",
+                 on_answer=None, key=None):
+        self.messages = messages
+        self.stream = stream
+        self.field = field
+        self.on_answer = on_answer
+        self.key = key
+
+
+class LLMRunner:
+    """
+    Runs chat completions on a background event loop.
+
+    Attributes:
+        client_factory (callable): Creates the AsyncAzureOpenAI client. It is
+            called on the event loop thread, once per process.
+        deployment (str): Deployment (model) name.
+        max_concurrency (int): Completions allowed in flight at once.
+        timeout (float): Seconds a completion may take, including streaming.
+        queue_timeout (float): Seconds a request waits for a free slot.
+    """
+
+    def __init__(self, client_factory, deployment, max_concurrency=16,
+                 timeout=60, queue_timeout=5):
+        self.client_factory = client_factory
+        self.deployment = deployment
+        self.max_concurrency = max_concurrency
+        self.timeout = timeout
+        self.queue_timeout = queue_timeout
+        self.in_flight = 0
+        self.completed = 0
+        self.rejected = 0
+        self.timeouts = 0
+        self.cancelled = 0
+        self._slots = threading.BoundedSemaphore(max_concurrency)
+        self._lock = threading.Lock()
+        self._loop = None
+        self._pid = None
+        self._clients = weakref.WeakKeyDictionary()  # event loop -> client
+
+    @property
+    def loop(self):
+        # Started lazily, and again after a fork, since threads do not
+        # survive into forked workers
+        with self._lock:
+            if self._loop is None or self._pid != os.getpid():
+                self._loop = asyncio.new_event_loop()
+                threading.Thread(
+                    target=self._loop.run_forever, name="llm-loop", daemon=True
+                ).start()
+                self._pid = os.getpid()
+                self._clients = weakref.WeakKeyDictionary()
+            return self._loop
+
+    def _get_client(self):
+        # Called on an event loop thread. The client's connection pool is
+        # bound to the loop it was created on, so each loop gets its own.
+        loop = asyncio.get_running_loop()
+        client = self._clients.get(loop)
+        if client is None:
+            client = self._clients[loop] = self.client_factory()
+        return client
+
+    def _count(self, counter, amount=1):
+        with self._lock:
+            setattr(self, counter, getattr(self, counter) + amount)
+
+    def _acquire(self):
+        if not self._slots.acquire(timeout=self.queue_timeout):
+            self._count("rejected")
+            raise ChatBusyError("Too many chats in progress, try again shortly")
+        self._count("in_flight")
+
+    async def _acquire_async(self):
+        # Polls rather than blocking, so the event loop keeps running
+        deadline = time.monotonic() + self.queue_timeout
+        while not self._slots.acquire(blocking=False):
+            if time.monotonic() >= deadline:
+                self._count("rejected")
+                raise ChatBusyError(
+                    "Too many chats in progress, try again shortly")
+            await asyncio.sleep(SLOT_POLL_INTERVAL)
+        self._count("in_flight")
+
+    def _release(self):
+        self._count("in_flight", -1)
+        self._slots.release()
+
+    @staticmethod
+    def _observe(started, mode, outcome):
+        LLM_REQUEST_DURATION.observe(
+            time.perf_counter() - started, mode=mode, outcome=outcome)
+
+    @contextmanager
+    def _slot(self):
+        self._acquire()
+        try:
+            yield
+        finally:
+            self._release()
+
+    async def _call(self, messages, options):
+        completion = await self._get_client().chat.completions.create(
+            model=self.deployment,
+            messages=messages,
+            **{**CHAT_OPTIONS, **options},
+        )
+        if completion.usage is not None:
+            LLM_TOKENS.inc(completion.usage.prompt_tokens, kind="prompt")
+            LLM_TOKENS.inc(
+                completion.usage.completion_tokens, kind="completion")
+        return completion.choices[0].message.content
+
+    def complete(self, messages, **options):
+        """
+        Sends chat messages to the deployment and returns the answer text.
+
+        Raises:
+            ChatBusyError: If no slot frees up within queue_timeout.
+            TimeoutError: If the completion takes longer than timeout.
+        """
+        with self._slot():
+            started = time.perf_counter()
+            future = asyncio.run_coroutine_threadsafe(
+                self._call(messages, options), self.loop)
+            try:
+                answer = future.result(timeout=self.timeout)
+            except TimeoutError:
+                future.cancel()
+                self._count("timeouts")
+                self._observe(started, "complete", "timeout")
+                raise TimeoutError("Chat completion timed out")
+            except Exception:
+                self._observe(started, "complete", "error")
+                raise
+            self._count("completed")
+            self._observe(started, "complete", "success")
+            return answer
+
+    def stream(self, messages, **options):
+        """
+        Starts a streamed chat completion.
+
+        The request is sent before this returns, so busy, connection and API
+        errors are raised here rather than while iterating. Closing the
+        returned generator early, as happens when the client disconnects,
+        cancels the completion.
+
+        Returns:
+            generator: The answer text, one token delta at a time.
+        """
+        deltas = queue.Queue()
+
+        async def produce():
+            stream = await self._get_client().chat.completions.create(
+                model=self.deployment,
+                messages=messages,
+                stream=True,
+                **{**CHAT_OPTIONS, **options},
+            )
+            deltas.put(("started", None))
+            try:
+                async for chunk in stream:
+                    # Azure sends content filter results in chunks without
+                    # choices
+                    if chunk.choices and chunk.choices[0].delta.content:
+                        deltas.put(("delta", chunk.choices[0].delta.content))
+            finally:
+                await stream.close()
+
+        async def run():
+            try:
+                await asyncio.wait_for(produce(), self.timeout)
+            except Exception as e:
+                deltas.put(("error", e))
+            else:
+                deltas.put(("end", None))
+
+        self._acquire()
+        started = time.perf_counter()
+        future = asyncio.run_coroutine_threadsafe(run(), self.loop)
+
+        deadline = time.monotonic() + self.timeout
+
+        def next_item():
+            try:
+                kind, value = deltas.get(
+                    timeout=max(deadline - time.monotonic(), 0))
+            except queue.Empty:
+                kind, value = "error", TimeoutError("Chat completion timed out")
+            if kind == "error":
+                if isinstance(value, TimeoutError):
+                    self._count("timeouts")
+                raise value
+            return kind, value
+
+        def generate():
+            outcome = "cancelled"
+            tokens = 0
+            try:
+                while True:
+                    try:
+                        kind, value = next_item()
+                    except TimeoutError:
+                        outcome = "timeout"
+                        raise
+                    except Exception:
+                        outcome = "error"
+                        raise
+                    if kind == "end":
+                        outcome = "success"
+                        self._count("completed")
+                        return
+                    if tokens == 0:
+                        LLM_FIRST_TOKEN.observe(time.perf_counter() - started)
+                    tokens += 1
+                    LLM_TOKENS.inc(kind="completion")
+                    yield value
+            finally:
+                if outcome != "success" and not future.done():
+                    future.cancel()
+                    if outcome == "cancelled":
+                        self._count("cancelled")
+                self._observe(started, "stream", outcome)
+                self._release()
+
+        try:
+            next_item()  # Wait until the model has accepted the request
+        except TimeoutError:
+            self._observe(started, "stream", "timeout")
+            self._release()
+            raise
+        except BaseException:
+            self._observe(started, "stream", "error")
+            self._release()
+            raise
+        return generate()
+
+    async def acomplete(self, messages, **options):
+        """
+        Coroutine version of complete, run on the caller's event loop.
+
+        Raises:
+            ChatBusyError: If no slot frees up within queue_timeout.
+            TimeoutError: If the completion takes longer than timeout.
+        """
+        await self._acquire_async()
+        started = time.perf_counter()
+        try:
+            answer = await asyncio.wait_for(
+                self._call(messages, options), self.timeout)
+        except TimeoutError:
+            self._count("timeouts")
+            self._observe(started, "complete", "timeout")
+            raise TimeoutError("Chat completion timed out")
+        except BaseException:
+            self._observe(started, "complete", "error")
+            raise
+        finally:
+            self._release()
+        self._count("completed")
+        self._observe(started, "complete", "success")
+        return answer
+
+    async def astream(self, messages, **options):
+        """
+        Coroutine version of stream, run on the caller's event loop. The
+        request is sent before this returns; closing the returned generator
+        early cancels the completion.
+
+        Returns:
+            async generator: The answer text, one token delta at a time.
+        """
+        await self._acquire_async()
+        started = time.perf_counter()
+        deadline = time.monotonic() + self.timeout
+        try:
+            stream = await asyncio.wait_for(
+                self._get_client().chat.completions.create(
+                    model=self.deployment,
+                    messages=messages,
+                    stream=True,
+                    **{**CHAT_OPTIONS, **options},
+                ),
+                self.timeout,
+            )
+        except TimeoutError:
+            self._count("timeouts")
+            self._observe(started, "stream", "timeout")
+            self._release()
+            raise TimeoutError("Chat completion timed out")
+        except BaseException:
+            self._observe(started, "stream", "error")
+            self._release()
+            raise
+
+        async def generate():
+            outcome = "cancelled"
+            tokens = 0
+            chunks = stream.__aiter__()
+            try:
+                while True:
+                    try:
+                        chunk = await asyncio.wait_for(
+                            chunks.__anext__(),
+                            max(deadline - time.monotonic(), 0))
+                    except StopAsyncIteration:
+                        outcome = "success"
+                        self._count("completed")
+                        return
+                    except TimeoutError:
+                        outcome = "timeout"
+                        self._count("timeouts")
+                        raise TimeoutError("Chat completion timed out")
+                    except Exception:
+                        outcome = "error"
+                        raise
+                    # Azure sends content filter results in chunks without
+                    # choices
+                    if not chunk.choices or not chunk.choices[0].delta.content:
+                        continue
+                    if tokens == 0:
+                        LLM_FIRST_TOKEN.observe(time.perf_counter() - started)
+                    tokens += 1
+                    LLM_TOKENS.inc(kind="completion")
+                    yield chunk.choices[0].delta.content
+            finally:
+                if outcome == "cancelled":
+                    self._count("cancelled")
+                self._observe(started, "stream", outcome)
+                self._release()
+                await stream.close()
+
+        return generate()
+
+    def stats(self):
+        return {
+            "in_flight": self.in_flight,
+            "max_concurrency": self.max_concurrency,
+            "completed": self.completed,
+            "rejected": self.rejected,
+            "timeouts": self.timeouts,
+            "cancelled": self.cancelled,
+        }
+
+
+def init_llm(app):
+    """
+    Creates the chat LLMRunner from the AZURE_ENDPOINT, AZURE_API_KEY,
+    DEPLOYMENT_NAME, AZURE_API_VERSION and CHAT_* settings and attaches it
+    to the Flask app.
+    """
+    app.config.setdefault("AZURE_ENDPOINT", os.getenv("AZURE_ENDPOINT"))
+    app.config.setdefault("AZURE_API_KEY", os.getenv("AZURE_API_KEY"))
+    app.config.setdefault("DEPLOYMENT_NAME", os.getenv("DEPLOYMENT_NAME"))
+    app.config.setdefault(
+        "AZURE_API_VERSION",
+        os.getenv("AZURE_API_VERSION", "2024-05-01-preview"))
+    app.config.setdefault(
+        "CHAT_MAX_CONCURRENCY", int(os.getenv("CHAT_MAX_CONCURRENCY", 16)))
+    app.config.setdefault(
+        "CHAT_TIMEOUT", float(os.getenv("CHAT_TIMEOUT", 60)))
+    app.config.setdefault(
+        "CHAT_QUEUE_TIMEOUT", float(os.getenv("CHAT_QUEUE_TIMEOUT", 5)))
+
+    def client_factory():
+        return AsyncAzureOpenAI(
+            azure_endpoint=app.config["AZURE_ENDPOINT"],
+            api_key=app.config["AZURE_API_KEY"],
+            api_version=app.config["AZURE_API_VERSION"],
+        )
+
+    runner = LLMRunner(
+        client_factory,
+        app.config["DEPLOYMENT_NAME"],
+        max_concurrency=app.config["CHAT_MAX_CONCURRENCY"],
+        timeout=app.config["CHAT_TIMEOUT"],
+        queue_timeout=app.config["CHAT_QUEUE_TIMEOUT"],
+    )
+    app.extensions["llm"] = runner
+    return runner
+
+
+def complete_chat(messages, **options):
+    """
+    Sends chat messages to the deployment and returns the answer text.
+    """
+    return current_app.extensions["llm"].complete(messages, **options)
+
+
+def stream_chat(messages, **options):
+    """
+    Starts a streamed chat completion; see LLMRunner.stream.
+    """
+    return current_app.extensions["llm"].stream(messages, **options)
+
+
+def chat_deferred():
+    """
+    Returns whether the current request is served by the ASGI app, which
+    runs deferred chats on its event loop.
+    """
+    return bool(request.environ.get(ASYNC_CHAT_ENVIRON_KEY))
+
+
+def defer_chat(messages, stream=False, field="response", on_answer=None,
+               key=None):
+    """
+    Returns a response whose body the ASGI app fills with the answer to
+    chat messages: {field: answer} as JSON, or server-sent events when
+    streaming. See DeferredChat for the arguments.
+    """
+    response = Response(
+        mimetype="text/event-stream" if stream else "application/json")
+    if stream:
+        # Proxies must not buffer the stream
+        response.headers["Cache-Control"] = "no-cache"
+        response.headers["X-Accel-Buffering"] = "no"
+    response.deferred_chat = DeferredChat(
+        messages, stream, field, on_answer, key)
+    return response
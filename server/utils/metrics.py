@@ -0,0 +1,381 @@
+"""
+Performance metrics in the Prometheus text format.
+
+Counters and histograms are kept in memory per worker process and served
+on /metrics. Route latency is recorded by request hooks, Mongo commands by
+a pymongo command listener, and ingestion and LLM timings by the code that
+does the work. The counters already kept by the connection pool, caches and
+chat runner are exported as gauges when /metrics is scraped.
+
+Requests can also be profiled one at a time: with PROFILE_REQUESTS enabled,
+a request sent with an X-Profile: 1 header runs under cProfile (or
+pyinstrument, when installed and selected) and the profile is written to
+PROFILE_DIR.
+"""
+import cProfile
+import math
+import os
+import re
+import threading
+import time
+from datetime import datetime
+
+from flask import Response, current_app, g, request
+from pymongo import monitoring
+
+try:
+    import pyinstrument
+except ImportError:  # Optional dependency, only needed for PROFILER=pyinstrument
+    pyinstrument = None
+
+# Seconds
+DEFAULT_BUCKETS = (
+    0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+MONGO_BUCKETS = (
+    0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 5)
+ROWS_PER_SECOND_BUCKETS = (
+    100, 500, 1000, 2500, 5000, 10000, 25000, 50000, 100000, 250000)
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+def _escape(value):
+    return (str(value).replace("\\", "\\\\").replace("\n", "\\n")
+            .replace('"', '\\"'))
+
+
+def _format_labels(labelnames, values, extra=()):
+    pairs = list(zip(labelnames, values)) + list(extra)
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape(value)}"'
+                          for name, value in pairs) + "}"
+
+
+def _format_value(value):
+    if value == math.inf:
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Counter:
+    """
+    Monotonic counter, optionally split by labels.
+    """
+
+    type = "counter"
+
+    def __init__(self, name, help, labelnames=()):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1, **labels):
+        key = tuple(labels[name] for name in self.labelnames)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels):
+        return self._values.get(
+            tuple(labels[name] for name in self.labelnames), 0)
+
+    def samples(self):
+        with self._lock:
+            values = dict(self._values)
+        for key, value in sorted(values.items()):
+            yield self.name, _format_labels(self.labelnames, key), value
+
+
+class Histogram:
+    """
+    Histogram of observations with cumulative buckets, a sum and a count.
+    """
+
+    type = "histogram"
+
+    def __init__(self, name, help, labelnames=(), buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(sorted(buckets)) + (math.inf,)
+        self._values = {}  # labels -> [bucket counts, sum, count]
+        self._lock = threading.Lock()
+
+    def observe(self, value, **labels):
+        key = tuple(labels[name] for name in self.labelnames)
+        with self._lock:
+            entry = self._values.get(key)
+            if entry is None:
+                entry = self._values[key] = [[0] * len(self.buckets), 0.0, 0]
+            for index, bound in enumerate(self.buckets):
+                if value <= bound:
+                    entry[0][index] += 1
+                    break
+            entry[1] += value
+            entry[2] += 1
+
+    def count(self, **labels):
+        entry = self._values.get(tuple(labels[name] for name in self.labelnames))
+        return entry[2] if entry else 0
+
+    def samples(self):
+        with self._lock:
+            values = {key: (list(counts), total, count)
+                      for key, (counts, total, count) in self._values.items()}
+        for key, (counts, total, count) in sorted(values.items()):
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets, counts):
+                cumulative += bucket_count
+                yield (f"{self.name}_bucket",
+                       _format_labels(self.labelnames, key,
+                                      [("le", _format_value(bound))]),
+                       cumulative)
+            yield f"{self.name}_sum", _format_labels(self.labelnames, key), total
+            yield f"{self.name}_count", _format_labels(self.labelnames, key), count
+
+
+class StatsGauges:
+    """
+    Exports the numeric fields of a stats() dict as gauges, read when the
+    metrics are rendered. Nothing is exported while the source is missing.
+
+    Attributes:
+        prefix (str): Metric name prefix, e.g. "budgetai_llm".
+        source (callable): Returns the stats dict, or None.
+    """
+
+    type = "gauge"
+
+    def __init__(self, prefix, help, source):
+        self.prefix = prefix
+        self.help = help
+        self.source = source
+
+    def families(self):
+        stats = self.source() or {}
+        for key, value in sorted(stats.items()):
+            if isinstance(value, bool) or not isinstance(value, (int, float)):
+                continue
+            name = f"{self.prefix}_{re.sub(r'[^a-zA-Z0-9_]', '_', key)}"
+            yield name, f"{self.help}: {key}", [(name, "", value)]
+
+
+class MetricsRegistry:
+    """
+    Holds every metric of the process and renders them.
+    """
+
+    def __init__(self):
+        self.metrics = []
+        self.gauges = []
+        self._lock = threading.Lock()
+
+    def counter(self, name, help, labelnames=()):
+        return self._register(Counter(name, help, labelnames))
+
+    def histogram(self, name, help, labelnames=(), buckets=DEFAULT_BUCKETS):
+        return self._register(Histogram(name, help, labelnames, buckets))
+
+    def stats_gauges(self, prefix, help, source):
+        with self._lock:
+            self.gauges.append(StatsGauges(prefix, help, source))
+
+    def _register(self, metric):
+        with self._lock:
+            self.metrics.append(metric)
+        return metric
+
+    def render(self):
+        """
+        Returns every metric in the Prometheus text exposition format.
+        """
+        lines = []
+        families = [(metric.name, metric.help, metric.type, metric.samples())
+                    for metric in self.metrics]
+        for gauges in self.gauges:
+            try:
+                families.extend(
+                    (name, help, gauges.type, samples)
+                    for name, help, samples in gauges.families())
+            except Exception:
+                continue  # A failing source must not break the scrape
+        for name, help, type, samples in families:
+            help = help.replace("\\", "\\\\").replace("\n", "\\n")
+            lines.append(f"# HELP {name} {help}")
+            lines.append(f"# TYPE {name} {type}")
+            for sample_name, labels, value in samples:
+                lines.append(f"{sample_name}{labels} {_format_value(value)}")
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = MetricsRegistry()
+
+HTTP_REQUEST_DURATION = REGISTRY.histogram(
+    "budgetai_http_request_duration_seconds",
+    "Time to handle a request, up to the response headers",
+    ("method", "route", "status"),
+)
+MONGO_COMMANDS = REGISTRY.counter(
+    "budgetai_mongo_commands_total",
+    "Mongo commands sent", ("command", "outcome"),
+)
+MONGO_COMMAND_DURATION = REGISTRY.histogram(
+    "budgetai_mongo_command_duration_seconds",
+    "Mongo command round trip time", ("command",), MONGO_BUCKETS,
+)
+INGEST_ROWS = REGISTRY.counter(
+    "budgetai_ingest_rows_total",
+    "CSV rows ingested, by outcome", ("outcome",),
+)
+INGEST_STAGE_DURATION = REGISTRY.histogram(
+    "budgetai_ingest_batch_duration_seconds",
+    "Time spent per ingestion batch, by stage", ("stage",),
+)
+INGEST_ROWS_PER_SECOND = REGISTRY.histogram(
+    "budgetai_ingest_rows_per_second",
+    "Throughput of finished ingestion jobs", (), ROWS_PER_SECOND_BUCKETS,
+)
+LLM_REQUEST_DURATION = REGISTRY.histogram(
+    "budgetai_llm_request_duration_seconds",
+    "Chat completion time, including streaming", ("mode", "outcome"),
+)
+LLM_FIRST_TOKEN = REGISTRY.histogram(
+    "budgetai_llm_time_to_first_token_seconds",
+    "Time until the first streamed token",
+)
+LLM_TOKENS = REGISTRY.counter(
+    "budgetai_llm_tokens_total",
+    "Tokens used by chat completions. Streamed completions count one "
+    "completion token per delta", ("kind",),
+)
+
+
+class MongoCommandMetrics(monitoring.CommandListener):
+    """
+    Command listener that counts and times every Mongo command.
+    """
+
+    def started(self, event):
+        pass
+
+    def succeeded(self, event):
+        MONGO_COMMANDS.inc(command=event.command_name, outcome="success")
+        MONGO_COMMAND_DURATION.observe(
+            event.duration_micros / 1e6, command=event.command_name)
+
+    def failed(self, event):
+        MONGO_COMMANDS.inc(command=event.command_name, outcome="failure")
+        MONGO_COMMAND_DURATION.observe(
+            event.duration_micros / 1e6, command=event.command_name)
+
+
+def _start_timer():
+    g.metrics_started = time.perf_counter()
+    if current_app.config["PROFILE_REQUESTS"] and \
+            request.headers.get("X-Profile") == "1":
+        g.profiler = start_profiler(current_app.config["PROFILER"])
+
+
+def _record_request(response):
+    started = g.pop("metrics_started", None)
+    if started is not None:
+        # Unmatched URLs share one label so 404 scans cannot grow the series
+        route = request.url_rule.rule if request.url_rule else "unmatched"
+        HTTP_REQUEST_DURATION.observe(
+            time.perf_counter() - started, method=request.method,
+            route=route, status=str(response.status_code))
+    return response
+
+
+def _save_profile(error=None):
+    profiler = g.pop("profiler", None)
+    if profiler is not None:
+        save_profile(profiler, current_app.config["PROFILE_DIR"])
+
+
+def start_profiler(name):
+    """
+    Starts profiling the current thread with cProfile or pyinstrument.
+    """
+    if name == "pyinstrument" and pyinstrument is not None:
+        profiler = pyinstrument.Profiler()
+        profiler.start()
+    else:
+        profiler = cProfile.Profile()
+        profiler.enable()
+    return profiler
+
+
+def save_profile(profiler, directory):
+    """
+    Stops a profiler and writes its output to a file named after the time,
+    method and path of the current request.
+
+    Returns:
+        str: Path of the profile (.prof for cProfile, .html for pyinstrument).
+    """
+    os.makedirs(directory, exist_ok=True)
+    path = re.sub(r"[^a-zA-Z0-9]+", "_", request.path).strip("_") or "root"
+    stem = os.path.join(
+        directory,
+        f"{datetime.now().strftime('%Y%m%d-%H%M%S-%f')}-{request.method}-{path}")
+    if isinstance(profiler, cProfile.Profile):
+        profiler.disable()
+        profiler.dump_stats(f"{stem}.prof")
+        return f"{stem}.prof"
+    profiler.stop()
+    with open(f"{stem}.html", "w") as f:
+        f.write(profiler.output_html())
+    return f"{stem}.html"
+
+
+def _extension_stats(name):
+    def source():
+        extension = current_app.extensions.get(name)
+        return extension.stats() if extension is not None else None
+    return source
+
+
+def init_metrics(app):
+    """
+    Installs the request hooks and the Mongo command listener, and exports
+    the stats of the app's pool, caches and chat runner. Must run before the
+    app's Mongo client is first used.
+    """
+    app.config.setdefault(
+        "PROFILE_REQUESTS",
+        os.getenv("PROFILE_REQUESTS", "false").lower() == "true")
+    app.config.setdefault("PROFILER", os.getenv("PROFILER", "cprofile"))
+    app.config.setdefault("PROFILE_DIR", os.getenv("PROFILE_DIR", "profiles"))
+
+    app.before_request(_start_timer)
+    app.after_request(_record_request)
+    app.teardown_request(_save_profile)
+    app.extensions["mongo"].add_listener(MongoCommandMetrics())
+
+    REGISTRY.stats_gauges(
+        "budgetai_mongo_pool", "Mongo connection pool",
+        lambda: current_app.extensions["mongo"].pool_stats())
+    for prefix, name, help in (
+            ("budgetai_llm", "llm", "Chat completions"),
+            ("budgetai_query_cache", "query_cache", "Query cache"),
+            ("budgetai_prompt_cache", "prompt_cache", "Prompt cache"),
+            ("budgetai_password_hasher", "password_hasher", "Password hashing"),
+    ):
+        REGISTRY.stats_gauges(prefix, help, _extension_stats(name))
+    REGISTRY.stats_gauges(
+        "budgetai_sessions", "Session store",
+        lambda: getattr(current_app.session_interface, "stats", dict)())
+
+    app.extensions["metrics"] = REGISTRY
+    return REGISTRY
+
+
+def metrics_response(registry):
+    """
+    Builds a response holding a registry's metrics in the Prometheus text
+    format.
+    """
+    return Response(registry.render(), content_type=CONTENT_TYPE)
@@ -0,0 +1,228 @@
+"""
+Bank statement CSV formats.
+
+Each format recognizes its statement layout from the CSV header and turns a
+chunk of raw rows into transactions with whole-column pandas operations.
+Parsed chunks have the columns transaction_date (datetime64), description,
+category and amount (float, positive for spending).
+"""
+from abc import ABC, abstractmethod
+
+import pandas as pd
+
+# Registered formats, checked in order, so more specific layouts come first
+PARSERS = []
+
+DEFAULT_CATEGORY = "Uncategorized"
+
+
+class UnsupportedFormatError(ValueError):
+    """
+    Raised when a CSV header does not match any registered bank format.
+    """
+
+
+def register_parser(cls):
+    """
+    Class decorator that adds a CsvFormat subclass to the registry.
+    """
+    PARSERS.append(cls())
+    return cls
+
+
+def normalize_column(name):
+    """
+    Normalizes a header name for matching, e.g. " Transaction Date" ->
+    "transaction date".
+    """
+    return str(name).strip().lower()
+
+
+def detect_format(columns):
+    """
+    Returns the first registered format whose required columns appear in
+    the CSV header.
+
+    Parameters:
+        columns (list): Header column names.
+
+    Raises:
+        UnsupportedFormatError: If no registered format matches.
+    """
+    normalized = {normalize_column(column) for column in columns}
+    for parser in PARSERS:
+        if parser.matches(normalized):
+            return parser
+    raise UnsupportedFormatError(
+        f"Unrecognized CSV format with columns: {', '.join(map(str, columns))}"
+    )
+
+
+def parse_dates(values, formats):
+    """
+    Parses a column of date strings, trying each format in turn for the
+    values that are still unparsed. Invalid dates become NaT.
+
+    Statements repeat the same few hundred dates many times, so each
+    distinct string is parsed once and the results are broadcast back.
+    """
+    codes, uniques = pd.factorize(values)
+    dates = pd.to_datetime(uniques, format=formats[0], errors="coerce")
+    for date_format in formats[1:]:
+        missing = dates.isna()
+        if not missing.any():
+            break
+        dates = dates.where(
+            ~missing,
+            pd.to_datetime(uniques, format=date_format, errors="coerce"),
+        )
+    return pd.Series(dates.take(codes), index=values.index)
+
+
+def parse_amounts(values):
+    """
+    Parses a column of amount strings, allowing thousands separators and
+    currency symbols. Malformed amounts become NaN.
+    """
+    amounts = pd.to_numeric(values, errors="coerce")
+    # Only values that failed the fast path are cleaned and parsed again
+    retry = amounts.isna() & (values != "")
+    if retry.any():
+        cleaned = values[retry].str.replace(r"[$,\s]", "", regex=True)
+        amounts[retry] = pd.to_numeric(cleaned, errors="coerce")
+    return amounts
+
+
+class CsvFormat(ABC):
+    """
+    Base class for a bank statement layout.
+
+    Attributes:
+        name (str): Format identifier reported to clients.
+        required_columns (tuple): Normalized header names that identify it.
+        date_column (str): Normalized name of the transaction date column.
+        date_formats (tuple): strptime formats tried for the date column.
+    """
+
+    name = None
+    required_columns = ()
+    date_column = None
+    date_formats = ("%m/%d/%Y", "%Y-%m-%d")
+
+    def matches(self, columns):
+        return set(self.required_columns) <= columns
+
+    def parse(self, chunk):
+        """
+        Parses a chunk of rows.
+
+        Parameters:
+            chunk (DataFrame): Raw string columns with normalized names.
+
+        Returns:
+            tuple: (parsed DataFrame of accepted rows, Series of rejection
+            reasons indexed like the rejected rows)
+        """
+        dates = parse_dates(chunk[self.date_column], self.date_formats)
+        amounts = self.amounts(chunk)
+        if "category" in chunk:
+            categories = chunk["category"].replace("", DEFAULT_CATEGORY)
+        else:
+            categories = pd.Series(DEFAULT_CATEGORY, index=chunk.index)
+
+        reasons = pd.Series(None, index=chunk.index, dtype=object)
+        reasons = reasons.mask(amounts.isna(), "Malformed amount.")
+        reasons = reasons.mask(
+            dates.isna(),
+            "Invalid transaction date.",
+        )
+        reasons = self.filter_rows(chunk, amounts, reasons)
+
+        accepted = reasons.isna()
+        parsed = pd.DataFrame({
+            "transaction_date": dates[accepted],
+            "description": chunk["description"][accepted],
+            "category": categories[accepted],
+            "amount": amounts[accepted],
+        })
+        return parsed, reasons[~accepted]
+
+    @abstractmethod
+    def amounts(self, chunk):
+        """
+        Returns spending amounts for the chunk, positive for money spent.
+        """
+
+    def filter_rows(self, chunk, amounts, reasons):
+        """
+        Marks rows that are valid but should not be imported, such as card
+        payments, and returns the updated rejection reasons.
+        """
+        return reasons
+
+
+@register_parser
+class ChaseFormat(CsvFormat):
+    """
+    Chase credit card export: purchases are "Sale" rows with negative amounts.
+    """
+
+    name = "chase"
+    date_column = "transaction date"
+    required_columns = (
+        "transaction date", "description", "category", "type", "amount")
+
+    def amounts(self, chunk):
+        return parse_amounts(chunk["amount"]) * -1
+
+    def filter_rows(self, chunk, amounts, reasons):
+        types = chunk["type"]
+        return reasons.mask(
+            reasons.isna() & (types != "Sale"),
+            "Invalid transaction type: '" + types
+            + "'. Only 'Sale' transactions are accepted.",
+        )
+
+
+@register_parser
+class DebitCreditFormat(CsvFormat):
+    """
+    Generic layout with separate debit and credit columns. Debits are
+    imported as spending; credit-only rows (payments, refunds) are skipped.
+    """
+
+    name = "debit_credit"
+    date_column = "date"
+    required_columns = ("date", "description", "debit", "credit")
+
+    def amounts(self, chunk):
+        debits = parse_amounts(chunk["debit"]).abs()
+        # Credit-only rows have an empty debit, not a malformed one
+        return debits.mask(chunk["debit"] == "", 0.0)
+
+    def filter_rows(self, chunk, amounts, reasons):
+        return reasons.mask(
+            reasons.isna() & (amounts <= 0),
+            "Credit transaction. Only debits are accepted.",
+        )
+
+
+@register_parser
+class SignedAmountFormat(CsvFormat):
+    """
+    Generic layout with a single signed amount column, where spending is
+    negative. Positive amounts (payments, refunds) are skipped.
+    """
+
+    name = "signed_amount"
+    date_column = "date"
+    required_columns = ("date", "description", "amount")
+
+    def amounts(self, chunk):
+        return parse_amounts(chunk["amount"]) * -1
+
+    def filter_rows(self, chunk, amounts, reasons):
+        return reasons.mask(
+            reasons.isna() & (amounts <= 0),
+            "Credit transaction. Only debits are accepted.",
+        )
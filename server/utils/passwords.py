@@ -0,0 +1,253 @@
+"""
+Password hashing and login throttling.
+
+pbkdf2_sha256 is CPU bound and holds the GIL, so hashing and verification
+run in a small process pool instead of on request threads. The pool only
+accepts a bounded number of pending jobs; beyond that requests are turned
+away instead of queueing more CPU work. Attempts are also throttled per
+client IP and, for failed logins, per email address.
+"""
+import multiprocessing
+import os
+import threading
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+from passlib.hash import pbkdf2_sha256
+
+# passlib's default work factor for pbkdf2_sha256
+DEFAULT_ROUNDS = 29000
+
+# Workers are started from a single-threaded server process, or spawned where
+# that is unavailable, rather than forked from a process that already runs
+# request and Mongo monitor threads, whose held locks a forked child would
+# inherit
+START_METHOD = (
+    "forkserver" if "forkserver" in multiprocessing.get_all_start_methods()
+    else "spawn")
+
+
+class PasswordHasherBusyError(Exception):
+    """
+    Raised when the hashing pool already has its maximum pending jobs.
+    """
+
+
+def _hash(password, rounds):
+    return pbkdf2_sha256.using(rounds=rounds).hash(password)
+
+
+def _verify(password, hashed):
+    return pbkdf2_sha256.verify(password, hashed)
+
+
+class PasswordHasher:
+    """
+    Hashes and verifies passwords in a process pool.
+
+    Attributes:
+        rounds (int): pbkdf2_sha256 work factor for new hashes.
+        max_workers (int): Hashing processes. 0 hashes on the calling thread.
+        max_pending (int): Jobs allowed queued or running at once.
+    """
+
+    def __init__(self, rounds=DEFAULT_ROUNDS, max_workers=2, max_pending=None):
+        self.rounds = rounds
+        self.max_workers = max_workers
+        self.max_pending = max_pending or max(max_workers, 1) * 4
+        self.completed = 0
+        self.rejected = 0
+        self._handler = pbkdf2_sha256.using(rounds=rounds)
+        self._slots = threading.BoundedSemaphore(self.max_pending)
+        self._lock = threading.Lock()
+        self._executor = None
+        self._pid = None
+
+    @property
+    def executor(self):
+        # Created lazily, and again after a fork, since a pool's processes
+        # belong to the process that started them
+        with self._lock:
+            if self._executor is None or self._pid != os.getpid():
+                self._executor = ProcessPoolExecutor(
+                    max_workers=self.max_workers,
+                    mp_context=multiprocessing.get_context(START_METHOD))
+                self._pid = os.getpid()
+            return self._executor
+
+    def _run(self, function, *args):
+        if not self._slots.acquire(blocking=False):
+            with self._lock:
+                self.rejected += 1
+            raise PasswordHasherBusyError(
+                "Too many sign-ins in progress, try again shortly")
+        try:
+            if self.max_workers == 0:
+                result = function(*args)
+            else:
+                try:
+                    result = self.executor.submit(function, *args).result()
+                except BrokenProcessPool:
+                    # A worker died; start a fresh pool on the next call
+                    with self._lock:
+                        self._executor = None
+                    raise
+            with self._lock:
+                self.completed += 1
+            return result
+        finally:
+            self._slots.release()
+
+    def hash(self, password):
+        """
+        Returns a new hash of a password at the configured work factor.
+        """
+        return self._run(_hash, password, self.rounds)
+
+    def verify(self, password, hashed):
+        """
+        Returns True if the password matches the stored hash.
+        """
+        return self._run(_verify, password, hashed)
+
+    def needs_update(self, hashed):
+        """
+        Returns True if a stored hash was made with other parameters than
+        the configured ones and should be replaced after a successful login.
+        """
+        return self._handler.needs_update(hashed)
+
+    def stats(self):
+        return {
+            "workers": self.max_workers,
+            "rounds": self.rounds,
+            "max_pending": self.max_pending,
+            "completed": self.completed,
+            "rejected": self.rejected,
+        }
+
+
+class AuthThrottle:
+    """
+    Sliding window limits on password attempts, kept per worker process.
+
+    Every attempt counts against the client IP; only failed logins count
+    against the email address, so a legitimate user is not locked out by
+    their own successful sign-ins.
+
+    Attributes:
+        ip_limit (int): Attempts allowed per IP within the window.
+        email_limit (int): Failed logins allowed per email within the window.
+        window (float): Window length in seconds.
+    """
+
+    def __init__(self, ip_limit=100, email_limit=10, window=300,
+                 clock=time.monotonic):
+        self.ip_limit = ip_limit
+        self.email_limit = email_limit
+        self.window = window
+        self.clock = clock
+        self.throttled = 0
+        self._attempts = {}  # key -> deque of attempt times
+        self._lock = threading.Lock()
+
+    def _recent(self, key, now):
+        attempts = self._attempts.get(key)
+        if attempts is None:
+            return deque()
+        while attempts and attempts[0] <= now - self.window:
+            attempts.popleft()
+        if not attempts:
+            del self._attempts[key]
+        return attempts
+
+    def _retry_after(self, attempts, limit, now):
+        if len(attempts) < limit:
+            return None
+        self.throttled += 1
+        return max(int(attempts[-limit] + self.window - now) + 1, 1)
+
+    def _record(self, key, now):
+        self._attempts.setdefault(key, deque()).append(now)
+        if len(self._attempts) > 10000:
+            # Drop keys whose attempts have all expired
+            for stale in list(self._attempts):
+                self._recent(stale, now)
+
+    def attempt(self, ip):
+        """
+        Records an attempt from an IP.
+
+        Returns:
+            int: Seconds to wait if the IP is over its limit, else None.
+        """
+        key = f"ip:{ip}"
+        with self._lock:
+            now = self.clock()
+            retry_after = self._retry_after(
+                self._recent(key, now), self.ip_limit, now)
+            if retry_after is None:
+                self._record(key, now)
+            return retry_after
+
+    def blocked(self, email):
+        """
+        Returns seconds to wait if an email has too many failed logins,
+        else None.
+        """
+        key = f"email:{email.lower()}"
+        with self._lock:
+            now = self.clock()
+            return self._retry_after(
+                self._recent(key, now), self.email_limit, now)
+
+    def failed(self, email):
+        """
+        Records a failed login for an email.
+        """
+        with self._lock:
+            self._record(f"email:{email.lower()}", self.clock())
+
+    def succeeded(self, email):
+        """
+        Clears the failed logins of an email.
+        """
+        with self._lock:
+            self._attempts.pop(f"email:{email.lower()}", None)
+
+
+def init_passwords(app):
+    """
+    Attaches a PasswordHasher and an AuthThrottle to the Flask app, using
+    the PASSWORD_HASH_* and AUTH_* settings.
+    """
+    app.config.setdefault(
+        "PASSWORD_HASH_ROUNDS",
+        int(os.getenv("PASSWORD_HASH_ROUNDS", DEFAULT_ROUNDS)))
+    app.config.setdefault(
+        "PASSWORD_HASH_WORKERS", int(os.getenv("PASSWORD_HASH_WORKERS", 2)))
+    app.config.setdefault(
+        "PASSWORD_HASH_MAX_PENDING",
+        int(os.getenv("PASSWORD_HASH_MAX_PENDING", 0)) or None)
+    app.config.setdefault(
+        "AUTH_IP_LIMIT", int(os.getenv("AUTH_IP_LIMIT", 100)))
+    app.config.setdefault(
+        "AUTH_EMAIL_LIMIT", int(os.getenv("AUTH_EMAIL_LIMIT", 10)))
+    app.config.setdefault(
+        "AUTH_THROTTLE_WINDOW", float(os.getenv("AUTH_THROTTLE_WINDOW", 300)))
+
+    hasher = PasswordHasher(
+        rounds=app.config["PASSWORD_HASH_ROUNDS"],
+        max_workers=app.config["PASSWORD_HASH_WORKERS"],
+        max_pending=app.config["PASSWORD_HASH_MAX_PENDING"],
+    )
+    throttle = AuthThrottle(
+        ip_limit=app.config["AUTH_IP_LIMIT"],
+        email_limit=app.config["AUTH_EMAIL_LIMIT"],
+        window=app.config["AUTH_THROTTLE_WINDOW"],
+    )
+    app.extensions["password_hasher"] = hasher
+    app.extensions["auth_throttle"] = throttle
+    return hasher, throttle
@@ -0,0 +1,162 @@
+"""
+Response cache for chat prompts.
+
+Answers are cached per scope (user and data version) and looked up first
+by an exact hash of the normalized prompt, then, when an embedding model is
+configured, by cosine similarity against the scope's earlier prompts.
+"""
+import hashlib
+import logging
+import os
+import re
+import threading
+from collections import OrderedDict
+
+import numpy as np
+
+
+def normalize_prompt(prompt):
+    """
+    Normalizes a prompt for exact matching: case, surrounding punctuation
+    and runs of whitespace are ignored.
+    """
+    return re.sub(r"\s+", " ", prompt.strip().lower()).strip(" ?!.")
+
+
+def load_embedder(model_name):
+    """
+    Loads a local sentence embedding model.
+
+    Returns:
+        callable: Maps a prompt to a unit-length vector, or None when the
+        optional sentence-transformers package is not installed.
+    """
+    try:
+        from sentence_transformers import SentenceTransformer
+    except ImportError:
+        logging.warning(
+            "sentence-transformers is not installed; semantic prompt "
+            "caching is disabled")
+        return None
+    model = SentenceTransformer(model_name)
+    return lambda text: model.encode(text, normalize_embeddings=True)
+
+
+class PromptCache:
+    """
+    LRU cache of chat answers.
+
+    Attributes:
+        max_entries (int): Answers kept before the least recently used are
+            evicted.
+        embed (callable): Maps a prompt to a unit-length vector, or None to
+            use exact matching only.
+        similarity_threshold (float): Minimum cosine similarity for a
+            semantic match.
+    """
+
+    def __init__(self, max_entries=2048, embed=None, similarity_threshold=0.92):
+        self.max_entries = max_entries
+        self.embed = embed
+        self.similarity_threshold = similarity_threshold
+        self.exact_hits = 0
+        self.semantic_hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._entries = OrderedDict()  # (scope, digest) -> answer
+        self._vectors = {}  # scope -> {digest: vector}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _digest(prompt):
+        return hashlib.blake2b(
+            normalize_prompt(prompt).encode("utf-8"), digest_size=16
+        ).hexdigest()
+
+    def get(self, scope, prompt):
+        """
+        Returns the cached answer to a prompt in a scope, or None.
+        """
+        digest = self._digest(prompt)
+        with self._lock:
+            answer = self._entries.get((scope, digest))
+            if answer is not None:
+                self._entries.move_to_end((scope, digest))
+                self.exact_hits += 1
+                return answer
+            candidates = list(self._vectors.get(scope, {}).items())
+
+        if self.embed is not None and candidates:
+            vector = self.embed(prompt)
+            digests, vectors = zip(*candidates)
+            similarities = np.vstack(vectors) @ vector
+            best = int(np.argmax(similarities))
+            if similarities[best] >= self.similarity_threshold:
+                with self._lock:
+                    answer = self._entries.get((scope, digests[best]))
+                    if answer is not None:
+                        self._entries.move_to_end((scope, digests[best]))
+                        self.semantic_hits += 1
+                        return answer
+
+        with self._lock:
+            self.misses += 1
+        return None
+
+    def set(self, scope, prompt, answer):
+        """
+        Caches the answer to a prompt in a scope.
+        """
+        digest = self._digest(prompt)
+        vector = self.embed(prompt) if self.embed is not None else None
+        with self._lock:
+            self._entries[(scope, digest)] = answer
+            self._entries.move_to_end((scope, digest))
+            if vector is not None:
+                self._vectors.setdefault(scope, {})[digest] = vector
+            while len(self._entries) > self.max_entries:
+                (evicted_scope, evicted), _ = self._entries.popitem(last=False)
+                self.evictions += 1
+                scope_vectors = self._vectors.get(evicted_scope)
+                if scope_vectors is not None:
+                    scope_vectors.pop(evicted, None)
+                    if not scope_vectors:
+                        del self._vectors[evicted_scope]
+
+    def stats(self):
+        hits = self.exact_hits + self.semantic_hits
+        lookups = hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "exact_hits": self.exact_hits,
+            "semantic_hits": self.semantic_hits,
+            "misses": self.misses,
+            "hit_ratio": round(hits / lookups, 3) if lookups else None,
+            "evictions": self.evictions,
+            "semantic": self.embed is not None,
+        }
+
+
+def init_prompt_cache(app):
+    """
+    Attaches a PromptCache to the Flask app. Semantic lookup is enabled by
+    naming a sentence-transformers model in PROMPT_CACHE_EMBEDDING_MODEL.
+    """
+    app.config.setdefault(
+        "PROMPT_CACHE_MAX_ENTRIES",
+        int(os.getenv("PROMPT_CACHE_MAX_ENTRIES", 2048)))
+    app.config.setdefault(
+        "PROMPT_CACHE_EMBEDDING_MODEL",
+        os.getenv("PROMPT_CACHE_EMBEDDING_MODEL", ""))
+    app.config.setdefault(
+        "PROMPT_CACHE_SIMILARITY",
+        float(os.getenv("PROMPT_CACHE_SIMILARITY", 0.92)))
+
+    model_name = app.config["PROMPT_CACHE_EMBEDDING_MODEL"]
+    cache = PromptCache(
+        max_entries=app.config["PROMPT_CACHE_MAX_ENTRIES"],
+        embed=load_embedder(model_name) if model_name else None,
+        similarity_threshold=app.config["PROMPT_CACHE_SIMILARITY"],
+    )
+    app.extensions["prompt_cache"] = cache
+    return cache
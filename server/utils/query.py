@@ -1,16 +1,99 @@
-from datetime import datetime, timedelta
-
-from flask import jsonify, request, session
-
-from database.db import get_budgetai_db
+import base64
+import binascii
+import logging
+from collections import defaultdict
+from datetime import datetime
+
+from flask import (
+    Response,
+    current_app,
+    jsonify,
+    request,
+    session,
+    stream_with_context,
+)
+from pymongo.errors import OperationFailure
+
+from database.db import get_db
+from database.rollups import MONTHLY_TOTALS
+from utils.export import EXPORT_FIELDS, EXPORT_FORMATS, gzip_chunks
+from utils.search import (
+    compile_search,
+    parse_sort,
+    plan_index,
+    summarize_explain,
+)
+from utils.series import (
+    GRANULARITIES,
+    build_series,
+    daily_totals_pipeline,
+    rollup_records,
+)
+from utils.wire import OMITTED_FIELDS, WIRE_FORMATS, negotiate_format
+
+DEFAULT_PAGE_SIZE = 1000
+MAX_PAGE_SIZE = 5000
+# Fields clients may request through the "fields" parameter
+PROJECTABLE_FIELDS = (
+    "transaction_date", "description", "category", "amount", "year", "month")
+DEFAULT_SERIES_POINTS = 500
+MAX_SERIES_POINTS = 5000
+MAX_SERIES_WINDOW = 366
+# BSON type of the values cursors can hold, per sort field. Mongo only
+# compares values of the same type, so documents with another type (such
+# as dates still stored as strings, or missing amounts) cannot be paged
+# past and are left out.
+SORT_FIELD_TYPES = {"transaction_date": "date", "amount": "number"}
+
+
+def encode_cursor(transaction, sort_field="transaction_date"):
+    """
+    Encodes the (sort field, _id) position of a transaction as an opaque
+    pagination cursor.
+    """
+    value = transaction[sort_field]
+    value = value.isoformat() if isinstance(value, datetime) else repr(value)
+    position = f"{value}|{transaction['_id']}"
+    return base64.urlsafe_b64encode(position.encode("utf-8")).decode("ascii")
+
+
+def decode_cursor(cursor, sort_field="transaction_date"):
+    """
+    Decodes a pagination cursor into a (sort field value, _id) pair.
+
+    Raises:
+        ValueError: If the cursor is malformed.
+    """
+    try:
+        position = base64.urlsafe_b64decode(cursor.encode("ascii")).decode("utf-8")
+        value, _id = position.split("|", 1)
+        if sort_field == "transaction_date":
+            return datetime.fromisoformat(value), _id
+        return float(value), _id
+    except (binascii.Error, UnicodeError, ValueError):
+        raise ValueError("Invalid cursor")
+
+
+def typed_query(query, sort_field):
+    """
+    Restricts a query to documents whose sort field has the type listed in
+    SORT_FIELD_TYPES.
+    """
+    bson_type = SORT_FIELD_TYPES.get(sort_field)
+    if bson_type is None:
+        return query
+    condition = query.get(sort_field)
+    if condition is None:
+        return {**query, sort_field: {"$type": bson_type}}
+    if isinstance(condition, dict) and all(
+            operator.startswith("$") for operator in condition):
+        return {**query, sort_field: {**condition, "$type": bson_type}}
+    return {"$and": [query, {sort_field: {"$type": bson_type}}]}
 
 
 class Query:
-    def __init__(self):
-        self.db, self.client = get_budgetai_db()
-
-    def __del__(self):
-        self.client.close()
+    def __init__(self, db=None):
+        self.db = db if db is not None else get_db()
 
     def get_current_user_id(self):
         # Retrieve the user from the session
@@ -30,16 +113,256 @@ class Query:
         # Return user_id, success message, and 200 status if all checks pass
         return user_id, jsonify({"message": "User found"}), 200
 
+    @staticmethod
+    def get_params():
+        """
+        Returns the request's query string parameters, updated with its
+        JSON body for POST requests.
+        """
+        params = dict(request.args)
+        if request.is_json:
+            params.update(request.get_json(silent=True) or {})
+        return params
+
+    def get_page_options(self, sort_field="transaction_date"):
+        """
+        Reads pagination and projection parameters from the query string or,
+        for POST requests, the JSON body:
+            limit: Page size, up to MAX_PAGE_SIZE.
+            after: Cursor returned in the X-Next-Cursor header of the
+                previous page.
+            fields: Comma separated list (or JSON list) of fields to return.
+            format: Wire format of the page, see utils.wire. Defaults to
+                the format negotiated from the Accept header.
+
+        Parameters:
+            sort_field (str): Field the page is ordered by, whose value the
+                cursor holds.
+
+        Returns:
+            tuple: (options dict, error response, status code)
+        """
+        params = self.get_params()
+
+        try:
+            limit = int(params.get("limit", DEFAULT_PAGE_SIZE))
+        except (TypeError, ValueError):
+            return None, jsonify({"error": "limit must be an integer"}), 400
+        if not 1 <= limit <= MAX_PAGE_SIZE:
+            return None, jsonify(
+                {"error": f"limit must be between 1 and {MAX_PAGE_SIZE}"}), 400
+
+        after = None
+        if params.get("after"):
+            try:
+                after = decode_cursor(str(params["after"]), sort_field)
+            except ValueError:
+                return None, jsonify({"error": "Invalid cursor"}), 400
+
+        projection = None
+        fields = params.get("fields")
+        if fields:
+            if isinstance(fields, str):
+                fields = fields.split(",")
+            fields = [str(field).strip() for field in fields]
+            unknown = set(fields) - set(PROJECTABLE_FIELDS)
+            if unknown:
+                return None, jsonify(
+                    {"error": f"Unknown fields: {', '.join(sorted(unknown))}"}), 400
+            # The cursor position is always returned
+            projection = dict.fromkeys(fields + [sort_field], 1)
+
+        wire_format, error, status_code = negotiate_format(
+            params.get("format"), request.accept_mimetypes)
+        if status_code != 200:
+            return None, jsonify({"error": error}), status_code
+        if wire_format != "json" and projection is None:
+            projection = dict.fromkeys(OMITTED_FIELDS, 0)
+
+        options = {
+            "limit": limit,
+            "after": after,
+            "projection": projection,
+            "format": wire_format,
+        }
+        return options, jsonify({"message": "Options valid"}), 200
+
+    def page_cursor(self, query, options, sort_field="transaction_date",
+                    direction=1, hint=None):
+        """
+        Builds the Mongo cursor of one page of transactions, fetching one
+        extra document to learn whether another page exists.
+        """
+        query = typed_query(query, sort_field)
+        if options["after"] is not None:
+            after_value, after_id = options["after"]
+            beyond = "$gt" if direction == 1 else "$lt"
+            query = {
+                "$and": [
+                    query,
+                    {
+                        "$or": [
+                            {sort_field: {beyond: after_value}},
+                            {sort_field: after_value,
+                             "_id": {beyond: after_id}},
+                        ]
+                    },
+                ]
+            }
+
+        cursor = (
+            self.db["transactions"]
+            .find(query, options["projection"])
+            .sort([(sort_field, direction), ("_id", direction)])
+            .limit(options["limit"] + 1)
+        )
+        if hint is not None:
+            cursor = cursor.hint(hint)
+        return cursor
+
+    def find_page(self, query, sort_field="transaction_date", direction=1,
+                  hint=None):
+        """
+        Returns one page of the transactions matching a query, ordered by
+        (sort_field, _id), ascending or, with direction -1, descending.
+        Pages are fetched with a keyset condition rather than skip(), so
+        every page costs the same. When more results remain, the cursor of
+        the next page is sent in the X-Next-Cursor header.
+
+        A hint names the index to use. The query runs without it if that
+        index does not exist.
+        """
+        options, response, status_code = self.get_page_options(sort_field)
+
+        if status_code != 200:
+            return response, status_code
+
+        try:
+            transactions = list(self.page_cursor(
+                query, options, sort_field, direction, hint))
+        except OperationFailure as e:
+            if hint is None:
+                raise
+            logging.warning(f"Ignoring index hint {hint}: {str(e)}")
+            transactions = list(self.page_cursor(
+                query, options, sort_field, direction))
+        has_more = len(transactions) > options["limit"]
+        transactions = transactions[:options["limit"]]
+
+        mimetype, encode, _ = WIRE_FORMATS[options["format"]]
+        if encode is None:
+            response = jsonify(transactions)
+        else:
+            response = current_app.response_class(
+                encode(transactions), mimetype=mimetype)
+        response.vary.add("Accept")
+        if has_more:
+            response.headers["X-Next-Cursor"] = encode_cursor(
+                transactions[-1], sort_field)
+        return response
+
+    def search_transactions(self):
+        """
+        Returns one page of the transactions matching any combination of
+        the filters of utils.search.compile_search, ordered by "sort"
+        (transaction_date by default, amount, or either prefixed with "-"
+        for descending order). Takes the paging options of find_page.
+
+        The query runs on the index chosen by utils.search.plan_index. With
+        explain=true, the query is not run for results; instead the
+        response describes the compiled query, the ranked indexes and the
+        plan and execution counters reported by Mongo.
+        """
+        params = self.get_params()
+
+        sort_field, direction, error = parse_sort(params.get("sort"))
+        if error is not None:
+            return jsonify({"error": error}), 400
+
+        user_id, response, status_code = self.get_current_user_id()
+
+        if status_code != 200:
+            return response, status_code
+
+        query, error, status_code = compile_search(user_id, params)
+        if status_code != 200:
+            return jsonify({"error": error}), status_code
+
+        candidates = plan_index(query, sort_field)
+        hint = candidates[0]["index"]
+
+        if str(params.get("explain", "")).lower() not in ("true", "1"):
+            return self.find_page(query, sort_field, direction, hint)
+
+        options, response, status_code = self.get_page_options(sort_field)
+        if status_code != 200:
+            return response, status_code
+        explained = self.page_cursor(
+            query, options, sort_field, direction, hint).explain()
+        return jsonify({
+            "query": query,
+            "sort": [[sort_field, direction], ["_id", direction]],
+            "index": hint,
+            "candidates": candidates,
+            "plan": summarize_explain(explained),
+        })
+
     def get_transactions(self, response_type="json"):
         user_id, response, status_code = self.get_current_user_id()
 
         if status_code != 200:
             return response, status_code
 
-        transactions = list(self.db["transactions"].find({"user_id": user_id}))
         if response_type == "list":
-            return transactions
-        return jsonify(transactions)
+            return list(self.db["transactions"].find({"user_id": user_id}))
+        return self.find_page({"user_id": user_id})
+
+    def export_transactions(self):
+        """
+        Streams every transaction of the current user as NDJSON (default) or
+        CSV, selected with the "format" query parameter. The response is
+        gzip compressed when the client accepts it.
+
+        Documents are read from the cursor one batch at a time and written
+        out as they arrive, so memory use and time to first byte do not
+        grow with the size of the history.
+        """
+        user_id, response, status_code = self.get_current_user_id()
+
+        if status_code != 200:
+            return response, status_code
+
+        export_format = request.args.get("format", "ndjson")
+        if export_format not in EXPORT_FORMATS:
+            return jsonify({"error": f"Unsupported format: {export_format}"}), 400
+        serializer, mimetype, extension = EXPORT_FORMATS[export_format]
+
+        cursor = (
+            self.db["transactions"]
+            .find({"user_id": user_id}, dict.fromkeys(EXPORT_FIELDS, 1))
+            .sort([("transaction_date", 1), ("_id", 1)])
+            .batch_size(current_app.config["EXPORT_BATCH_SIZE"])
+        )
+
+        def generate():
+            try:
+                yield from serializer(cursor)
+            finally:
+                cursor.close()
+
+        chunks = generate()
+        headers = {
+            "Content-Disposition":
+                f"attachment; filename=transactions.{extension}",
+            "Vary": "Accept-Encoding",
+        }
+        # A listed encoding with q=0 is refused, not accepted
+        if request.accept_encodings["gzip"] > 0:
+            chunks = gzip_chunks(chunks)
+            headers["Content-Encoding"] = "gzip"
+
+        return Response(
+            stream_with_context(chunks), mimetype=mimetype, headers=headers)
 
     def get_by_category(self):
         data = request.get_json()
@@ -53,11 +376,7 @@ class Query:
         if status_code != 200:
             return response, status_code
 
-        transactions = list(
-            self.db["transactions"].find(
-                {"user_id": user_id, "category": category})
-        )
-        return jsonify(transactions)
+        return self.find_page({"user_id": user_id, "category": category})
 
     def get_by_amount_range(self):
         data = request.get_json()
@@ -84,13 +403,10 @@ class Query:
             return response, status_code
 
         # Query transactions by amount range
-        transactions = list(
-            self.db["transactions"].find(
-                {"user_id": user_id, "amount": {
-                    "$gte": min_amount, "$lte": max_amount}}
-            )
+        return self.find_page(
+            {"user_id": user_id, "amount": {
+                "$gte": min_amount, "$lte": max_amount}}
         )
-        return jsonify(transactions)
 
     def get_by_date_range(self):
         data = request.get_json()
@@ -117,21 +433,13 @@ class Query:
         if status_code != 200:
             return response, status_code
 
-        # Convert date strings to datetime objects
-        try:
-            start_date = datetime.strptime(start_date, "%Y-%m-%d")
-            end_date = datetime.strptime(end_date, "%Y-%m-%d")
-        except ValueError:
-            return jsonify(
-                {"error": "Invalid date format. Use YYYY-MM-DD."}), 400
-
         # Query transactions by date range
-        transactions = list(
-            self.db["transactions"].find(
-                {"user_id": user_id, "date": {"$gte": start_date, "$lte": end_date}}
-            )
+        return self.find_page(
+            {
+                "user_id": user_id,
+                "transaction_date": {"$gte": start_date, "$lte": end_date},
+            }
         )
-        return jsonify(transactions)
 
     def get_categories(self):
         user_id, response, status_code = self.get_current_user_id()
@@ -149,75 +457,160 @@ class Query:
             return response, status_code
 
         try:
-            # MongoDB aggregation pipeline
-            transactions_by_month_and_category = self.db["transactions"].aggregate([
-                {"$match": {"user_id": user_id}},  # Match transactions for the user
-                {
-                    "$group": {
-                        "_id": {
-                            "year": {"$year": {"$dateFromString": {"dateString": "$transaction_date"}}},
-                            "month": {"$month": {"$dateFromString": {"dateString": "$transaction_date"}}},
-                            "category": "$category"  # Group by category
-                        },
-                        "totalAmount": {"$sum": "$amount"}  # Sum up transaction amounts
-                    }
-                },
-                {"$sort": {"_id.year": 1, "_id.month": 1, "_id.category": 1}}  # Sort by year, month, and category
-            ])
-
-            # Now, aggregate overall totals for each month
-            overall_month_totals = self.db["transactions"].aggregate([
-                {"$match": {"user_id": user_id}},  # Match transactions for the user
-                {
-                    "$group": {
-                        "_id": {
-                            "year": {"$year": {"$dateFromString": {"dateString": "$transaction_date"}}},
-                            "month": {"$month": {"$dateFromString": {"dateString": "$transaction_date"}}}
-                        },
-                        "totalAmount": {"$sum": "$amount"}  # Sum up transaction amounts for the entire month
-                    }
-                },
-                {"$sort": {"_id.year": 1, "_id.month": 1}}  # Sort by year and month
-            ])
-
-
-            results = {}
-
-            # Create a dictionary of overall totals by month
-            month_totals = {}
-            for record in overall_month_totals:
-                year = record["_id"]["year"]
-                month = record["_id"]["month"]
-                total = record["totalAmount"]
-                month_name = datetime(year, month, 1).strftime("%B %Y")  # Format as "Month Year"
-                month_totals[month_name] = total
-
-            # Prepare category totals and combine with overall totals
-            for record in transactions_by_month_and_category:
-                year = record["_id"]["year"]
-                month = record["_id"]["month"]
-                category = record["_id"]["category"]
-                total = record["totalAmount"]
-                month_name = datetime(year, month, 1).strftime("%B %Y")  # Format as "Month Year"
-                # print(month_name)
-                # print(f"Year: {year}, Month: {month}, Category: {category}, Total: {total}")
-
-                # Add data to results if it's not already initialized
-                if month_name not in results:
-                    results[month_name] = {"Total": month_totals.get(month_name, 0)}
-
-                # Add category total
-                results[month_name][category] = total
-
-                # set non existing categories to -> 0
-                categories = self.get_categories()
-                for category in categories:
-                    if category not in results[month_name]:
-                        results[month_name][category] = 0
-
-            # Return the results with both category totals and overall totals for each month
-            # print(results)
-            return list(results.items())
+            # Totals are read from the monthly_totals rollup, which holds one
+            # small document per (year, month, category) of the user
+            by_month_and_category = []
+            by_month = defaultdict(float)
+            categories = set()
+            for record in self.db[MONTHLY_TOTALS].find(
+                {"user_id": user_id}, {"_id": 0, "user_id": 0, "count": 0}
+            ):
+                key = {"year": record["year"], "month": record["month"]}
+                by_month_and_category.append({
+                    "_id": {**key, "category": record["category"]},
+                    "totalAmount": record["total"],
+                })
+                by_month[(record["year"], record["month"])] += record["total"]
+                categories.add(record["category"])
+
+            return self.build_totals(
+                by_month_and_category,
+                [
+                    {"_id": {"year": year, "month": month}, "totalAmount": total}
+                    for (year, month), total in by_month.items()
+                ],
+                sorted(categories),
+            )
 
         except Exception as e:
             return {"error": "An error occurred while processing transactions", "details": str(e)}, 500
+
+    def get_series_options(self):
+        """
+        Reads the spending series parameters from the query string:
+            granularity: day, week, month (default) or year.
+            split: "category" to add one series per category.
+            window: Periods in the moving average, default 3.
+            points: Maximum number of periods returned, default
+                DEFAULT_SERIES_POINTS, at most MAX_SERIES_POINTS.
+            start_date, end_date: Optional YYYY-MM-DD bounds.
+
+        Returns:
+            tuple: (options dict, error response, status code)
+        """
+        params = request.args
+
+        granularity = params.get("granularity", "month")
+        if granularity not in GRANULARITIES:
+            return None, jsonify({
+                "error": f"granularity must be one of {', '.join(GRANULARITIES)}"
+            }), 400
+
+        split = params.get("split")
+        if split not in (None, "", "category"):
+            return None, jsonify({"error": "split must be category"}), 400
+
+        bounds = {"window": (3, 1, MAX_SERIES_WINDOW),
+                  "points": (DEFAULT_SERIES_POINTS, 3, MAX_SERIES_POINTS)}
+        numbers = {}
+        for name, (fallback, low, high) in bounds.items():
+            try:
+                numbers[name] = int(params.get(name, fallback))
+            except ValueError:
+                return None, jsonify({"error": f"{name} must be an integer"}), 400
+            if not low <= numbers[name] <= high:
+                return None, jsonify(
+                    {"error": f"{name} must be between {low} and {high}"}), 400
+
+        dates = {}
+        for name in ("start_date", "end_date"):
+            try:
+                dates[name] = (datetime.strptime(params[name], "%Y-%m-%d")
+                               if params.get(name) else None)
+            except ValueError:
+                return None, jsonify(
+                    {"error": "Invalid date format. Use YYYY-MM-DD."}), 400
+        if dates["end_date"] is not None:
+            # Include every transaction on the end date
+            dates["end_date"] = dates["end_date"].replace(
+                hour=23, minute=59, second=59, microsecond=999999)
+
+        options = {
+            "granularity": granularity,
+            "split": split == "category",
+            **numbers,
+            **dates,
+        }
+        return options, jsonify({"message": "Options valid"}), 200
+
+    def get_spending_series(self):
+        """
+        Returns the current user's spending per period, with running totals
+        and moving averages, downsampled to at most "points" periods.
+
+        Unbounded monthly and yearly series are read from the
+        monthly_totals rollup. Other series sum the transactions per day in
+        Mongo and group the days into periods with pandas.
+        """
+        options, response, status_code = self.get_series_options()
+
+        if status_code != 200:
+            return response, status_code
+
+        user_id, response, status_code = self.get_current_user_id()
+
+        if status_code != 200:
+            return response, status_code
+
+        if (options["granularity"] in ("month", "year")
+                and options["start_date"] is None
+                and options["end_date"] is None):
+            records = rollup_records(self.db[MONTHLY_TOTALS].find(
+                {"user_id": user_id}, {"_id": 0, "user_id": 0, "count": 0}))
+        else:
+            pipeline = daily_totals_pipeline(
+                user_id, options["start_date"], options["end_date"])
+            records = [
+                {"period": record["_id"]["day"],
+                 "category": record["_id"]["category"],
+                 "total": record["total"]}
+                for record in self.db["transactions"].aggregate(pipeline)
+            ]
+
+        return jsonify(build_series(
+            records,
+            granularity=options["granularity"],
+            split=options["split"],
+            window=options["window"],
+            points=options["points"],
+        ))
+
+    @staticmethod
+    def build_totals(by_month_and_category, by_month, categories):
+        """
+        Combines grouped totals into a list of ("Month Year", totals) pairs
+        sorted by date, where each totals dict holds the month's "Total" and
+        one entry per category, zero-filled for categories with no spending.
+        """
+        month_totals = {
+            (record["_id"].get("year"), record["_id"].get("month")): record["totalAmount"]
+            for record in by_month
+        }
+
+        results = {}
+        for record in by_month_and_category:
+            key = (record["_id"].get("year"), record["_id"].get("month"))
+            if None in key:
+                continue  # Legacy documents awaiting the date migration
+            if key not in results:
+                results[key] = {"Total": month_totals.get(key, 0)}
+                # set non existing categories to -> 0
+                for category in categories:
+                    results[key][category] = 0
+            results[key][record["_id"]["category"]] = record["totalAmount"]
+
+        # Format as "Month Year", ordered by year and month
+        return [
+            (datetime(year, month, 1).strftime("%B %Y"), totals)
+            for (year, month), totals in sorted(results.items())
+        ]
@@ -0,0 +1,192 @@
+"""
+Transaction search.
+
+A search combines any of the category, amount, date and description
+filters with a sort order into one Mongo query. The planner then picks the
+transactions index that serves the query best, following the Equality,
+Sort, Range rule: an index ranks higher the more leading fields it matches
+with equality filters, then if it returns documents in the requested order
+(avoiding an in-memory sort), then if it bounds a range filter.
+"""
+import re
+from datetime import datetime, timedelta
+
+from database.indexes import INDEXES
+
+SORT_FIELDS = ("transaction_date", "amount")
+DEFAULT_SORT = "transaction_date"
+# Query operators that bound a range of index keys
+RANGE_OPERATORS = ("$gt", "$gte", "$lt", "$lte")
+
+
+def parse_sort(value):
+    """
+    Parses a sort parameter: a field of SORT_FIELDS, prefixed with "-" for
+    descending order.
+
+    Returns:
+        tuple: (field, direction, error message)
+    """
+    value = str(value or DEFAULT_SORT)
+    field = value.lstrip("-")
+    if field not in SORT_FIELDS or len(value) - len(field) > 1:
+        return None, None, f"sort must be one of {', '.join(SORT_FIELDS)}, optionally prefixed with -"
+    return field, -1 if value.startswith("-") else 1, None
+
+
+def _amount(value):
+    if isinstance(value, bool):
+        raise ValueError
+    if isinstance(value, (int, float)):
+        return value
+    return float(value)
+
+
+def _date(value):
+    return datetime.strptime(str(value), "%Y-%m-%d")
+
+
+def compile_search(user_id, params):
+    """
+    Compiles search filters into a Mongo query over a user's transactions.
+
+    Parameters:
+        user_id (str): Owner of the transactions.
+        params (dict): Any of
+            category: A category, or a list of categories to match any of.
+            min_amount, max_amount: Inclusive amount bounds.
+            start_date, end_date: Inclusive YYYY-MM-DD date bounds.
+            description: Case-insensitive text the description contains.
+
+    Returns:
+        tuple: (query dict, error message, status code)
+    """
+    query = {"user_id": user_id}
+
+    categories = params.get("category")
+    if categories:
+        if isinstance(categories, str):
+            categories = [categories]
+        if not isinstance(categories, list) or not all(
+                isinstance(category, str) for category in categories):
+            return None, "category must be a string or a list of strings", 400
+        categories = sorted(set(categories))
+        query["category"] = (
+            categories[0] if len(categories) == 1 else {"$in": categories})
+
+    amount = {}
+    try:
+        if params.get("min_amount") is not None:
+            amount["$gte"] = _amount(params["min_amount"])
+        if params.get("max_amount") is not None:
+            amount["$lte"] = _amount(params["max_amount"])
+    except (TypeError, ValueError):
+        return None, "min_amount and max_amount must be numbers", 400
+    if amount.get("$gte", float("-inf")) > amount.get("$lte", float("inf")):
+        return None, "min_amount must not be greater than max_amount", 400
+    if amount:
+        query["amount"] = amount
+
+    transaction_date = {}
+    try:
+        if params.get("start_date"):
+            transaction_date["$gte"] = _date(params["start_date"])
+        if params.get("end_date"):
+            # Include every transaction on the end date
+            transaction_date["$lt"] = _date(params["end_date"]) + timedelta(days=1)
+    except ValueError:
+        return None, "Invalid date format. Use YYYY-MM-DD.", 400
+    if transaction_date:
+        query["transaction_date"] = transaction_date
+
+    description = params.get("description")
+    if description:
+        query["description"] = {
+            "$regex": re.escape(str(description)), "$options": "i"}
+
+    return query, None, 200
+
+
+def predicate_kind(query, field):
+    """
+    Classifies the filter of a query on a field as "equality" (including
+    $in), "range", "other" or None when the field is not filtered.
+    """
+    if field not in query:
+        return None
+    condition = query[field]
+    if not isinstance(condition, dict):
+        return "equality"
+    if set(condition) <= {"$eq", "$in"}:
+        return "equality"
+    if set(condition) <= set(RANGE_OPERATORS):
+        return "range"
+    return "other"
+
+
+def plan_index(query, sort_field, indexes=None):
+    """
+    Ranks the transactions indexes for a query and sort field.
+
+    Parameters:
+        query (dict): Query from compile_search.
+        sort_field (str): Field the results are ordered by, with _id as the
+            tie breaker.
+        indexes (list): IndexModels to choose from, the transactions
+            indexes of database.indexes by default.
+
+    Returns:
+        list: One dict per index, best first, with its "index" name,
+        "keys", the number of leading "equality" matches and whether it
+        provides the "sort" order and bounds a "range".
+    """
+    if indexes is None:
+        indexes = INDEXES["transactions"]
+
+    candidates = []
+    for model in indexes:
+        keys = list(model.document["key"])
+        position = 0
+        while (position < len(keys)
+               and predicate_kind(query, keys[position]) == "equality"):
+            position += 1
+        provides_sort = keys[position:position + 2] == [sort_field, "_id"]
+        bounds_range = (position < len(keys)
+                        and predicate_kind(query, keys[position]) == "range")
+        candidates.append({
+            "index": model.document["name"],
+            "keys": keys,
+            "equality": position,
+            "sort": provides_sort,
+            "range": bounds_range,
+        })
+    candidates.sort(
+        key=lambda candidate: (candidate["equality"], candidate["sort"],
+                               candidate["range"], -len(candidate["keys"])),
+        reverse=True)
+    return candidates
+
+
+def summarize_explain(explained):
+    """
+    Extracts the winning plan's stages and execution counters from the
+    result of explain() on a find.
+    """
+    stages = []
+    plan = explained.get("queryPlanner", {}).get("winningPlan", {})
+    plan = plan.get("queryPlan", plan)  # Slot based execution engine
+    while plan:
+        stages.append({
+            key: plan[key]
+            for key in ("stage", "indexName", "indexBounds")
+            if key in plan
+        })
+        plan = plan.get("inputStage")
+    stats = explained.get("executionStats", {})
+    return {
+        "stages": stages,
+        "returned": stats.get("nReturned"),
+        "keys_examined": stats.get("totalKeysExamined"),
+        "documents_examined": stats.get("totalDocsExamined"),
+        "time_ms": stats.get("executionTimeMillis"),
+    }
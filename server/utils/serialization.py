@@ -0,0 +1,172 @@
+"""
+JSON serialization of requests and responses.
+
+FastJSONProvider replaces Flask's default JSON provider. With the orjson
+backend, a page of transaction documents goes from the Mongo cursor's
+dicts straight to UTF-8 response bytes in native code, without copying
+the documents to convert their values or building an intermediate str.
+The stdlib backend is used when orjson is not installed, or when a value
+is outside what orjson supports (such as integers beyond 64 bits).
+
+Both backends serialize the BSON types read from Mongo the same way:
+datetimes as ISO 8601 strings, naive ones as UTC with a "Z" suffix, and
+ObjectId and Decimal128 as strings.
+"""
+import dataclasses
+import decimal
+import json
+import logging
+import os
+import uuid
+from datetime import date, datetime, time, timedelta
+
+from bson import Decimal128, ObjectId
+from flask.json.provider import JSONProvider
+
+try:
+    import orjson
+except ImportError:  # Optional dependency, the stdlib json module is used instead
+    orjson = None
+
+BACKENDS = ("orjson", "json")
+
+
+def format_datetime(value):
+    """
+    Formats a datetime as orjson does with OPT_NAIVE_UTC and OPT_UTC_Z.
+    """
+    if value.tzinfo is None:
+        return f"{value.isoformat()}Z"
+    if value.utcoffset() == timedelta(0):
+        return f"{value.replace(tzinfo=None).isoformat()}Z"
+    return value.isoformat()
+
+
+def default(value):
+    """
+    Converts values neither backend serializes natively. Raises TypeError
+    for anything else, as json.dumps expects.
+    """
+    if isinstance(value, ObjectId):
+        return str(value)
+    if isinstance(value, Decimal128):
+        return str(value.to_decimal())
+    if isinstance(value, datetime):  # Also pandas Timestamps
+        return format_datetime(value)
+    if isinstance(value, (date, time)):
+        return value.isoformat()
+    if isinstance(value, (decimal.Decimal, uuid.UUID)):
+        return str(value)
+    if dataclasses.is_dataclass(value) and not isinstance(value, type):
+        return dataclasses.asdict(value)
+    if hasattr(value, "__html__"):
+        return str(value.__html__())
+    if hasattr(value, "item") and hasattr(value, "dtype"):  # NumPy scalars
+        return value.item()
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+
+class FastJSONProvider(JSONProvider):
+    """
+    Flask JSON provider backed by orjson, with the stdlib json module as a
+    fallback.
+
+    Attributes:
+        backend (str): "orjson" or "json".
+        sort_keys (bool): Sort the keys of serialized dicts, as Flask's
+            default provider does.
+        compact (bool | None): As for Flask's default provider, responses
+            are indented when False, or when None in debug mode.
+    """
+
+    mimetype = "application/json"
+    sort_keys = True
+    compact = None
+
+    def __init__(self, app, backend="orjson"):
+        super().__init__(app)
+        if backend not in BACKENDS:
+            raise ValueError(f"Unknown JSON backend: {backend}")
+        if backend == "orjson" and orjson is None:
+            logging.warning("orjson is not installed, using the json module")
+            backend = "json"
+        self.backend = backend
+
+    def _orjson_option(self, indent=False):
+        option = (orjson.OPT_NAIVE_UTC | orjson.OPT_UTC_Z
+                  | orjson.OPT_NON_STR_KEYS | orjson.OPT_SERIALIZE_NUMPY)
+        if self.sort_keys:
+            option |= orjson.OPT_SORT_KEYS
+        if indent:
+            option |= orjson.OPT_INDENT_2
+        return option
+
+    def _stdlib_dumps(self, obj, **kwargs):
+        kwargs.setdefault("default", default)
+        kwargs.setdefault("sort_keys", self.sort_keys)
+        kwargs.setdefault("ensure_ascii", False)
+        if kwargs.get("indent") is None and kwargs.get("separators") is None:
+            kwargs["separators"] = (",", ":")  # Compact, like orjson
+        return json.dumps(obj, **kwargs)
+
+    def dumps_bytes(self, obj, indent=False, newline=False):
+        """
+        Serializes data as UTF-8 encoded JSON.
+
+        Parameters:
+            obj: The data to serialize.
+            indent (bool): Indent nested values by two spaces.
+            newline (bool): End the output with a newline.
+
+        Returns:
+            bytes: The JSON document.
+        """
+        if self.backend == "orjson":
+            option = self._orjson_option(indent)
+            if newline:
+                option |= orjson.OPT_APPEND_NEWLINE
+            try:
+                return orjson.dumps(obj, default=default, option=option)
+            except TypeError:
+                pass  # Retried below, the json module raises if it also fails
+        data = self._stdlib_dumps(obj, indent=2 if indent else None)
+        return f"{data}\n".encode("utf-8") if newline else data.encode("utf-8")
+
+    def dumps(self, obj, **kwargs):
+        """
+        Serializes data as a JSON string. The orjson backend writes compact
+        or two-space indented output; arguments of json.dumps it cannot
+        honour (such as cls or ensure_ascii=True) use the json module.
+        """
+        indent = kwargs.pop("indent", None)
+        separators = kwargs.pop("separators", None)
+        ensure_ascii = kwargs.pop("ensure_ascii", False)
+        sort_keys = kwargs.pop("sort_keys", self.sort_keys)
+        if (self.backend != "orjson" or kwargs or ensure_ascii
+                or sort_keys != self.sort_keys or indent not in (None, 2)):
+            return self._stdlib_dumps(
+                obj, indent=indent, separators=separators, sort_keys=sort_keys,
+                ensure_ascii=ensure_ascii, **kwargs)
+        return self.dumps_bytes(obj, indent=indent is not None).decode("utf-8")
+
+    def loads(self, s, **kwargs):
+        if self.backend == "orjson" and not kwargs:
+            return orjson.loads(s)
+        return json.loads(s, **kwargs)
+
+    def response(self, *args, **kwargs):
+        obj = self._prepare_response_obj(args, kwargs)
+        indent = self.compact is False or (self.compact is None and self._app.debug)
+        return self._app.response_class(
+            self.dumps_bytes(obj, indent=indent, newline=True),
+            mimetype=self.mimetype)
+
+
+def init_json(app):
+    """
+    Installs FastJSONProvider as the app's JSON provider, using the backend
+    named by JSON_BACKEND ("orjson" or "json").
+    """
+    app.config.setdefault("JSON_BACKEND", os.getenv("JSON_BACKEND", "orjson"))
+    app.json = FastJSONProvider(app, backend=app.config["JSON_BACKEND"])
+    return app.json
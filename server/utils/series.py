@@ -0,0 +1,187 @@
+"""
+Time-bucketed spending series.
+
+Spending is summed per period (day, week starting Monday, month or year),
+optionally split by category, with zero-filled gaps so that running totals
+and moving averages are taken over consecutive periods. Long series are
+downsampled with Largest-Triangle-Three-Buckets (LTTB), which keeps the
+points that shape the curve, so a chart of many years of daily spending
+stays a few hundred points.
+"""
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+
+from utils.parsers import DEFAULT_CATEGORY
+
+# granularity -> (pandas period of a bucket, frequency of bucket starts)
+GRANULARITIES = {
+    "day": ("D", "D"),
+    "week": ("W-SUN", "W-MON"),
+    "month": ("M", "MS"),
+    "year": ("Y", "YS"),
+}
+TOTAL = "Total"
+# Appended to the name of a category that would collide with the Total series
+CATEGORY_SUFFIX = " (category)"
+
+
+def daily_totals_pipeline(user_id, start_date=None, end_date=None):
+    """
+    Aggregation pipeline summing a user's transactions per day and category.
+
+    Parameters:
+        user_id (str): Owner of the transactions.
+        start_date (datetime): First day included, or None.
+        end_date (datetime): Last day included, or None.
+
+    Returns:
+        list: Pipeline stages yielding {"_id": {"day", "category"}, "total"}.
+    """
+    match = {"user_id": user_id, "transaction_date": {"$type": "date"}}
+    if start_date is not None:
+        match["transaction_date"]["$gte"] = start_date
+    if end_date is not None:
+        match["transaction_date"]["$lte"] = end_date
+    return [
+        {"$match": match},
+        {
+            "$group": {
+                "_id": {
+                    "day": {
+                        "$dateFromParts": {
+                            "year": {"$year": "$transaction_date"},
+                            "month": {"$month": "$transaction_date"},
+                            "day": {"$dayOfMonth": "$transaction_date"},
+                        }
+                    },
+                    "category": "$category",
+                },
+                "total": {"$sum": "$amount"},
+            }
+        },
+    ]
+
+
+def lttb_indices(values, threshold):
+    """
+    Picks the points of an evenly spaced series to keep when downsampling it
+    with Largest-Triangle-Three-Buckets. The first and last points are
+    always kept.
+
+    Parameters:
+        values: Sequence of numbers.
+        threshold (int): Number of points to keep.
+
+    Returns:
+        numpy.ndarray: Increasing positions of the kept points.
+    """
+    size = len(values)
+    if threshold >= size or threshold < 3:
+        return np.arange(size)
+
+    y = np.asarray(values, dtype=float)
+    x = np.arange(size, dtype=float)
+    # threshold - 2 buckets over the points between the first and the last
+    edges = np.linspace(1, size - 1, threshold - 1).astype(int)
+    selected = np.empty(threshold, dtype=int)
+    selected[0], selected[-1] = 0, size - 1
+
+    previous = 0
+    for bucket in range(threshold - 2):
+        start, end = edges[bucket], edges[bucket + 1]
+        if bucket + 2 < len(edges):
+            following = slice(end, edges[bucket + 2])
+        else:
+            following = slice(size - 1, size)
+        average_x, average_y = x[following].mean(), y[following].mean()
+        # Twice the area of the triangle each candidate forms with the
+        # previously kept point and the average of the following bucket
+        areas = np.abs(
+            (x[previous] - average_x) * (y[start:end] - y[previous])
+            - (x[previous] - x[start:end]) * (average_y - y[previous]))
+        previous = start + int(np.argmax(areas))
+        selected[bucket + 1] = previous
+    return selected
+
+
+def build_series(records, granularity="month", split=False, window=3, points=500):
+    """
+    Builds spending series from per-period totals.
+
+    Parameters:
+        records (list): Dicts with a "period" datetime, a "category" and a
+            "total" amount. Periods finer than the granularity are summed
+            into its buckets.
+        granularity (str): One of GRANULARITIES.
+        split (bool): Add one series per category next to the Total.
+        window (int): Periods averaged by the moving average.
+        points (int): Maximum number of periods returned.
+
+    Returns:
+        dict: {"granularity", "window", "periods": [ISO dates],
+        "downsampled": bool, "series": {name: {"total", "running_total",
+        "moving_average"}}}. The Total series sums every category; a
+        category named Total is renamed with CATEGORY_SUFFIX.
+    """
+    result = {
+        "granularity": granularity,
+        "window": window,
+        "periods": [],
+        "downsampled": False,
+        "series": {},
+    }
+    if not records:
+        return result
+
+    bucket, frequency = GRANULARITIES[granularity]
+    frame = pd.DataFrame.from_records(records, columns=["period", "category", "total"])
+    frame["period"] = (
+        pd.to_datetime(frame["period"]).dt.to_period(bucket).dt.start_time)
+
+    if split:
+        # pivot_table drops rows without a category, which Total counts
+        frame["category"] = frame["category"].fillna(DEFAULT_CATEGORY).astype(str)
+        categories = frame.pivot_table(
+            index="period", columns="category", values="total",
+            aggfunc="sum", fill_value=0)
+        categories = categories[sorted(categories.columns)]
+        name = TOTAL
+        while name in categories.columns:
+            name += CATEGORY_SUFFIX
+        categories = categories.rename(columns={TOTAL: name})
+        totals = pd.concat(
+            [categories.sum(axis=1).rename(TOTAL), categories], axis=1)
+    else:
+        totals = frame.groupby("period")["total"].sum().to_frame(TOTAL)
+
+    # Periods without spending count as zero
+    totals = totals.reindex(
+        pd.date_range(totals.index.min(), totals.index.max(), freq=frequency),
+        fill_value=0)
+    running_totals = totals.cumsum()
+    moving_averages = totals.rolling(window, min_periods=1).mean()
+
+    kept = lttb_indices(totals[TOTAL].to_numpy(), points)
+    result["downsampled"] = len(kept) < len(totals)
+    result["periods"] = [
+        period.date().isoformat() for period in totals.index[kept]]
+    for name in totals.columns:
+        result["series"][str(name)] = {
+            "total": totals[name].iloc[kept].round(2).tolist(),
+            "running_total": running_totals[name].iloc[kept].round(2).tolist(),
+            "moving_average": moving_averages[name].iloc[kept].round(2).tolist(),
+        }
+    return result
+
+
+def rollup_records(monthly_totals):
+    """
+    Converts monthly_totals rollup documents into build_series records.
+    """
+    return [
+        {"period": datetime(record["year"], record["month"], 1),
+         "category": record["category"], "total": record["total"]}
+        for record in monthly_totals
+    ]
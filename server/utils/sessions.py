@@ -0,0 +1,337 @@
+"""
+Server-side sessions.
+
+The session cookie only carries a signed, random session id. Session data
+lives in a store shared by every worker process (a Mongo collection with a
+TTL index, or Redis), with a small in-process cache in front of it so that
+authenticated requests are usually resolved from memory. Because the data
+is server side, sessions can be revoked, one at a time or all of a user's.
+"""
+import logging
+import os
+import secrets
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime, timezone
+
+from flask import current_app
+from flask.sessions import SessionInterface, SessionMixin, session_json_serializer
+from itsdangerous import BadSignature, Signer
+from werkzeug.datastructures import CallbackDict
+
+from database.db import get_db
+
+try:
+    import redis
+except ImportError:  # Optional dependency, only needed for the redis backend
+    redis = None
+
+SESSIONS = "sessions"
+
+
+class MongoSessionStore:
+    """
+    Stores sessions in a Mongo collection. Expired sessions are removed by
+    the expires_at TTL index.
+    """
+
+    name = "mongo"
+
+    def __init__(self, collection=SESSIONS):
+        self.collection = collection
+
+    def load(self, sid):
+        document = get_db()[self.collection].find_one(
+            {"_id": sid, "expires_at": {"$gt": datetime.now(timezone.utc)}},
+            {"data": 1},
+        )
+        return document["data"] if document else None
+
+    def save(self, sid, data, user_id, expires_at):
+        get_db()[self.collection].replace_one(
+            {"_id": sid},
+            {"data": data, "user_id": user_id, "expires_at": expires_at},
+            upsert=True,
+        )
+
+    def delete(self, sid):
+        get_db()[self.collection].delete_one({"_id": sid})
+
+    def delete_user(self, user_id):
+        return get_db()[self.collection].delete_many(
+            {"user_id": user_id}).deleted_count
+
+
+class RedisSessionStore:
+    """
+    Stores sessions in a Redis-compatible server. Each user's session ids
+    are kept in a set so they can be revoked together.
+
+    Attributes:
+        url (str): Redis connection URL.
+        prefix (str): Prefix of every key written by the store.
+    """
+
+    name = "redis"
+
+    def __init__(self, url="redis://localhost:6379/0", prefix="budgetai:"):
+        if redis is None:
+            raise RuntimeError(
+                "The redis session backend requires the 'redis' package")
+        self.client = redis.Redis.from_url(url)
+        self.prefix = prefix
+
+    def load(self, sid):
+        data = self.client.get(f"{self.prefix}session:{sid}")
+        return data.decode("utf-8") if data is not None else None
+
+    def save(self, sid, data, user_id, expires_at):
+        ttl = max(int((expires_at - datetime.now(timezone.utc)).total_seconds()), 1)
+        pipeline = self.client.pipeline()
+        pipeline.set(f"{self.prefix}session:{sid}", data, ex=ttl)
+        if user_id is not None:
+            pipeline.sadd(f"{self.prefix}user_sessions:{user_id}", sid)
+            pipeline.expire(f"{self.prefix}user_sessions:{user_id}", ttl)
+        pipeline.execute()
+
+    def delete(self, sid):
+        self.client.delete(f"{self.prefix}session:{sid}")
+
+    def delete_user(self, user_id):
+        key = f"{self.prefix}user_sessions:{user_id}"
+        sids = self.client.smembers(key)
+        if sids:
+            self.client.delete(
+                *(f"{self.prefix}session:{sid.decode('utf-8')}" for sid in sids))
+        self.client.delete(key)
+        return len(sids)
+
+
+class ServerSideSession(CallbackDict, SessionMixin):
+    """
+    Session whose data is kept in a store, identified by sid.
+    """
+
+    def __init__(self, initial=None, sid=None):
+        def on_update(self):
+            self.modified = True
+
+        super().__init__(initial, on_update)
+        self.sid = sid
+        self.previous_sid = None
+        self.modified = False
+
+    def regenerate(self):
+        """
+        Moves the session to a new id, as done on login to prevent session
+        fixation. The old id is deleted when the session is saved.
+        """
+        if self.sid is not None:
+            self.previous_sid = self.sid
+        self.sid = None
+        self.modified = True
+
+
+class ServerSessionInterface(SessionInterface):
+    """
+    Flask session interface backed by a session store and an in-process LRU
+    cache of recently used sessions.
+
+    Attributes:
+        store: MongoSessionStore or RedisSessionStore.
+        max_cached (int): Sessions kept in the in-process cache.
+        cache_ttl (float): Seconds a cached session is trusted before it is
+            read from the store again. This bounds how long a session revoked
+            by another worker process stays usable here.
+    """
+
+    salt = "budgetai-session"
+
+    def __init__(self, store, max_cached=1024, cache_ttl=60):
+        self.store = store
+        self.max_cached = max_cached
+        self.cache_ttl = cache_ttl
+        self.hits = 0
+        self.misses = 0
+        self.revoked = 0
+        self._cache = OrderedDict()  # sid -> (cached until, data, user_id)
+        self._lock = threading.Lock()
+
+    def _signer(self, app):
+        return Signer(app.secret_key, salt=self.salt)
+
+    def _cache_get(self, sid):
+        with self._lock:
+            entry = self._cache.get(sid)
+            if entry is None or entry[0] < time.monotonic():
+                self._cache.pop(sid, None)
+                self.misses += 1
+                return None
+            self._cache.move_to_end(sid)
+            self.hits += 1
+            return entry[1]
+
+    def _cache_set(self, sid, data, user_id):
+        with self._lock:
+            self._cache[sid] = (time.monotonic() + self.cache_ttl, data, user_id)
+            self._cache.move_to_end(sid)
+            while len(self._cache) > self.max_cached:
+                self._cache.popitem(last=False)
+
+    def _cache_discard(self, sid):
+        with self._lock:
+            self._cache.pop(sid, None)
+
+    def load(self, sid):
+        """
+        Returns the data of a session, or None if it does not exist, has
+        expired or was revoked.
+        """
+        data = self._cache_get(sid)
+        if data is not None:
+            return data
+        serialized = self.store.load(sid)
+        if serialized is None:
+            return None
+        data = session_json_serializer.loads(serialized)
+        self._cache_set(sid, data, data.get("user", {}).get("_id"))
+        return data
+
+    def revoke(self, sid):
+        """
+        Deletes a single session.
+        """
+        self._cache_discard(sid)
+        self.store.delete(sid)
+
+    def revoke_user(self, user_id):
+        """
+        Deletes every session of a user.
+
+        Returns:
+            int: Number of sessions deleted.
+        """
+        with self._lock:
+            for sid in [sid for sid, entry in self._cache.items()
+                        if entry[2] == user_id]:
+                del self._cache[sid]
+        revoked = self.store.delete_user(user_id)
+        with self._lock:
+            self.revoked += revoked
+        return revoked
+
+    def open_session(self, app, request):
+        cookie = request.cookies.get(self.get_cookie_name(app))
+        if not cookie or not app.secret_key:
+            return ServerSideSession()
+        try:
+            sid = self._signer(app).unsign(cookie).decode("utf-8")
+        except BadSignature:
+            return ServerSideSession()
+        try:
+            data = self.load(sid)
+        except Exception as e:
+            logging.error(f"Session lookup failed: {str(e)}")
+            data = None
+        if data is None:
+            return ServerSideSession()
+        return ServerSideSession(data, sid=sid)
+
+    def save_session(self, app, session, response):
+        name = self.get_cookie_name(app)
+        domain = self.get_cookie_domain(app)
+        path = self.get_cookie_path(app)
+        secure = self.get_cookie_secure(app)
+        samesite = self.get_cookie_samesite(app)
+        httponly = self.get_cookie_httponly(app)
+
+        if session.previous_sid is not None:
+            self.revoke(session.previous_sid)
+        if not session.modified:
+            return
+        response.vary.add("Cookie")
+
+        if not session:
+            # Signed out: drop the stored session along with the cookie
+            if session.sid is not None:
+                self.revoke(session.sid)
+            response.delete_cookie(
+                name, domain=domain, path=path, secure=secure,
+                samesite=samesite, httponly=httponly)
+            return
+
+        if session.sid is None:
+            session.sid = secrets.token_urlsafe(32)
+        data = dict(session)
+        user_id = data.get("user", {}).get("_id")
+        self.store.save(
+            session.sid,
+            session_json_serializer.dumps(data),
+            user_id,
+            datetime.now(timezone.utc) + app.permanent_session_lifetime,
+        )
+        self._cache_set(session.sid, data, user_id)
+        response.set_cookie(
+            name,
+            self._signer(app).sign(session.sid).decode("utf-8"),
+            expires=self.get_expiration_time(app, session),
+            httponly=httponly, domain=domain, path=path, secure=secure,
+            samesite=samesite,
+        )
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            "backend": self.store.name,
+            "cached": len(self._cache),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": round(self.hits / lookups, 3) if lookups else None,
+            "revoked": self.revoked,
+        }
+
+
+def init_sessions(app):
+    """
+    Installs server-side sessions on the Flask app, using the backend named
+    by SESSION_BACKEND ("mongo", "redis" or "cookie" for Flask's signed
+    cookie sessions, which cannot be revoked).
+    """
+    app.config.setdefault(
+        "SESSION_BACKEND", os.getenv("SESSION_BACKEND", "mongo"))
+    app.config.setdefault(
+        "SESSION_REDIS_URL",
+        os.getenv("SESSION_REDIS_URL", "redis://localhost:6379/0"))
+    app.config.setdefault(
+        "SESSION_CACHE_MAX_ENTRIES",
+        int(os.getenv("SESSION_CACHE_MAX_ENTRIES", 1024)))
+    app.config.setdefault(
+        "SESSION_CACHE_TTL", float(os.getenv("SESSION_CACHE_TTL", 60)))
+
+    backend_name = app.config["SESSION_BACKEND"]
+    if backend_name == "cookie":
+        return None
+    if backend_name == "redis":
+        store = RedisSessionStore(app.config["SESSION_REDIS_URL"])
+    else:
+        store = MongoSessionStore()
+    app.session_interface = ServerSessionInterface(
+        store,
+        max_cached=app.config["SESSION_CACHE_MAX_ENTRIES"],
+        cache_ttl=app.config["SESSION_CACHE_TTL"],
+    )
+    return app.session_interface
+
+
+def revoke_user_sessions(user_id):
+    """
+    Deletes every session of a user. Does nothing with cookie sessions.
+
+    Returns:
+        int: Number of sessions deleted.
+    """
+    interface = current_app.session_interface
+    if not isinstance(interface, ServerSessionInterface):
+        return 0
+    return interface.revoke_user(user_id)
@@ -0,0 +1,183 @@
+"""
+Statistical summary of a user's transactions.
+
+The summary is computed locally with vectorized pandas operations and
+serialized as a compact JSON context for the LLM. It stays a few hundred
+tokens regardless of how many transactions the user has, unlike a raw
+transaction dump.
+"""
+import json
+
+import numpy as np
+import pandas as pd
+
+TOP_MERCHANTS = 10
+MAX_OUTLIERS = 10
+RECENT_MONTHS = 12
+
+# A description is a recurring charge when it appears in at least this many
+# distinct months, about once a month, with a stable amount
+RECURRING_MIN_MONTHS = 3
+RECURRING_MAX_PER_MONTH = 1.5
+RECURRING_MAX_VARIATION = 0.1
+
+# Transactions above Q3 + OUTLIER_IQR_FACTOR * IQR of their category are
+# outliers; categories with fewer transactions are not checked
+OUTLIER_IQR_FACTOR = 3
+OUTLIER_MIN_TRANSACTIONS = 5
+
+
+def _round(values):
+    return np.round(np.asarray(values, dtype="float64"), 2)
+
+
+def category_totals(df):
+    grouped = df.groupby("category", observed=True)["amount"]
+    totals = pd.DataFrame({
+        "total": grouped.sum(),
+        "count": grouped.size(),
+    })
+    totals["share"] = totals["total"] / totals["total"].sum()
+    totals = totals.sort_values("total", ascending=False)
+    return [
+        {"category": str(category), "total": total, "count": int(count),
+         "share": share}
+        for category, total, count, share in zip(
+            totals.index, _round(totals["total"]), totals["count"],
+            np.round(totals["share"], 3))
+    ]
+
+
+def monthly_totals(df):
+    """
+    Totals of the most recent months, with the change from the previous
+    month.
+    """
+    months = df["transaction_date"].dt.to_period("M")
+    totals = df.groupby(months)["amount"].sum().sort_index()
+    # Months without spending count as zero rather than being skipped
+    totals = totals.reindex(
+        pd.period_range(totals.index.min(), totals.index.max(), freq="M"),
+        fill_value=0.0,
+    )
+    change = totals.diff()
+    change_pct = change / totals.shift().replace(0, np.nan)
+    recent = slice(-RECENT_MONTHS, None)
+    return [
+        {
+            "month": str(month),
+            "total": total,
+            "change": None if np.isnan(delta) else delta,
+            "change_pct": None if np.isnan(pct) else pct,
+        }
+        for month, total, delta, pct in zip(
+            totals.index[recent], _round(totals.values[recent]),
+            _round(change.values[recent]),
+            np.round(change_pct.values[recent], 3))
+    ]
+
+
+def top_merchants(df):
+    grouped = df.groupby("description", observed=True)["amount"]
+    merchants = pd.DataFrame({"total": grouped.sum(), "count": grouped.size()})
+    merchants = merchants.nlargest(TOP_MERCHANTS, "total")
+    return [
+        {"merchant": str(merchant), "total": total, "count": int(count)}
+        for merchant, total, count in zip(
+            merchants.index, _round(merchants["total"]), merchants["count"])
+    ]
+
+
+def recurring_charges(df):
+    """
+    Charges from the same merchant that repeat about monthly with a stable
+    amount, such as subscriptions and bills.
+    """
+    months = df["transaction_date"].dt.to_period("M")
+    grouped = df.assign(month=months).groupby(
+        "description", observed=True)
+    stats = pd.DataFrame({
+        "months": grouped["month"].nunique(),
+        "count": grouped.size(),
+        "mean": grouped["amount"].mean(),
+        "std": grouped["amount"].std(ddof=0),
+        "median": grouped["amount"].median(),
+        "category": grouped["category"].first(),
+    })
+    recurring = stats[
+        (stats["months"] >= RECURRING_MIN_MONTHS)
+        & (stats["count"] <= stats["months"] * RECURRING_MAX_PER_MONTH)
+        & (stats["std"] <= stats["mean"].abs() * RECURRING_MAX_VARIATION)
+    ].sort_values("median", ascending=False)
+    return [
+        {"merchant": str(merchant), "category": str(category),
+         "amount": amount, "months": int(months)}
+        for merchant, category, amount, months in zip(
+            recurring.index, recurring["category"],
+            _round(recurring["median"]), recurring["months"])
+    ]
+
+
+def outliers(df):
+    """
+    Unusually large transactions relative to the rest of their category.
+    """
+    grouped = df.groupby("category", observed=True)["amount"]
+    q1 = grouped.transform("quantile", 0.25)
+    q3 = grouped.transform("quantile", 0.75)
+    size = grouped.transform("size")
+    flagged = df[
+        (size >= OUTLIER_MIN_TRANSACTIONS)
+        & (df["amount"] > q3 + OUTLIER_IQR_FACTOR * (q3 - q1))
+    ].nlargest(MAX_OUTLIERS, "amount")
+    return [
+        {"date": date.strftime("%Y-%m-%d"), "merchant": str(merchant),
+         "category": str(category), "amount": amount}
+        for date, merchant, category, amount in zip(
+            flagged["transaction_date"], flagged["description"],
+            flagged["category"], _round(flagged["amount"]))
+    ]
+
+
+def summarize_transactions(df):
+    """
+    Computes the statistical summary of a transactions DataFrame, as built
+    by utils.insights.build_transactions_frame.
+
+    Parameters:
+        df (DataFrame): Columns transaction_date, description, category and
+            amount (positive for spending).
+
+    Returns:
+        dict: Overall totals, per-category totals, recent monthly totals
+        with month-over-month changes, top merchants, recurring charges and
+        outliers. Empty when there are no dated transactions.
+    """
+    df = df.dropna(subset=["transaction_date", "amount"])
+    if df.empty:
+        return {}
+    # Sums are accumulated in double precision even for float32 frames
+    df = df.assign(amount=df["amount"].astype("float64"))
+    return {
+        "transactions": len(df),
+        "first_date": df["transaction_date"].min().strftime("%Y-%m-%d"),
+        "last_date": df["transaction_date"].max().strftime("%Y-%m-%d"),
+        "total": round(float(df["amount"].sum()), 2),
+        "categories": category_totals(df),
+        "monthly": monthly_totals(df),
+        "top_merchants": top_merchants(df),
+        "recurring": recurring_charges(df),
+        "outliers": outliers(df),
+    }
+
+
+def summary_context(summary):
+    """
+    Serializes a summary as compact JSON for an LLM prompt.
+    """
+    def default(value):
+        if isinstance(value, np.generic):
+            return value.item()
+        raise TypeError(f"Cannot serialize {type(value).__name__}")
+
+    return json.dumps(summary, separators=(",", ":"), default=default)
@@ -1,19 +1,157 @@
-import csv
+import hashlib
+import io
 import logging
-import uuid
-from datetime import datetime
+import time
+from collections import Counter
 
+import numpy as np
+import pandas as pd
 from flask import session
+from pymongo import UpdateOne
+from pymongo.errors import BulkWriteError
+from werkzeug.sansio.multipart import (
+    Data,
+    Epilogue,
+    File,
+    MultipartDecoder,
+    NeedData,
+)
 
-from database.db import get_budgetai_db
+from database.db import get_db
+from database.rollups import apply_transactions
+from utils.cache import bump_data_version
+from utils.metrics import INGEST_ROWS, INGEST_STAGE_DURATION
+from utils.parsers import detect_format, normalize_column
 
+DEFAULT_BATCH_SIZE = 10000
+MAX_REPORTED_REJECTIONS = 100
+FINGERPRINT_SEPARATOR = "\x1f"
+MULTIPART_CHUNK_SIZE = 64 * 1024
+# Write error raised when two upserts of the same _id race each other
+DUPLICATE_KEY_ERROR = 11000
+# Stands in for a row with more fields than the header, so that it keeps its
+# line in the chunk and is reported as rejected
+MALFORMED_ROW = "\x00malformed"
 
-class Upload:
-    def __init__(self):
-        self.db, self.client = get_budgetai_db()
 
-    def __del__(self):
-        self.client.close()
+def read_chunks(stream, batch_size=DEFAULT_BATCH_SIZE):
+    """
+    Reads CSV data in chunks of raw string columns. A row with more fields
+    than the header is replaced by a row whose first column is
+    MALFORMED_ROW, instead of failing the whole upload.
+
+    The fast C parser cannot report such rows, so it is used until it meets
+    one; the stream is then read again with the python parser, skipping the
+    rows already returned.
+
+    Parameters:
+        stream: Binary file-like object holding the CSV data.
+        batch_size (int): Number of rows per chunk.
+
+    Yields:
+        DataFrame: The next chunk, indexed by row number.
+    """
+    options = {
+        "chunksize": batch_size,
+        "dtype": str,
+        "keep_default_na": False,
+        "encoding": "utf-8-sig",
+    }
+    start = stream.tell()
+    rows = 0
+    try:
+        for chunk in pd.read_csv(stream, **options):
+            rows += len(chunk)
+            yield chunk
+        return
+    except pd.errors.ParserError:
+        if not stream.seekable():
+            raise
+
+    stream.seek(start)
+    chunks = pd.read_csv(
+        stream,
+        engine="python",
+        on_bad_lines=lambda fields: [MALFORMED_ROW],
+        **options,
+    )
+    for chunk in chunks:
+        chunk = chunk[chunk.index >= rows]
+        if len(chunk):
+            yield chunk
+
+
+class MultipartFileStream(io.RawIOBase):
+    """
+    Readable stream of one file field of a multipart/form-data body. The
+    body is decoded as it is read, so the upload is not parsed and spooled
+    as a whole before processing starts.
+
+    Attributes:
+        filename (str): Name of the uploaded file, set by open().
+    """
+
+    def __init__(self, stream, boundary, field="file",
+                 chunk_size=MULTIPART_CHUNK_SIZE):
+        super().__init__()
+        self.stream = stream
+        self.field = field
+        self.chunk_size = chunk_size
+        self.filename = None
+        self._decoder = MultipartDecoder(boundary.encode("latin-1"))
+        self._received_all = False
+        self._in_file = False
+        self._buffer = bytearray()
+
+    def _next_event(self):
+        while True:
+            event = self._decoder.next_event()
+            if not isinstance(event, NeedData):
+                return event
+            if self._received_all:
+                raise ValueError("Malformed multipart body")
+            chunk = self.stream.read(self.chunk_size)
+            if not chunk:
+                self._received_all = True
+            self._decoder.receive_data(chunk or None)
+
+    def open(self):
+        """
+        Reads up to the start of the file field.
+
+        Returns:
+            bool: False if the body has no such field.
+
+        Raises:
+            ValueError: If the body is not valid multipart data.
+        """
+        while True:
+            event = self._next_event()
+            if isinstance(event, File) and event.name == self.field:
+                self.filename = event.filename
+                self._in_file = True
+                return True
+            if isinstance(event, Epilogue):
+                return False
+
+    def readable(self):
+        return True
+
+    def readinto(self, buffer):
+        while not self._buffer and self._in_file:
+            event = self._next_event()
+            if isinstance(event, Data):
+                self._buffer += event.data
+                self._in_file = event.more_data
+        size = min(len(buffer), len(self._buffer))
+        buffer[:size] = self._buffer[:size]
+        del self._buffer[:size]
+        return size
+
+
+class Upload:
+    def __init__(self, db=None):
+        self.db = db if db is not None else get_db()
 
     class Transaction:
         """
@@ -30,7 +168,7 @@ class Upload:
             Parameters:
                 _id (str): Transaction's unique identifier.
                 user_id (str): ID of the user associated with the transaction.
-                transaction_date (str): Date of the transaction.
+                transaction_date (datetime): Date of the transaction.
                 description (str): Description of the transaction.
                 category (str): Category of the transaction.
                 amount (float): Amount of the transaction.
@@ -38,100 +176,272 @@ class Upload:
             self._id = _id
             self.user_id = user_id
             self.transaction_date = transaction_date
+            # Precomputed keys for monthly grouping
+            self.year = transaction_date.year
+            self.month = transaction_date.month
             self.description = description
             self.category = category
             self.amount = amount
 
     def create_transactions(self, transactions):
         """
-        Creates multiple transactions in the database.
+        Creates multiple transactions in the database, see
+        write_transactions.
 
         Parameters:
             transactions (list): A list of Transaction instances to insert.
+
+        Returns:
+            int: The number of new transactions inserted.
+        """
+        return self.write_transactions(transactions)["inserted"]
+
+    def write_transactions(self, transactions):
         """
-        # Implement the actual bulk database insertion logic here
+        Writes transactions to the database with a single unordered bulk
+        upsert. Transactions are keyed by their content fingerprint, so
+        rows that were already imported are left untouched. The inserted
+        transactions are then added to the monthly_totals rollup.
+
+        Parameters:
+            transactions (list): A list of Transaction instances to insert.
+
+        Returns:
+            dict: Numbers of transactions "inserted", found to be
+            "duplicates" of stored ones, and "failed" to be written.
+        """
+        failed = 0
         try:
-            transaction_data = [
-                transaction.__dict__ for transaction in transactions
-            ]  # Convert to dict
-            self.db["transactions"].insert_many(
-                transaction_data
-            )  # Example of bulk insert using pymongo
+            operations = [
+                UpdateOne(
+                    {"_id": transaction._id},
+                    {"$setOnInsert": transaction.__dict__},
+                    upsert=True,
+                )
+                for transaction in transactions
+            ]
+            result = self.db["transactions"].bulk_write(
+                operations, ordered=False)
+            inserted = list(result.upserted_ids)
+        except BulkWriteError as e:
+            logging.error(
+                f"Error inserting transactions into database: {str(e)}")
+            inserted = [
+                upserted["index"] for upserted in e.details.get("upserted", [])]
+            # A duplicate key error is a concurrent insert of the same
+            # transaction; anything else means the row was not stored
+            failed = sum(
+                1 for error in e.details.get("writeErrors", [])
+                if error.get("code") != DUPLICATE_KEY_ERROR)
         except Exception as e:
             logging.error(
                 f"Error inserting transactions into database: {str(e)}")
+            return {"inserted": 0, "duplicates": 0, "failed": len(transactions)}
 
-    def process_tuple(self, row, user_id):
+        # Only transactions that were actually inserted count towards the
+        # monthly totals; duplicates were already counted
+        try:
+            apply_transactions(
+                self.db, [transactions[index].__dict__ for index in inserted])
+        except Exception as e:
+            logging.error(
+                f"Error updating monthly totals, run 'python -m database.rollups rebuild': {str(e)}")
+
+        # Bumped once the rollup is written, so that a response computed
+        # from the old totals is never cached under the new version
+        if inserted:
+            bump_data_version(self.db, transactions[0].user_id)
+        return {
+            "inserted": len(inserted),
+            "duplicates": len(transactions) - len(inserted) - failed,
+            "failed": failed,
+        }
+
+    def build_transactions(self, parsed, user_id, occurrences):
         """
-        Processes a valid row into a Transaction instance.
+        Builds Transaction instances from a parsed chunk, assigning each a
+        content-derived ID.
 
         Parameters:
-            row (dict): The row data from the CSV.
-            user_id (str): The ID of the user associated with the transaction.
+            parsed (DataFrame): Accepted rows from a bank format parser.
+            user_id (str): The ID of the user associated with the transactions.
+            occurrences (Counter): Running count of identical transactions
+                seen in earlier chunks of the same file.
 
         Returns:
-            Transaction: An instance of Transaction, or None if creation fails.
+            list: Transaction instances.
         """
-        try:
-            transaction_date = row["Transaction Date"]
-            description = row["Description"]
-            category = row["Category"]
-            type = row["Type"]
-            amount = float(row["Amount"]) * -1
-
-            # Validate transaction date format
-            try:
-                datetime.strptime(transaction_date, "%m/%d/%Y")
-            except ValueError:
-                logging.error(
-                    f"Invalid date format for transaction_date: '{transaction_date}' in row: {row}. Expected format: MM/DD/YYYY."
-                )
-                return None  # Return None for invalid date formats
+        if parsed.empty:
+            return []
 
-            # Check if the transaction type is 'Sale'
-            if type != "Sale":
-                logging.error(
-                    f"Invalid transaction type: '{type}' for row: {row}. Only 'Sale' transactions are accepted."
-                )
-                return None
-
-            # Create a Transaction instance
-            transaction = self.Transaction(
-                _id=uuid.uuid4().hex,  # Generate unique transaction ID
-                user_id=user_id,
-                transaction_date=transaction_date,
-                description=description,
-                category=category,
-                amount=amount,
+        # Identical purchases on the same day are told apart by their
+        # position among the file's identical rows
+        dates = parsed["transaction_date"].to_numpy()
+        contents = (
+            user_id + FINGERPRINT_SEPARATOR
+            + pd.Series(
+                np.datetime_as_string(dates, unit="D"), index=parsed.index)
+            + FINGERPRINT_SEPARATOR + parsed["description"]
+            + FINGERPRINT_SEPARATOR + parsed["amount"].map("{:.2f}".format)
+        )
+        offsets = contents.groupby(contents, sort=False).cumcount()
+
+        seen = occurrences.get
+        transactions = [
+            self.Transaction(
+                content_fingerprint(content, seen(content, 0) + offset),
+                user_id,
+                transaction_date,
+                description,
+                category,
+                amount,
             )
-            return transaction
-        except Exception as e:
-            logging.error(
-                f"Error processing row into transaction: {row}, Error: {str(e)}"
+            for content, offset, transaction_date, description, category, amount in zip(
+                contents.tolist(),
+                offsets.tolist(),
+                pd.DatetimeIndex(dates).to_pydatetime().tolist(),
+                parsed["description"].tolist(),
+                parsed["category"].tolist(),
+                parsed["amount"].tolist(),
             )
-            return None  # Return None if there was an error
+        ]
+        occurrences.update(contents.value_counts().to_dict())
+        return transactions
+
+    def process_stream(
+            self, stream, user_id, batch_size=DEFAULT_BATCH_SIZE, progress=None):
+        """
+        Parses a CSV byte stream and inserts its transactions in fixed-size
+        batches, so memory stays bounded regardless of file size. The bank
+        format is detected from the header and each batch is parsed as a
+        whole with vectorized pandas operations.
+
+        Parameters:
+            stream: Binary file-like object holding the CSV data.
+            user_id (str): The ID of the user associated with the transactions.
+            batch_size (int): Number of transactions per bulk insert.
+            progress (callable): Optional callback invoked with the running
+                summary after each batch is written.
+
+        Returns:
+            dict: Detected format, inserted, duplicate, failed and rejected
+            counts, per-batch counts and a sample of rejected rows with the
+            reason each was rejected.
+
+        Raises:
+            UnsupportedFormatError: If the header matches no known format.
+        """
+        summary = {
+            "format": None,
+            "inserted": 0,
+            "duplicates": 0,
+            "failed": 0,
+            "rejected": 0,
+            "batches": [],
+            "rejected_rows": [],
+        }
+        chunks = read_chunks(stream, batch_size)
+        occurrences = Counter()
+        parser = None
+        read_started = time.perf_counter()
+        for chunk in chunks:
+            INGEST_STAGE_DURATION.observe(
+                time.perf_counter() - read_started, stage="read")
+            chunk.columns = [normalize_column(column) for column in chunk.columns]
+            chunk = chunk.fillna("")  # Short rows
+            if parser is None:
+                # The bank format is sniffed once, from the header
+                parser = detect_format(chunk.columns)
+                summary["format"] = parser.name
+
+            parse_started = time.perf_counter()
+            malformed = chunk.iloc[:, 0] == MALFORMED_ROW
+            parsed, reasons = parser.parse(chunk[~malformed])
+            if malformed.any():
+                reasons = pd.concat([
+                    reasons,
+                    pd.Series("Too many fields.", index=chunk.index[malformed]),
+                ]).sort_index()
+            transactions = self.build_transactions(
+                parsed, user_id, occurrences)
+            INGEST_STAGE_DURATION.observe(
+                time.perf_counter() - parse_started, stage="parse")
+
+            for index, reason in reasons.items():
+                if len(summary["rejected_rows"]) >= MAX_REPORTED_REJECTIONS:
+                    break
+                # Line 1 is the header row
+                summary["rejected_rows"].append(
+                    {"line": int(index) + 2, "reason": reason})
+
+            write_started = time.perf_counter()
+            written = (
+                self.write_transactions(transactions) if transactions
+                else {"inserted": 0, "duplicates": 0, "failed": 0}
+            )
+            INGEST_STAGE_DURATION.observe(
+                time.perf_counter() - write_started, stage="write")
+            rejected = len(reasons)
+            INGEST_ROWS.inc(written["inserted"], outcome="inserted")
+            INGEST_ROWS.inc(written["duplicates"], outcome="duplicate")
+            INGEST_ROWS.inc(written["failed"], outcome="failed")
+            INGEST_ROWS.inc(rejected, outcome="rejected")
+            for name, count in written.items():
+                summary[name] += count
+            summary["rejected"] += rejected
+            summary["batches"].append({**written, "rejected": rejected})
+            if progress is not None:
+                progress(summary)
+            read_started = time.perf_counter()
+
+        return summary
 
     def process_csv(self, file_path):
         """
-        Processes the uploaded CSV file and creates transactions.
+        Processes the CSV file at the given path and creates transactions.
 
         Parameters:
             file_path (str): The path to the CSV file.
+
+        Returns:
+            dict: Summary of the import, see process_stream.
         """
         user_id = session["user"]["_id"]  # Get user ID from session
-        transactions = []  # To accumulate transactions for bulk insert
-
-        with open(file_path, "r") as f:
-            # Use DictReader for easier handling
-            csv_reader = csv.DictReader(f)
-
-            for row in csv_reader:
-                # Process the valid row into a Transaction
-                transaction = self.process_tuple(row, user_id)
-                if transaction:  # Only add if transaction creation was successful
-                    # Accumulate the transaction
-                    transactions.append(transaction)
-
-        # Prepare to bulk insert transactions into the database
-        if transactions:
-            self.create_transactions(transactions)  # Bulk insert transactions
+        with open(file_path, "rb") as f:
+            return self.process_stream(f, user_id)
+
+
+def transaction_content(user_id, transaction_date, description, amount):
+    """
+    Joins the fields identifying a transaction, as build_transactions does
+    for a parsed chunk.
+
+    Parameters:
+        user_id (str): ID of the user associated with the transaction.
+        transaction_date (datetime): Date of the transaction.
+        description (str): Description of the transaction.
+        amount (float): Amount of the transaction.
+
+    Returns:
+        str: The content passed to content_fingerprint.
+    """
+    return FINGERPRINT_SEPARATOR.join([
+        user_id,
+        transaction_date.strftime("%Y-%m-%d"),
+        description,
+        f"{amount:.2f}",
+    ])
+
+
+def content_fingerprint(content, occurrence):
+    """
+    Derives the _id of a transaction from its content and its index among
+    identical transactions in the file.
+
+    Returns:
+        str: A 32 character hex digest.
+    """
+    return hashlib.blake2b(
+        f"{content}{FINGERPRINT_SEPARATOR}{occurrence}".encode("utf-8"),
+        digest_size=16,
+    ).hexdigest()
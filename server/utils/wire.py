@@ -0,0 +1,159 @@
+"""
+Compact wire formats for transaction lists.
+
+By default a page of transactions is a JSON array of row objects, which
+repeats every key in every row. The columnar formats send each field once
+with its values as a list, dictionary-encode categories and drop user_id,
+which is always the caller's:
+
+    columns:  JSON, {"length": n, "columns": {field: [values]}} with dates
+              as ISO 8601 strings and category as
+              {"dictionary": [names], "indices": [positions]}
+    msgpack:  The same document as MessagePack (needs the msgpack package)
+    arrow:    An Arrow IPC stream holding one record batch with timestamp
+              dates and a dictionary-encoded category column (needs pyarrow)
+"""
+import json
+from datetime import datetime
+
+try:
+    import msgpack
+except ImportError:  # Optional dependency, only needed for msgpack responses
+    msgpack = None
+
+try:
+    import pyarrow
+except ImportError:  # Optional dependency, only needed for arrow responses
+    pyarrow = None
+
+COLUMNS_MIMETYPE = "application/vnd.budgetai.columns+json"
+MSGPACK_MIMETYPE = "application/msgpack"
+ARROW_MIMETYPE = "application/vnd.apache.arrow.stream"
+
+# Low-cardinality fields sent as a dictionary and indices into it
+DICTIONARY_FIELDS = ("category",)
+
+# Fields left out of columnar formats
+OMITTED_FIELDS = ("user_id",)
+
+
+def to_columns(transactions):
+    """
+    Pivots transaction documents into lists of values by field, in order of
+    first appearance. Fields missing from a document get None.
+    """
+    # Documents of one query nearly always share a single key layout
+    layouts = dict.fromkeys(tuple(transaction) for transaction in transactions)
+    names = [
+        name
+        for name in dict.fromkeys(name for layout in layouts for name in layout)
+        if name not in OMITTED_FIELDS
+    ]
+    return {
+        name: [transaction.get(name) for transaction in transactions]
+        for name in names
+    }
+
+
+def is_datetime_column(values):
+    first = next((value for value in values if value is not None), None)
+    return isinstance(first, datetime)
+
+
+def dictionary_encode(values):
+    """
+    Returns the distinct values, in order of first appearance, and the
+    position of every value among them.
+    """
+    dictionary = []
+    positions = {}
+    indices = []
+    for value in values:
+        index = positions.get(value)
+        if index is None:
+            index = positions[value] = len(dictionary)
+            dictionary.append(value)
+        indices.append(index)
+    return {"dictionary": dictionary, "indices": indices}
+
+
+def columns_document(transactions):
+    """
+    Builds the columnar document shared by the columns and msgpack formats.
+    """
+    columns = to_columns(transactions)
+    for name, values in columns.items():
+        if name in DICTIONARY_FIELDS:
+            columns[name] = dictionary_encode(values)
+        elif is_datetime_column(values):
+            columns[name] = [
+                value.isoformat() if isinstance(value, datetime) else value
+                for value in values
+            ]
+    return {"length": len(transactions), "columns": columns}
+
+
+def encode_columns(transactions):
+    return json.dumps(
+        columns_document(transactions), separators=(",", ":")).encode("utf-8")
+
+
+def encode_msgpack(transactions):
+    return msgpack.packb(columns_document(transactions))
+
+
+def encode_arrow(transactions):
+    arrays = {}
+    for name, values in to_columns(transactions).items():
+        if name in DICTIONARY_FIELDS:
+            arrays[name] = pyarrow.array(values, pyarrow.string()).dictionary_encode()
+        elif is_datetime_column(values):
+            arrays[name] = pyarrow.array(values, pyarrow.timestamp("ms"))
+        else:
+            arrays[name] = pyarrow.array(values)
+    table = pyarrow.table(arrays)
+    sink = pyarrow.BufferOutputStream()
+    with pyarrow.ipc.new_stream(sink, table.schema) as writer:
+        writer.write_table(table)
+    return sink.getvalue().to_pybytes()
+
+
+# name -> (mimetype, encoder, missing optional package or None). The default
+# "json" format is the row array built by jsonify.
+WIRE_FORMATS = {
+    "json": ("application/json", None, None),
+    "columns": (COLUMNS_MIMETYPE, encode_columns, None),
+    "msgpack": (MSGPACK_MIMETYPE, encode_msgpack,
+                "msgpack" if msgpack is None else None),
+    "arrow": (ARROW_MIMETYPE, encode_arrow,
+              "pyarrow" if pyarrow is None else None),
+}
+
+
+def negotiate_format(requested, accept_mimetypes):
+    """
+    Picks the wire format of a transaction list from an explicit format
+    parameter or, failing that, the Accept header. Clients that accept
+    anything get the default JSON rows.
+
+    Parameters:
+        requested (str): Value of the format parameter, or None.
+        accept_mimetypes: The request's parsed Accept header.
+
+    Returns:
+        tuple: (format name, error message, status code)
+    """
+    if requested:
+        name = str(requested)
+        if name not in WIRE_FORMATS:
+            return None, f"Unknown format: {name}", 400
+    else:
+        by_mimetype = {
+            mimetype: name for name, (mimetype, _, _) in WIRE_FORMATS.items()}
+        best = accept_mimetypes.best_match(list(by_mimetype))
+        name = by_mimetype.get(best, "json")
+
+    missing = WIRE_FORMATS[name][2]
+    if missing is not None:
+        return None, f"The {name} format requires the '{missing}' package", 406
+    return name, None, 200